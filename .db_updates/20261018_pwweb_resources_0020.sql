@@ -0,0 +1,6 @@
+BEGIN;
+--
+-- Add field item_price_built_at to rawdata
+--
+ALTER TABLE "resrc_raw_data" ADD COLUMN "item_price_built_at" timestamp with time zone NULL;
+COMMIT;
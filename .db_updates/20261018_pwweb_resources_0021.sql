@@ -0,0 +1,10 @@
+BEGIN;
+--
+-- Raw SQL operation
+--
+DELETE FROM "resrc_items" a USING "resrc_items" b WHERE a."domain" = b."domain" AND a."sku" = b."sku" AND a."id" > b."id";
+--
+-- Create constraint resrc_items_domain_sku_uniq on model item
+--
+ALTER TABLE "resrc_items" ADD CONSTRAINT "resrc_items_domain_sku_uniq" UNIQUE ("domain", "sku");
+COMMIT;
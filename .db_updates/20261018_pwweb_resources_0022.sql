@@ -0,0 +1,29 @@
+BEGIN;
+--
+-- Add field kind to rawdata
+--
+ALTER TABLE "resrc_raw_data" ADD COLUMN "kind" smallint NULL;
+--
+-- Add field parent_sku to rawdata
+--
+ALTER TABLE "resrc_raw_data" ADD COLUMN "parent_sku" varchar(32) NULL;
+--
+-- Raw SQL operation
+--
+UPDATE "resrc_raw_data" SET "kind" = 1, "parent_sku" = LEFT("data"->>'parent_asin', 32) WHERE "domain" IN ('amazon.com', 'amazon.ca');
+UPDATE "resrc_raw_data" SET "kind" = 1, "parent_sku" = LEFT("data"->'item'->'product'->'buyBox'->>'primaryUsItemId', 32) WHERE "domain" = 'walmart.com';
+UPDATE "resrc_raw_data" SET "kind" = 1, "parent_sku" = LEFT((regexp_match("url", '^(https?://www.walmart.ca)?/(en|fr)/([^/]+/[^/]+|ip)/([A-Z0-9]{8,15})(/.*$)?'))[4], 32) WHERE "domain" = 'walmart.ca' AND "url" ~ '^(https?://www.walmart.ca)?/(en|fr)/([^/]+/[^/]+|ip)/([A-Z0-9]{8,15})(/.*$)?';
+UPDATE "resrc_raw_data" SET "kind" = 2, "parent_sku" = LEFT(NULLIF(split_part("url", '#', 2), ''), 32) WHERE "domain" = 'walmart.ca' AND "kind" IS NULL AND ("url" LIKE 'https://www.walmart.ca/api/product-page/price-offer%' OR "url" LIKE 'https://www.walmart.ca/api/product-page/v2/price-offer%');
+UPDATE "resrc_raw_data" SET "kind" = 3, "parent_sku" = LEFT(NULLIF(split_part("url", '#', 2), ''), 32) WHERE "domain" = 'walmart.ca' AND "kind" IS NULL AND "url" LIKE 'https://www.walmart.ca/api/product-page/find-in-store%';
+UPDATE "resrc_raw_data" SET "kind" = 1, "parent_sku" = LEFT(UPPER(COALESCE("data"->'SkuSelectors'->>'pCode', (regexp_match("url", '^(https?://www.canadiantire.ca)?/(en|fr)/([^/]+/[^/]+|pdp)/([\w-]*)([0-9]{7,12})p*.html[.*$]?'))[5] || 'P')), 32) WHERE "domain" = 'canadiantire.ca' AND "url" ~ '^(https?://www.canadiantire.ca)?/(en|fr)/([^/]+/[^/]+|pdp)/([\w-]*)([0-9]{7,12})p*.html[.*$]?';
+UPDATE "resrc_raw_data" SET "kind" = 2, "parent_sku" = LEFT(UPPER(NULLIF(split_part("url", '#', 2), '')), 32) WHERE "domain" = 'canadiantire.ca' AND "kind" IS NULL AND "url" LIKE 'https://www.canadiantire.ca/ESB/PriceAvailability%';
+UPDATE "resrc_raw_data" SET "kind" = 3, "parent_sku" = LEFT(UPPER(NULLIF(split_part("url", '#', 2), '')), 32) WHERE "domain" = 'canadiantire.ca' AND "kind" IS NULL AND "url" LIKE 'https://api-triangle.canadiantire.ca/dss/services/v4/stores%';
+--
+-- Create index resrc_raw_data_job_kind_idx on field(s) job_id, domain, kind of model rawdata
+--
+CREATE INDEX "resrc_raw_data_job_kind_idx" ON "resrc_raw_data" ("job_id", "domain", "kind");
+--
+-- Create index resrc_raw_data_job_group_idx on field(s) job_id, domain, parent_sku of model rawdata
+--
+CREATE INDEX "resrc_raw_data_job_group_idx" ON "resrc_raw_data" ("job_id", "domain", "parent_sku");
+COMMIT;
@@ -0,0 +1,53 @@
+BEGIN;
+--
+-- Raw SQL operation
+--
+ALTER TABLE "resrc_raw_data" RENAME TO "resrc_raw_data_legacy";
+ALTER INDEX "resrc_raw_data_pkey" RENAME TO "resrc_raw_data_legacy_pkey";
+CREATE UNIQUE INDEX "resrc_raw_data_legacy_id_created_at_uniq" ON "resrc_raw_data_legacy" ("id", "created_at");
+ALTER TABLE "resrc_raw_data_legacy" DROP CONSTRAINT "resrc_raw_data_legacy_pkey", ADD CONSTRAINT "resrc_raw_data_legacy_pkey" PRIMARY KEY USING INDEX "resrc_raw_data_legacy_id_created_at_uniq";
+CREATE TABLE "resrc_raw_data" (
+        "id" integer NOT NULL,
+        "url" text NOT NULL,
+        "domain" varchar(32) NOT NULL,
+        "http_status" smallint NULL,
+        "data" jsonb NULL,
+        "meta_data" jsonb NULL,
+        "job_id" varchar(64) NULL,
+        "kind" smallint NULL,
+        "parent_sku" varchar(32) NULL,
+        "created_at" timestamp with time zone NOT NULL,
+        "item_price_built_at" timestamp with time zone NULL,
+        CONSTRAINT "resrc_raw_data_pkey" PRIMARY KEY ("id", "created_at")
+    ) PARTITION BY RANGE ("created_at");
+DO $$
+    DECLARE
+        next_id integer;
+        seq text := pg_get_serial_sequence('resrc_raw_data_legacy', 'id');
+    BEGIN
+        SELECT COALESCE(MAX("id"), 0) + 1 INTO next_id FROM "resrc_raw_data_legacy";
+        ALTER TABLE "resrc_raw_data_legacy" ALTER COLUMN "id" DROP IDENTITY IF EXISTS;
+        ALTER TABLE "resrc_raw_data_legacy" ALTER COLUMN "id" DROP DEFAULT;
+        IF seq IS NOT NULL THEN
+            EXECUTE format('DROP SEQUENCE IF EXISTS %s', seq);
+        END IF;
+        CREATE SEQUENCE "resrc_raw_data_id_seq" AS integer OWNED BY "resrc_raw_data"."id";
+        PERFORM setval('resrc_raw_data_id_seq', next_id, false);
+        ALTER TABLE "resrc_raw_data" ALTER COLUMN "id" SET DEFAULT nextval('resrc_raw_data_id_seq');
+    END $$;
+DO $$
+    DECLARE
+        idx record;
+    BEGIN
+        FOR idx IN SELECT "indexname", "indexdef" FROM pg_indexes WHERE "tablename" = 'resrc_raw_data_legacy' AND "indexname" <> 'resrc_raw_data_legacy_pkey' LOOP
+            EXECUTE format('ALTER INDEX %I RENAME TO %I', idx.indexname, left(idx.indexname, 56) || '_legacy');
+            EXECUTE regexp_replace(idx.indexdef, ' ON (\S+\.)?resrc_raw_data_legacy ', ' ON "resrc_raw_data" ');
+        END LOOP;
+    END $$;
+DO $$
+    BEGIN
+        EXECUTE format('ALTER TABLE "resrc_raw_data" ATTACH PARTITION "resrc_raw_data_legacy" FOR VALUES FROM (MINVALUE) TO (%L)',
+            (date_trunc('month', now() AT TIME ZONE 'UTC') + interval '1 month') AT TIME ZONE 'UTC');
+    END $$;
+CREATE TABLE "resrc_raw_data_default" PARTITION OF "resrc_raw_data" DEFAULT;
+COMMIT;
@@ -0,0 +1,187 @@
+""" pwbot.extensions
+"""
+
+import weakref
+import logging
+from twisted.internet import task
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from pwbot import utils, throttle
+from pwbot.parsers import fieldstats
+
+
+class ParserFieldStats(object):
+    """ per field extraction stats of the store parsers (pwbot.parsers.fieldstats)
+        in the crawler stats, under parser/<domain>/<field>/...
+
+        enabled at spider_opened by PARSER_FIELD_STATS_ENABLED, or at any time
+        by fieldstats.enable() (telnet console). written at spider_closed.
+        not enabled with PARSER_POOL_ENABLED - the pages are parsed in the
+        worker processes, out of reach of the wrappers.
+    """
+
+    def __init__(self, crawler):
+        self.logger = logging.getLogger(utils.class_fullname(self))
+        self.crawler = crawler
+        self.enabled = crawler.settings.getbool('PARSER_FIELD_STATS_ENABLED')
+        if self.enabled and crawler.settings.getbool('PARSER_POOL_ENABLED'):
+            self.logger.warning("PARSER_FIELD_STATS_ENABLED ignored - pages parsed in the worker pool (PARSER_POOL_ENABLED) are not counted")
+            self.enabled = False
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        ext = cls(crawler)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        if self.enabled:
+            fieldstats.enable()
+
+    def spider_closed(self, spider):
+        if not fieldstats.is_enabled():
+            return
+        for key, value in fieldstats.disable().items():
+            self.crawler.stats.set_value(key, value)
+
+
+class AdaptiveConcurrency(object):
+    """ per domain concurrency and download delay, adjusted every
+        ADAPTIVE_CONCURRENCY_INTERVAL seconds by the AIMD rules of
+        pwbot.throttle.AimdController, on the latest responses of the
+        downloader slot (the host): latency percentiles, error rate (download
+        errors, 5xx) and ban rate (BAN_HTTP_CODES, BAN_CAPTCHA_MARKERS - also
+        the pages pwbot.middlewares.BanRetryMiddleware retried or quarantined).
+
+        bounds: ADAPTIVE_CONCURRENCY_MIN/MAX..., per domain overrides in
+        ADAPTIVE_CONCURRENCY_DOMAINS. decisions go to the crawler stats under
+        pwbot/throttle/<slot>/... cached responses are not counted.
+    """
+
+    def __init__(self, crawler):
+        self.logger = logging.getLogger(utils.class_fullname(self))
+        self.crawler = crawler
+        settings = crawler.settings
+        self.interval = settings.getfloat('ADAPTIVE_CONCURRENCY_INTERVAL', 10.0)
+        self.min_samples = settings.getint('ADAPTIVE_CONCURRENCY_MIN_SAMPLES', 20)
+        self.window_size = settings.getint('ADAPTIVE_CONCURRENCY_WINDOW', 200)
+        self.ban_http_codes = [int(c) for c in settings.getlist('BAN_HTTP_CODES')]
+        self.ban_markers = settings.getdict('BAN_CAPTCHA_MARKERS')
+        self.ban_max_size = settings.getint('BAN_MAX_PAGE_SIZE')
+        defaults = {
+            'min_concurrency': settings.getint('ADAPTIVE_CONCURRENCY_MIN', 1),
+            'max_concurrency': settings.getint('ADAPTIVE_CONCURRENCY_MAX') or settings.getint('CONCURRENT_REQUESTS_PER_DOMAIN'),
+            'min_delay': settings.getfloat('ADAPTIVE_CONCURRENCY_MIN_DELAY', 0.0),
+            'max_delay': settings.getfloat('ADAPTIVE_CONCURRENCY_MAX_DELAY', 30.0),
+            'target_latency': settings.getfloat('ADAPTIVE_CONCURRENCY_TARGET_LATENCY', 10.0),
+            'max_error_rate': settings.getfloat('ADAPTIVE_CONCURRENCY_MAX_ERROR_RATE', 0.1),
+            'max_ban_rate': settings.getfloat('ADAPTIVE_CONCURRENCY_MAX_BAN_RATE', 0.02),
+        }
+        self.default_controller = throttle.AimdController(**defaults)
+        self.controllers = {domain: throttle.AimdController(**dict(defaults, **overrides))
+                                for domain, overrides in settings.getdict('ADAPTIVE_CONCURRENCY_DOMAINS').items()}
+        self.windows = {}
+        self._slots = {}
+        self._downloaded = weakref.WeakSet()
+        self._pending = weakref.WeakKeyDictionary()
+        self._loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('ADAPTIVE_CONCURRENCY_ENABLED'):
+            raise NotConfigured
+        ext = cls(crawler)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.response_downloaded, signal=signals.response_downloaded)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        crawler.signals.connect(ext.request_left_downloader, signal=signals.request_left_downloader)
+        crawler.signals.connect(ext.ban_detected, signal=throttle.ban_detected)
+        return ext
+
+    def spider_opened(self, spider):
+        self._loop = task.LoopingCall(self.adjust)
+        self._loop.start(self.interval, now=False)
+
+    def spider_closed(self, spider):
+        if self._loop and self._loop.running:
+            self._loop.stop()
+
+    def _slot_info(self, key):
+        """ (controller, captcha markers) of a slot - by its domain
+        """
+        if key not in self._slots:
+            domain = throttle.domain_of(key, self.controllers.keys())
+            markers = self.ban_markers.get(throttle.domain_of(key, self.ban_markers.keys()), [])
+            self._slots[key] = (self.controllers.get(domain, self.default_controller), markers)
+        return self._slots[key]
+
+    def _record(self, key, outcome, latency=None):
+        if key is None:
+            return
+        if key not in self.windows:
+            self.windows[key] = throttle.DomainWindow(self.window_size)
+            slot = self.crawler.engine.downloader.slots.get(key)
+            if slot is not None:
+                # within the bounds from the start
+                slot.concurrency, slot.delay = self._slot_info(key)[0].clamp(slot.concurrency, slot.delay)
+        self.windows[key].add(outcome, latency)
+        if outcome != throttle.OK:
+            self.crawler.stats.inc_value('pwbot/throttle/{}/{}s'.format(key, outcome))
+
+    def response_downloaded(self, response, request, spider):
+        key = request.meta.get('download_slot')
+        latency = request.meta.get('download_latency')
+        self._downloaded.add(request)
+        if response.status in self.ban_http_codes:
+            self._record(key, throttle.BAN, latency)
+        elif response.status >= 500:
+            self._record(key, throttle.ERROR, latency)
+        elif response.status == 200 and key is not None and len(self._slot_info(key)[1]) > 0:
+            # captcha pages are 200s - checked once decompressed (response_received)
+            self._pending[request] = (key, latency)
+        else:
+            self._record(key, throttle.OK, latency)
+
+    def response_received(self, response, request, spider):
+        pending = self._pending.pop(request, None)
+        if pending is None:
+            return
+        key, latency = pending
+        reason = throttle.ban_reason(response, self.ban_http_codes, self._slot_info(key)[1], self.ban_max_size)
+        self._record(key, throttle.BAN if reason else throttle.OK, latency)
+
+    def ban_detected(self, request, response, reason, spider):
+        # retried/quarantined by pwbot.middlewares.BanRetryMiddleware - never received
+        pending = self._pending.pop(request, None)
+        if pending is not None:
+            self._record(pending[0], throttle.BAN, pending[1])
+
+    def request_left_downloader(self, request, spider):
+        if request not in self._downloaded and not request.meta.get('hedge_cancelled'):
+            # download error - timeout, connection refused/lost, dns...
+            self._record(request.meta.get('download_slot'), throttle.ERROR)
+
+    def adjust(self):
+        slots = self.crawler.engine.downloader.slots
+        for key, window in self.windows.items():
+            slot = slots.get(key)
+            if slot is None or len(window) < self.min_samples:
+                continue
+            controller = self._slot_info(key)[0]
+            decision, concurrency, delay, reason = controller.decide(window, slot.concurrency, slot.delay)
+            percentiles = window.latency_percentiles((50, 95,))
+            stats = self.crawler.stats
+            stats.set_value('pwbot/throttle/{}/concurrency'.format(key), concurrency)
+            stats.set_value('pwbot/throttle/{}/delay'.format(key), delay)
+            stats.set_value('pwbot/throttle/{}/latency_p50'.format(key), percentiles[50])
+            stats.set_value('pwbot/throttle/{}/latency_p95'.format(key), percentiles[95])
+            stats.set_value('pwbot/throttle/{}/error_rate'.format(key), window.rate(throttle.ERROR))
+            stats.set_value('pwbot/throttle/{}/ban_rate'.format(key), window.rate(throttle.BAN))
+            stats.inc_value('pwbot/throttle/{}/decisions/{}'.format(key, decision))
+            if decision != throttle.HOLD:
+                self.logger.info("[{}] {} - concurrency {} -> {}, delay {:.2f}s -> {:.2f}s{}".format(
+                    key, decision, slot.concurrency, concurrency, slot.delay, delay, ' ({})'.format(reason) if reason else ''))
+            slot.concurrency, slot.delay = concurrency, delay
+            window.clear()
@@ -0,0 +1,205 @@
+""" pwbot.httpcache
+
+    scrapy HTTPCACHE_STORAGE in a single sqlite file - for parser fixes,
+    staging and replay crawls (python run.py track --cache=replay ...), so
+    they don't go through the proxy again.
+
+        HTTPCACHE_STORAGE = 'pwbot.httpcache.SqliteCacheStorage'
+        HTTPCACHE_SQLITE_PATH               the cache file. shared by jobs (wal journal)
+        HTTPCACHE_EXPIRATION_SECS           default ttl. 0: never expire
+        HTTPCACHE_DOMAIN_EXPIRATION_SECS    {domain: ttl} - the domain and its subdomains
+        HTTPCACHE_SQLITE_MAX_SIZE           bytes of compressed responses. the least recently
+                                            used are evicted above it. 0: no cap
+        HTTPCACHE_COMPRESSION               'zstd' (requires zstandard, falls back to gzip) | 'gzip' | None
+        HTTPCACHE_COMPRESSION_LEVEL
+
+    headers and body of a response are compressed together. the codec is
+    kept per row, so changing HTTPCACHE_COMPRESSION keeps old rows readable.
+
+    banned pages are not stored (any storage):
+
+        HTTPCACHE_POLICY = 'pwbot.httpcache.BanAwareCachePolicy'
+"""
+
+import os
+import gzip
+import time
+import logging
+import sqlite3
+from w3lib.http import headers_dict_to_raw, headers_raw_to_dict
+from scrapy.http import Headers
+from scrapy.extensions.httpcache import DummyPolicy
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.httpobj import urlparse_cached
+from pwbot import utils, transport, throttle
+
+try:
+    from scrapy.utils.request import request_fingerprint
+except ImportError:
+    # scrapy >= 2.12 - crawler.request_fingerprinter only
+    request_fingerprint = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    fingerprint TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    codec TEXT,
+    headers_size INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+"""
+
+# evict down to this share of HTTPCACHE_SQLITE_MAX_SIZE - not on every store once full
+_EVICT_TO = 0.9
+
+
+def decompress(data, codec):
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(data)
+    elif codec == 'gzip':
+        return gzip.decompress(data)
+    return data
+
+
+class BanAwareCachePolicy(DummyPolicy):
+    """ scrapy DummyPolicy that does not store banned pages - the block pages
+        pwbot.middlewares.BanRetryMiddleware retries (BAN_HTTP_CODES,
+        BAN_CAPTCHA_MARKERS, BAN_MAX_PAGE_SIZE). captcha pages are 200s:
+        HTTPCACHE_IGNORE_HTTP_CODES does not keep them out, and once stored
+        every later crawl of the url would be answered with the captcha.
+    """
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.http_codes = [int(c) for c in settings.getlist('BAN_HTTP_CODES')]
+        self.markers = settings.getdict('BAN_CAPTCHA_MARKERS')
+        self.max_size = settings.getint('BAN_MAX_PAGE_SIZE')
+        self._domain_markers = {}
+
+    def _markers(self, host):
+        if host not in self._domain_markers:
+            self._domain_markers[host] = self.markers.get(throttle.domain_of(host, self.markers.keys()), [])
+        return self._domain_markers[host]
+
+    def should_cache_response(self, response, request):
+        if not super().should_cache_response(response, request):
+            return False
+        return throttle.ban_reason(response, self.http_codes, self._markers(urlparse_cached(request).hostname or ''), self.max_size) is None
+
+
+class SqliteCacheStorage(object):
+    def __init__(self, settings):
+        self.logger = logging.getLogger(utils.class_fullname(self))
+        self.path = settings.get('HTTPCACHE_SQLITE_PATH')
+        self.expiration_secs = settings.getint('HTTPCACHE_EXPIRATION_SECS')
+        self.domain_expiration_secs = settings.getdict('HTTPCACHE_DOMAIN_EXPIRATION_SECS')
+        self.max_size = settings.getint('HTTPCACHE_SQLITE_MAX_SIZE')
+        self.compression = settings.get('HTTPCACHE_COMPRESSION')
+        self.compression_level = settings.getint('HTTPCACHE_COMPRESSION_LEVEL', 3)
+        if self.compression == 'zstd' and zstandard is None:
+            self.logger.warning("compression 'zstd' not available. fall back to gzip")
+            self.compression = 'gzip'
+        self._db = None
+        self._stats = None
+        self._fingerprinter = None
+        self._estimated_size = 0
+
+    def open_spider(self, spider):
+        dirpath = os.path.dirname(self.path)
+        if dirpath:
+            os.makedirs(dirpath, exist_ok=True)
+        # autocommit. one write per store, and per hit (lru)
+        self._db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(_SCHEMA)
+        self._estimated_size = self._size()
+        self._stats = spider.crawler.stats
+        self._fingerprinter = getattr(spider.crawler, 'request_fingerprinter', None)
+        self.logger.debug("Using sqlite cache storage in {}".format(self.path))
+
+    def close_spider(self, spider):
+        if self._db is not None:
+            self._stats.set_value('pwbot/httpcache/size', self._size())
+            self._db.close()
+            self._db = None
+
+    def _fingerprint(self, request):
+        if self._fingerprinter is not None:
+            return self._fingerprinter.fingerprint(request).hex()
+        return request_fingerprint(request)
+
+    def _expiration_secs(self, host):
+        for domain, secs in self.domain_expiration_secs.items():
+            if host == domain or host.endswith('.' + domain):
+                return int(secs)
+        return self.expiration_secs
+
+    def retrieve_response(self, spider, request):
+        """ returns the response if cached and not expired, or None
+        """
+        fingerprint = self._fingerprint(request)
+        row = self._db.execute('SELECT host, url, status, codec, headers_size, data, stored_at FROM responses WHERE fingerprint = ?', (fingerprint,)).fetchone()
+        if row is None:
+            return None
+        host, url, status, codec, headers_size, data, stored_at = row
+        now = time.time()
+        expiration_secs = self._expiration_secs(host)
+        if expiration_secs > 0 and now - stored_at > expiration_secs:
+            self._stats.inc_value('pwbot/httpcache/expired')
+            return None
+        self._db.execute('UPDATE responses SET accessed_at = ? WHERE fingerprint = ?', (now, fingerprint))
+        data = decompress(data, codec)
+        headers = Headers(headers_raw_to_dict(data[:headers_size]))
+        body = data[headers_size:]
+        request.meta['cache_timestamp'] = stored_at
+        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+        return respcls(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, spider, request, response):
+        raw_headers = headers_dict_to_raw(response.headers)
+        data = transport.compress(raw_headers + response.body, self.compression, self.compression_level)
+        now = time.time()
+        fingerprint = self._fingerprint(request)
+        replaced = self._db.execute('SELECT size FROM responses WHERE fingerprint = ?', (fingerprint,)).fetchone()
+        self._db.execute('INSERT OR REPLACE INTO responses (fingerprint, host, url, status, codec, headers_size, data, size, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (fingerprint, urlparse_cached(request).hostname or '', response.url, response.status, self.compression,
+                len(raw_headers), data, len(data), now, now))
+        self._stats.inc_value('pwbot/httpcache/bytes_stored', len(data))
+        # other jobs write the same file - the size is counted once it may be over the cap
+        self._estimated_size += len(data) - (replaced[0] if replaced else 0)
+        if self.max_size > 0 and self._estimated_size > self.max_size:
+            self._evict()
+
+    def _size(self):
+        return self._db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def _evict(self):
+        """ least recently used first, down to _EVICT_TO of the max size
+        """
+        size = self._size()
+        if size > self.max_size:
+            to_free = size - int(self.max_size * _EVICT_TO)
+            fingerprints = []
+            cursor = self._db.execute('SELECT fingerprint, size FROM responses ORDER BY accessed_at')
+            for fingerprint, row_size in cursor:
+                fingerprints.append((fingerprint,))
+                size -= row_size
+                to_free -= row_size
+                if to_free <= 0:
+                    break
+            cursor.close()
+            self._db.executemany('DELETE FROM responses WHERE fingerprint = ?', fingerprints)
+            self._stats.inc_value('pwbot/httpcache/evicted', len(fingerprints))
+        self._estimated_size = size
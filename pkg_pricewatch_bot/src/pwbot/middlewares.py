@@ -5,8 +5,22 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
-from scrapy import signals
-from pwbot import settings, utils
+import os
+import json
+import time
+import hashlib
+import logging
+import treq
+from twisted.internet import defer, reactor
+from twisted.internet.error import TimeoutError
+from twisted.python.failure import Failure
+from scrapy import signals, Request
+from scrapy.exceptions import NotConfigured, IgnoreRequest
+from scrapy.utils.httpobj import urlparse_cached
+from pwbot import settings, utils, transport, throttle, proxies
+from pwbot.items import ListingItem
+from pwbot.settings import config
+from pwbot.variations import VariationFamilyRegistry
 
 
 class PwbotSpiderMiddleware(object):
@@ -57,6 +71,109 @@ class PwbotSpiderMiddleware(object):
         spider.logger.info('Spider opened: %s' % spider.name)
 
 
+class VariationFamilyMiddleware(object):
+    """ pwbot.middlewares.VariationFamilyMiddleware
+
+        expand every amazon variation family once per job (pwbot.variations).
+
+        at spider_opened the families of the job's skus are fetched from pwweb
+        (VARIATION_FAMILY_SEED_ENABLED). a family is claimed by the first page
+        that actually yields its variation requests (meta 'variation_asin',
+        'variation_parent_asin' - set by pwbot.parsers.amazon_item_parser), so
+        a start sku whose page is banned, times out or has no price does not
+        keep the family from being expanded by another one. variation requests
+        are dropped if another page expanded the family already, or if the
+        asin is scheduled or done in this job. start requests of a known
+        family expanded already don't crawl variations.
+    """
+
+    DOMAINS = ['amazon.com', 'amazon.ca',]
+
+    def __init__(self, stats, seed=True, seed_timeout=10):
+        self.logger = logging.getLogger(utils.class_fullname(self))
+        self._stats = stats
+        self._seed = seed
+        self._seed_timeout = seed_timeout
+        self.registry = VariationFamilyRegistry()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('VARIATION_FAMILY_REGISTRY_ENABLED'):
+            raise NotConfigured
+        mw = cls(crawler.stats,
+                seed=crawler.settings.getbool('VARIATION_FAMILY_SEED_ENABLED'),
+                seed_timeout=crawler.settings.getint('VARIATION_FAMILY_SEED_TIMEOUT', 10))
+        crawler.signals.connect(mw.spider_opened, signal=signals.spider_opened)
+        return mw
+
+    def spider_opened(self, spider):
+        """ returns a deferred - start requests wait for the seed
+        """
+        if not self._seed or not hasattr(spider, 'start_skus'):
+            return None
+        return defer.DeferredList([self._fetch_families(domain, skus)
+                    for domain, skus in spider.start_skus().items() if domain in self.DOMAINS and len(skus) > 0])
+
+    def _fetch_families(self, domain, skus):
+        @defer.inlineCallbacks
+        def _cb(resp):
+            text = yield resp.text(encoding='UTF-8')
+            if resp.code >= 400:
+                self.logger.error("{}: HTTP Error: failed to fetch variation families - {}".format(resp.code, text))
+                return
+            families = json.loads(text).get('families', {})
+            self.registry.seed(domain, families)
+            self._stats.inc_value('pwbot/variations/families_seeded', len(families))
+
+        d = treq.post('http://{}:{}/api/resource/variation_families/'.format(
+                    config['PriceWatchWeb']['host'], config['PriceWatchWeb']['port']),
+            json.dumps({
+                'domain': domain,
+                'skus': skus,
+            }).encode('ascii'),
+            headers={b'Content-Type': [b'application/json']},
+            pool=transport.get_pool(),
+            timeout=self._seed_timeout
+        )
+        d.addCallback(_cb)
+        # the job runs without seed
+        d.addErrback(lambda f: self.logger.error("{}: failed to fetch variation families - {}".format(utils.class_fullname(f.value), f.getErrorMessage())))
+        return d
+
+    def process_start_requests(self, start_requests, spider):
+        for r in start_requests:
+            domain = r.cb_kwargs.get('domain')
+            asin = utils.extract_sku_from_url(r.url, domain) if domain in self.DOMAINS else None
+            if asin:
+                self.registry.schedule(domain, asin)
+                parent_asin = self.registry.parent_of(domain, asin)
+                if r.cb_kwargs.get('crawl_variations') and parent_asin and self.registry.is_expanded(domain, parent_asin) \
+                        and not self.registry.expand(domain, parent_asin, asin):
+                    # the family is expanded by another page of the job. not claimed here - see process_spider_output
+                    self._stats.inc_value('pwbot/variations/expansions_skipped')
+                    r = r.replace(cb_kwargs=dict(r.cb_kwargs, crawl_variations=False))
+            yield r
+
+    def process_spider_output(self, response, result, spider):
+        source_asin = None
+        for r in result:
+            if isinstance(r, Request) and 'variation_asin' in r.meta:
+                domain = r.cb_kwargs.get('domain')
+                parent_asin = r.meta.get('variation_parent_asin')
+                if source_asin is None:
+                    source_asin = utils.extract_sku_from_url(response.url, domain)
+                if parent_asin and not self.registry.expand(domain, parent_asin, source_asin):
+                    self._stats.inc_value('pwbot/variations/requests_skipped')
+                    continue
+                if not self.registry.schedule(domain, r.meta['variation_asin'], parent_asin):
+                    self._stats.inc_value('pwbot/variations/requests_skipped')
+                    continue
+                self._stats.inc_value('pwbot/variations/requests_scheduled')
+            elif isinstance(r, ListingItem) and r.get('domain') in self.DOMAINS and r.get('data', {}).get('asin'):
+                self.registry.done(r['domain'], r['data'].get('asin'), r['data'].get('parent_asin'))
+            yield r
+
+
 class RequestHeaderCostomizerMiddleware(object):
     def process_request(self, request, spider):
         if settings.CRAWLERA_ENABLED:
@@ -73,6 +190,296 @@ class RequestHeaderCostomizerMiddleware(object):
         return None
 
 
+class BanRetryMiddleware(object):
+    """ pwbot.middlewares.BanRetryMiddleware
+
+        block pages (amazon robot check, walmart/canadiantire block pages)
+        are classified before they reach the parsers - by status
+        (BAN_HTTP_CODES), and by the marker bytes (BAN_CAPTCHA_MARKERS) of
+        bodies up to BAN_MAX_PAGE_SIZE. a banned page is retried through
+        another proxy session of the pool (pwbot.proxies) up to
+        BAN_RETRY_TIMES, then quarantined: the request is dropped
+        (IgnoreRequest) and the page is kept in BAN_QUARANTINE_DIRPATH.
+
+        every response and download error is reported to the pool - the
+        health scores of the sessions. stats under pwbot/bans/..., pwbot/proxies/...
+
+        runs after HttpCompressionMiddleware (decompressed bodies) and before
+        RetryMiddleware on responses.
+    """
+
+    def __init__(self, crawler, backend, pool):
+        self.logger = logging.getLogger(utils.class_fullname(self))
+        self.crawler = crawler
+        self.backend = backend
+        self.pool = pool
+        self.http_codes = [int(c) for c in crawler.settings.getlist('BAN_HTTP_CODES')]
+        self.markers = crawler.settings.getdict('BAN_CAPTCHA_MARKERS')
+        self.max_size = crawler.settings.getint('BAN_MAX_PAGE_SIZE')
+        self.retry_times = crawler.settings.getint('BAN_RETRY_TIMES', 2)
+        self.quarantine_dirpath = crawler.settings.get('BAN_QUARANTINE_DIRPATH')
+        self._domain_markers = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('BAN_RETRY_ENABLED'):
+            raise NotConfigured
+        backend = proxies.build_backend(crawler.settings)
+        pool = proxies.ProxyPool(backend.sessions(),
+                    alpha=crawler.settings.getfloat('PROXY_POOL_SCORE_ALPHA', 0.2),
+                    min_score=crawler.settings.getfloat('PROXY_POOL_MIN_SCORE', 0.3),
+                    cooldown=crawler.settings.getfloat('PROXY_POOL_COOLDOWN', 300.0))
+        mw = cls(crawler, backend, pool)
+        crawler.signals.connect(mw.spider_closed, signal=signals.spider_closed)
+        return mw
+
+    def _markers(self, host):
+        if host not in self._domain_markers:
+            self._domain_markers[host] = self.markers.get(throttle.domain_of(host, self.markers.keys()), [])
+        return self._domain_markers[host]
+
+    def process_request(self, request, spider):
+        if request.meta.get('dont_proxy') or 'ban_retry_times' in request.meta:
+            # retries are routed already
+            return None
+        self.backend.route(request, self.pool.pick(exclude=request.meta.get('proxy_exclude', ())) if self.backend.pin_all else None)
+        return None
+
+    def process_response(self, request, response, spider):
+        if request.meta.get('dont_proxy') or request.meta.get('hedge_role') == 'origin':
+            # origin: classified as the response of its primary/hedge request
+            return response
+        session = self.backend.session_of(request, response)
+        if session is not None and session not in self.pool.sessions:
+            self.pool.add(session)
+            self.crawler.stats.set_value('pwbot/proxies/sessions', len(self.pool))
+        reason = throttle.ban_reason(response, self.http_codes, self._markers(urlparse_cached(request).hostname or ''), self.max_size)
+        if reason is None:
+            self.pool.record(session, throttle.OK if response.status < 500 else throttle.ERROR)
+            return response
+        stats = self.crawler.stats
+        stats.inc_value('pwbot/bans/{}'.format(reason))
+        if self.pool.record(session, throttle.BAN):
+            stats.inc_value('pwbot/proxies/cooldowns')
+        self.crawler.signals.send_catch_log(signal=throttle.ban_detected, request=request, response=response, reason=reason, spider=spider)
+        retries = request.meta.get('ban_retry_times', 0) + 1
+        if retries <= self.retry_times:
+            stats.inc_value('pwbot/bans/retries')
+            self.logger.debug("banned ({}) through {} - retry {}/{} {}".format(reason, proxies.display(session), retries, self.retry_times, request.url))
+            retry_request = request.replace(dont_filter=True)
+            retry_request.meta['ban_retry_times'] = retries
+            # same fingerprint - not answered by the http cache
+            retry_request.meta['dont_cache'] = True
+            self.backend.route(retry_request, self.pool.pick(exclude=(session,)), retry=True)
+            return retry_request
+        stats.inc_value('pwbot/bans/quarantined')
+        self.logger.warning("banned ({}) after {} retries - quarantined {}{}".format(reason, self.retry_times, request.url,
+                    ' -> {}'.format(self._quarantine(request, response, reason)) if self.quarantine_dirpath else ''))
+        raise IgnoreRequest("banned ({}): {}".format(reason, request.url))
+
+    def process_exception(self, request, exception, spider):
+        if not request.meta.get('dont_proxy') and not isinstance(exception, IgnoreRequest):
+            if self.pool.record(self.backend.session_of(request), throttle.ERROR):
+                self.crawler.stats.inc_value('pwbot/proxies/cooldowns')
+        return None
+
+    def _quarantine(self, request, response, reason):
+        """ returns the filepath of the page
+        """
+        dirpath = os.path.join(self.quarantine_dirpath, urlparse_cached(request).hostname or 'unknown')
+        filepath = os.path.join(dirpath, '{}-{}-{}.html'.format(int(time.time()), reason,
+                    hashlib.sha1(request.url.encode('utf-8')).hexdigest()[:12]))
+        try:
+            os.makedirs(dirpath, exist_ok=True)
+            with open(filepath, 'wb') as f:
+                f.write(response.body)
+        except OSError as e:
+            self.logger.error("{}: failed to quarantine {} - {}".format(utils.class_fullname(e), request.url, str(e)))
+            return None
+        return filepath
+
+    def spider_closed(self, spider):
+        for session, health in self.pool.sessions.items():
+            self.logger.info("proxy session {} - score {:.2f}, {} ok, {} errors, {} bans".format(
+                proxies.display(session), health.score, health.oks, health.errors, health.bans))
+
+
+class LatencyAwareMiddleware(object):
+    """ pwbot.middlewares.LatencyAwareMiddleware
+
+        per host download latency histograms (the latest LATENCY_WINDOW
+        downloads, timeouts counted at their timeout), for
+
+        timeouts    (LATENCY_TIMEOUT_ENABLED) download_timeout of a request:
+                    LATENCY_TIMEOUT_PERCENTILE * LATENCY_TIMEOUT_FACTOR of its
+                    host, within LATENCY_TIMEOUT_MIN and DOWNLOAD_TIMEOUT.
+                    DOWNLOAD_TIMEOUT until the host has LATENCY_MIN_SAMPLES
+        hedging     (HEDGE_ENABLED) a meta 'hedge' request still running after
+                    the HEDGE_PERCENTILE latency of its host is sent again -
+                    through another proxy session (meta 'proxy_exclude') on a
+                    pool of proxy urls - and the first response is taken. the
+                    other one is cancelled. at most HEDGE_MAX_RATIO of the meta
+                    'hedge' requests are sent twice
+
+        the origin request of a hedge (meta hedge_role 'origin') is not
+        downloaded - its 'primary' and 'hedge' copies go through the downloader
+        middlewares and the downloader. the response taken is given to the
+        origin request. stats under
+        pwbot/latency/..., pwbot/hedge/...
+    """
+
+    def __init__(self, crawler):
+        self.logger = logging.getLogger(utils.class_fullname(self))
+        self.crawler = crawler
+        settings = crawler.settings
+        self.timeout_enabled = settings.getbool('LATENCY_TIMEOUT_ENABLED')
+        self.hedge_enabled = settings.getbool('HEDGE_ENABLED')
+        self.window_size = settings.getint('LATENCY_WINDOW', 200)
+        self.min_samples = settings.getint('LATENCY_MIN_SAMPLES', 20)
+        self.download_timeout = settings.getfloat('DOWNLOAD_TIMEOUT', 180.0)
+        self.timeout_percentile = settings.getfloat('LATENCY_TIMEOUT_PERCENTILE', 99)
+        self.timeout_factor = settings.getfloat('LATENCY_TIMEOUT_FACTOR', 3.0)
+        self.min_timeout = settings.getfloat('LATENCY_TIMEOUT_MIN', 10.0)
+        self.hedge_percentile = settings.getfloat('HEDGE_PERCENTILE', 95)
+        self.hedge_min_delay = settings.getfloat('HEDGE_MIN_DELAY', 1.0)
+        self.hedge_max_ratio = settings.getfloat('HEDGE_MAX_RATIO', 0.1)
+        self.windows = {}
+        self._hedgeable = 0
+        self._hedged = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('LATENCY_TIMEOUT_ENABLED') and not crawler.settings.getbool('HEDGE_ENABLED'):
+            raise NotConfigured
+        return cls(crawler)
+
+    def _window(self, host):
+        if host not in self.windows:
+            self.windows[host] = throttle.DomainWindow(self.window_size)
+        return self.windows[host]
+
+    def latency(self, host, p):
+        """ the p percentile download latency of the host, or None - not enough samples
+        """
+        window = self.windows.get(host)
+        if window is None or len(window) < self.min_samples:
+            return None
+        return window.latency_percentiles((p,))[p]
+
+    def timeout(self, host, max_timeout=None):
+        max_timeout = max_timeout or self.download_timeout
+        latency = self.latency(host, self.timeout_percentile)
+        if latency is None:
+            return max_timeout
+        return min(max_timeout, max(self.min_timeout, latency * self.timeout_factor))
+
+    def process_request(self, request, spider):
+        host = urlparse_cached(request).hostname or ''
+        if self.timeout_enabled and 'download_timeout' not in request.meta:
+            timeout = self.timeout(host, getattr(spider, 'download_timeout', None))
+            request.meta['download_timeout'] = timeout
+            self.crawler.stats.set_value('pwbot/latency/{}/timeout'.format(host), timeout)
+        if not self.hedge_enabled or not request.meta.get('hedge') or 'hedge_role' in request.meta:
+            return None
+        delay = self.latency(host, self.hedge_percentile)
+        if delay is None:
+            return None
+        self._hedgeable += 1
+        return self._hedge(request, max(delay, self.hedge_min_delay), spider)
+
+    def process_response(self, request, response, spider):
+        latency = request.meta.get('download_latency')
+        if latency is not None and request.meta.get('hedge_role') != 'origin' and 'cached' not in response.flags:
+            self._window(urlparse_cached(request).hostname or '').add(throttle.OK, latency)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        if isinstance(exception, (TimeoutError, defer.TimeoutError)) and request.meta.get('hedge_role') != 'origin':
+            # counted at its timeout - the timeouts of a host going slow grow back
+            self._window(urlparse_cached(request).hostname or '').add(throttle.ERROR, request.meta.get('download_timeout'))
+        return None
+
+    def _download(self, request, spider):
+        """ through the downloader middlewares and the downloader - not the engine, so
+            only the origin request is logged as crawled and sent as response_received
+        """
+        downloader = self.crawler.engine.downloader
+        if hasattr(self.crawler.engine, 'download_async'):
+            # scrapy >= 2.14 - no spider argument
+            return downloader.fetch(request)
+        return downloader.fetch(request, spider)
+
+    def _hedge(self, request, delay, spider):
+        """ returns a deferred - the first response of the primary and hedge requests
+        """
+        stats = self.crawler.stats
+        primary = request.replace(dont_filter=True)
+        primary.meta['hedge_role'] = 'primary'
+        hedge = request.replace(dont_filter=True)
+        hedge.meta['hedge_role'] = 'hedge'
+        request.meta['hedge_role'] = 'origin'
+        attempts = {}
+
+        def _cancel_attempts():
+            for attempt, d in list(attempts.values()):
+                # not a download error (pwbot.extensions.AdaptiveConcurrency)
+                attempt.meta['hedge_cancelled'] = True
+                d.cancel()
+
+        def _cancel(_):
+            if timer.active():
+                timer.cancel()
+            _cancel_attempts()
+
+        result = defer.Deferred(canceller=_cancel)
+
+        def _done(outcome, attempt):
+            attempts.pop(attempt.meta['hedge_role'], None)
+            if result.called:
+                # the slower one - cancelled, or finished after the first
+                return None
+            if isinstance(outcome, Failure) and len(attempts) > 0:
+                # the other one may still make it
+                return None
+            if timer.active():
+                timer.cancel()
+            if isinstance(outcome, Failure):
+                result.errback(outcome)
+            else:
+                stats.inc_value('pwbot/hedge/won_by_{}'.format(attempt.meta['hedge_role']))
+                if not isinstance(outcome, Request):
+                    # the spider gets the response of the request it sent
+                    outcome.request = request
+                result.callback(outcome)
+            if len(attempts) > 0:
+                # once the result is out - the cancelled one is done above
+                stats.inc_value('pwbot/hedge/cancelled')
+                _cancel_attempts()
+            return None
+
+        def _start(attempt):
+            d = self._download(attempt, spider)
+            attempts[attempt.meta['hedge_role']] = (attempt, d)
+            d.addBoth(_done, attempt)
+
+        def _start_hedge():
+            if result.called:
+                return
+            if self._hedged + 1 > self.hedge_max_ratio * self._hedgeable:
+                stats.inc_value('pwbot/hedge/over_budget')
+                return
+            self._hedged += 1
+            stats.inc_value('pwbot/hedge/sent')
+            if 'proxy' in primary.meta:
+                hedge.meta['proxy_exclude'] = [primary.meta['proxy'],]
+            self.logger.debug("hedge after {:.2f}s {}".format(delay, request.url))
+            _start(hedge)
+
+        timer = reactor.callLater(delay, _start_hedge)
+        _start(primary)
+        return result
+
+
 class PwbotDownloaderMiddleware(object):
     # Not all methods need to be defined. If a method is not defined,
     # scrapy acts as if the downloader middleware does not modify the
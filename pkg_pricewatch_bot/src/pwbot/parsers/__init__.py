@@ -8,34 +8,58 @@ from scrapy.exceptions import IgnoreRequest
 from pwbot.parsers.amazon_item_parser import AmazonItemParser
 from pwbot.parsers.walmart_item_parser import WalmartComItemParser, WalmartCaItemParser
 from pwbot.parsers.canadiantire_item_parser import CanadiantireCaItemParser
+from pwbot.parsers.store_item_parser import StoreItemParser
 
-def parse_amazon_item(response, domain, job_id, crawl_variations, lat=None, lng=None):
+# parsers are stateless - one instance each per process
+_amazon_item_parser = AmazonItemParser()
+_walmart_com_item_parser = WalmartComItemParser()
+_walmart_ca_item_parser = WalmartCaItemParser()
+_canadiantire_ca_item_parser = CanadiantireCaItemParser()
+_store_item_parser = StoreItemParser()
+
+# fields=price (price tracking) is amazon only - the other store parsers take the argument and extract all fields
+
+def parse_amazon_item(response, domain, job_id, crawl_variations, lat=None, lng=None, fields=None):
     """ response: scrapy.http.response.html.HtmlResponse
+        fields: None - all fields, 'price' - price tracking item (status, price, quantity)
     """
-    parser = AmazonItemParser()
     try:
-        return parser.parse_item(response, domain, job_id, crawl_variations, lat, lng)
+        return _amazon_item_parser.parse_item(response, domain, job_id, crawl_variations, lat, lng, fields)
+    except IgnoreRequest:
+        return None
+
+def parse_walmart_com_item(response, domain, job_id, crawl_variations, lat, lng, fields=None):
+    try:
+        return _walmart_com_item_parser.parse_item(response, domain, job_id, crawl_variations, lat, lng)
     except IgnoreRequest:
         return None
 
-def parse_walmart_com_item(response, domain, job_id, crawl_variations, lat, lng):
-    parser = WalmartComItemParser()
+def parse_walmart_ca_item(response, domain, job_id, crawl_variations, lat, lng, fields=None):
     try:
-        return parser.parse_item(response, domain, job_id, crawl_variations, lat, lng)
+        return _walmart_ca_item_parser.parse_item(response, domain, job_id, crawl_variations, lat, lng)
     except IgnoreRequest:
         return None
 
-def parse_walmart_ca_item(response, domain, job_id, crawl_variations, lat, lng):
-    parser = WalmartCaItemParser()
+def parse_walmart_ca_json_response(response, domain, job_id, parent_sku):
+    return _walmart_ca_item_parser.parse_json_response(response, domain, job_id, parent_sku)
+
+def parse_canadiantire_ca_item(response, domain, job_id, crawl_variations, lat, lng, fields=None):
     try:
-        return parser.parse_item(response, domain, job_id, crawl_variations, lat, lng)
+        return _canadiantire_ca_item_parser.parse_item(response, domain, job_id, crawl_variations, lat, lng)
     except IgnoreRequest:
         return None
 
-def parse_canadiantire_ca_item(response, domain, job_id, crawl_variations, lat, lng):
-    parser = CanadiantireCaItemParser()
+def parse_canadiantire_ca_near_stores(response, skus, domain, job_id, parent_sku, referer):
+    return _canadiantire_ca_item_parser.parse_near_stores(response, skus, domain, job_id, parent_sku, referer)
+
+def parse_canadiantire_ca_api(response, domain, job_id):
+    return _canadiantire_ca_item_parser.parse_api(response, domain, job_id)
+
+def parse_store_item(response, domain, job_id, crawl_variations=False, lat=None, lng=None, fields=None):
+    """ any domain registered in pwbot.parsers.fieldspecs.FIELD_SPECS
+    """
     try:
-        return parser.parse_item(response, domain, job_id, crawl_variations, lat, lng)
+        return _store_item_parser.parse_item(response, domain, job_id, crawl_variations, lat, lng)
     except IgnoreRequest:
         return None
 
@@ -61,5 +85,8 @@ def resp_error_handler(failure):
     elif failure.check(TimeoutError, TCPTimedOutError):
         request = failure.request
         logger.error('TimeoutError on {} - {}'.format(request.url, failure.getErrorMessage()))
+    elif failure.check(IgnoreRequest):
+        # i.e. banned pages quarantined by pwbot.middlewares.BanRetryMiddleware
+        logger.warning('Ignored {} - {}'.format(failure.request.url, failure.getErrorMessage()))
     else:
-        logger.error('Error on {} - {}'.format(request.url, failure.getErrorMessage()))
+        logger.error('Error on {} - {}'.format(failure.request.url, failure.getErrorMessage()))
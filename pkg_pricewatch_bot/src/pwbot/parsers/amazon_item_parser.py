@@ -5,27 +5,182 @@ import re
 import json
 import urllib
 import logging
+import lxml.html
 from scrapy import Request
 from scrapy.exceptions import IgnoreRequest
 from pwbot import utils, settings, parsers
 from pwbot.items import ListingItem
+from pwbot.parsers import fieldspecs, trimmer, backends
+from pwbot.parsers.embedded_json import EmbeddedJsonScanner
+from pwbot.parsers.sanitizer import HtmlSanitizer
+
+
+# json embedded in inline scripts - see AmazonItemParserContext.script_data
+_SCRIPT_DATA_KEYS = [
+    ('"parent_asin"', 'parent_asin'),
+    ('"asin_variation_values"', 'asin_variation_values'),
+    ('"asinVariationValues"', 'asin_variation_values'),
+    ('"variationDisplayLabels"', 'variation_display_labels'),
+    ('"selected_variations"', 'selected_variations'),
+    ("'colorImages'", 'color_images'),
+]
+_SCRIPT_DATA_SCANNER = EmbeddedJsonScanner(_SCRIPT_DATA_KEYS)
+# page regions parsed into the DOM (settings.PARSER_TRIM_AMAZON_HTML) - every element the selectors below read
+# is one of these, or inside one of them. no #centerCol: not a product page layout known - the whole page is parsed
+_AMAZON_TRIMMER = trimmer.HtmlTrimmer([
+        'wayfinding-breadcrumbs_feature_div',
+        'leftCol', 'centerCol', 'rightCol',
+        'addToCart', 'price', 'priceblock_dealprice', 'priceblock_saleprice', 'priceblock_ourprice', 'buyNewSection',
+        'availability', 'pantry-availability', 'merchant-info', 'pe-bb-signup-button', 'ourprice_shippingmessage',
+        'title', 'brand', 'bylineInfo', 'main-image-container',
+        'feature-bullets', 'fbExpandableSectionContent',
+        'productDescription', 'descriptionAndDetails', 'aplus', 'prodDetails',
+        'summaryStars', 'acrCustomerReviewText', 'avgRating', 'acrPopover',
+        'addOnItem_feature_div', 'pantry-badge', 'size-chart-url',
+    ],
+    script_markers=[key for key, _name in _SCRIPT_DATA_KEYS],
+    required=['centerCol',])
+# fields=price - status, title, prices and quantity only
+_AMAZON_PRICE_TRIMMER = trimmer.HtmlTrimmer([
+        'leftCol', 'centerCol', 'rightCol',
+        'addToCart', 'price', 'priceblock_dealprice', 'priceblock_saleprice', 'priceblock_ourprice', 'buyNewSection',
+        'availability', 'pantry-availability', 'title',
+    ],
+    script_markers=['"parent_asin"', '"asin_variation_values"', '"asinVariationValues"',],
+    required=['centerCol',],
+    meta=False)
+_RE_ASIN = re.compile(r'^[A-Z0-9]{10}$')
+# fields= spider argument
+FIELDS_PRICE = 'price'
+# patterns searched over the whole page - compiled once
+_RE_IFRAME_CONTENT = re.compile(r"var iframeContent = \"(.+)\";\n")
+
+# features: feature <li>s in a fresh container, ascii only. description: without disclaimers
+_FEATURES_WRAPPER = '<div id="feature-bullets" class="a-section a-spacing-medium a-spacing-top-small"><ul class="a-vertical a-spacing-none"></ul></div>'
+_FEATURES_SANITIZER = HtmlSanitizer(ascii_only=True)
+_DESCRIPTION_SANITIZER = HtmlSanitizer(drop_classes=['disclaim',])
+
+
+def _iframe_description_blocks(html):
+    """ description containers of the description iframe document - parsed once,
+        on lxml, and read for these only
+    """
+    if not html.strip():
+        return None
+    root = lxml.html.fromstring(html)
+    for selector in AMAZON_FIELDS.fields['description_blocks'].selectors:
+        blocks = selector.compiled(root)
+        if len(blocks) > 0:
+            return blocks
+    return None
+
+def _quantity(values):
+    element_text = values[0].strip().lower()
+    if 'out' in element_text:
+        return 0 # out of stock
+    elif 'only' in element_text:
+        if 'more on the way' in element_text:
+            return 1000 # enough stock
+        return utils.extract_int(element_text)
+    elif 'in stock on' in element_text: # will be stock on someday... so currently out of stock...
+        return 0
+    elif 'will be released on' in element_text: # will be released on someday... so currently out of stock...
+        return 0
+    elif 'usually ships within' in element_text: # delay shipping... so currently out of stock...
+        return 0
+    return 1000 # enough stock
+
+def _review_count(values):
+    text = values[0] if len(values) == 1 else values[1]
+    return utils.extract_int(text.replace(',', '').replace('customer reviews', '').replace('customer review', '').strip())
+
+def _avg_rating(values):
+    return float(values[0].replace('out of 5 stars', '').strip())
+
+
+AMAZON_FIELDS = fieldspecs.FieldSpec({
+    # asin of Add To Cart button
+    'asin_on_content': fieldspecs.Field(['form#addToCart input[type=hidden][name=ASIN]::attr(value)',]),
+    'category': fieldspecs.Field(['#wayfinding-breadcrumbs_feature_div > ul li:not(.a-breadcrumb-divider) > span > a::text',], post=fieldspecs.joined(' : '), default=''),
+    # deal price first, sale price second, our price otherwise
+    'price': fieldspecs.Field([
+        '#priceblock_dealprice::text',
+        '#priceblock_saleprice::text',
+        '#priceblock_ourprice::text',
+        '#buyNewSection span.a-color-price.offer-price::text',
+    ], post=fieldspecs.money),
+    'original_price': fieldspecs.Field(['#price table tr td span.a-text-strike::text',], post=fieldspecs.money),
+    'quantity': fieldspecs.Field([
+        '#availability:not(.a-hidden) span::text',
+        '#availability:not(.a-hidden)::text',
+        '#pantry-availability:not(.a-hidden) span::text',
+    ], post=_quantity, default=0),
+    'description_blocks': fieldspecs.Field([
+        '#productDescription .productDescriptionWrapper',
+        '#productDescription',
+        '#descriptionAndDetails .productDescriptionWrapper',
+        '#aplus .aplus-v2',
+    ], post=None),
+    'review_count': fieldspecs.Field(['#summaryStars a::text', '#acrCustomerReviewText::text',], post=_review_count, default=0),
+    'avg_rating': fieldspecs.Field(['#avgRating a > span::text', '#acrPopover a > i > span::text',], post=_avg_rating, default=0.0),
+    'is_addon': fieldspecs.Field(['#addOnItem_feature_div i.a-icon-addon',], post=fieldspecs.exists, default=False),
+    'is_pantry': fieldspecs.Field(['img#pantry-badge',], post=fieldspecs.exists, default=False),
+    'has_sizechart': fieldspecs.Field(['a#size-chart-url',], post=fieldspecs.exists, default=False),
+    'meta_title': fieldspecs.Field(['meta[name=title]::attr(content)',]),
+    'meta_description': fieldspecs.Field(['meta[name=description]::attr(content)',]),
+    'meta_keywords': fieldspecs.Field(['meta[name=keywords]::attr(content)',]),
+})
+
+
+class AmazonItemParserContext(fieldspecs.ExtractionContext):
+    """ extraction context of a single amazon response. state: domain, job_id, asin,
+        trimmer (optional): pwbot.parsers.trimmer.HtmlTrimmer - the DOM is built of the
+        trimmed page, or of the whole page if it can't be trimmed. text and search()
+        are always of the whole page
+    """
+
+    trimmer = None
+
+    def __init__(self, response, **state):
+        super().__init__(response, **state)
+        self._script_data = None
+        self.trimmed = False
+
+    def _build_document(self):
+        trimmed = None
+        if self.trimmer is not None and trimmer.ascii_compatible(self.response.encoding):
+            trimmed = self.trimmer.trim(self.response.body)
+        if trimmed is None:
+            return super()._build_document()
+        self.trimmed = True
+        return backends.get_document_class(getattr(self, 'domain', None))(trimmed.decode(self.response.encoding, 'replace'))
+
+    @property
+    def script_data(self):
+        """ {name: decoded value} of the json embedded in inline scripts (_SCRIPT_DATA_SCANNER) - scanned once
+        """
+        if self._script_data is None:
+            # script bodies straight off the document. no selector object per script
+            self._script_data = _SCRIPT_DATA_SCANNER.scan(self.script_texts())
+        return self._script_data
 
 
 class AmazonItemParser(object):
-    _domain = None
-    _job_id = None
-    _asin = None
+    """ stateless - one instance (pwbot.parsers) parses every response. per page state is kept in AmazonItemParserContext
+    """
 
     def __init__(self):
         self.logger = logging.getLogger('pwbot.parsers.amazon_item_parser.AmazonItemParser')
 
     """ response scrapy.http.response.html.HtmlResponse
     """
-    def parse_item(self, response, domain, job_id, crawl_variations, lat=None, lng=None):
-        self._domain = domain
-        self._job_id = job_id
-        self._asin = utils.extract_sku_from_url(response.url, self._domain)
-        if not self._asin:
+    def parse_item(self, response, domain, job_id, crawl_variations, lat=None, lng=None, fields=None):
+        """ fields: None - every field. 'price' (FIELDS_PRICE) - price tracking, compact item:
+                    status, price, original price, quantity and title only
+        """
+        ctx = AmazonItemParserContext(response, domain=domain, job_id=job_id, asin=utils.extract_sku_from_url(response.url, domain),
+                    trimmer=(_AMAZON_PRICE_TRIMMER if fields == FIELDS_PRICE else _AMAZON_TRIMMER) if settings.PARSER_TRIM_AMAZON_HTML else None)
+        if not ctx.asin:
             self.logger.exception("[ASIN:null] Request Ignored - No ASIN")
             raise IgnoreRequest
 
@@ -33,36 +188,41 @@ class AmazonItemParser(object):
             # broken link or inactive amazon item
             amazon_item = ListingItem()
             amazon_item['url'] = response.request.url
-            amazon_item['domain'] = self._domain
+            amazon_item['domain'] = ctx.domain
             amazon_item['http_status'] = response.status
-            amazon_item['job_id'] = self._job_id
+            amazon_item['job_id'] = ctx.job_id
             yield amazon_item
         else:
-            # check variations first
-            """ TODO: __stored_variation_asins = amazon_parent_listings.asins in db
-            """
-            __variation_asins = self.__extract_variation_asins(response)
-            __stored_variation_asins = []
+            # check variations first. the family is expanded once per job - variation requests
+            # carry their parent asin, and pwbot.middlewares.VariationFamilyMiddleware drops the
+            # ones of families expanded by another page, or of asins scheduled already
+            __variation_asins = self.__extract_variation_asins(ctx)
             if crawl_variations:
                 if len(__variation_asins) > 0:
+                    __parent_asin = self.__extract_parent_asin(ctx)
                     for v_asin in __variation_asins:
-                        if v_asin not in __stored_variation_asins:
-                            """ TODO: change settings.AMAZON_ITEM_LINK_FORMAT.format(self._domain, v_asin, settings.AMAZON_ITEM_VARIATION_LINK_POSTFIX to real amazon url (db query) : avoid ban
+                        if v_asin != ctx.asin:
+                            """ TODO: change settings.AMAZON_ITEM_LINK_FORMAT.format(ctx.domain, v_asin, settings.AMAZON_ITEM_VARIATION_LINK_POSTFIX to real amazon url (db query) : avoid ban
                             """
-                            yield Request(settings.AMAZON_ITEM_LINK_FORMAT.format(self._domain, v_asin, settings.AMAZON_ITEM_VARIATION_LINK_POSTFIX),
+                            yield Request(settings.AMAZON_ITEM_LINK_FORMAT.format(ctx.domain, v_asin, settings.AMAZON_ITEM_VARIATION_LINK_POSTFIX),
                                     callback=parsers.parse_amazon_item,
                                     errback=parsers.resp_error_handler,
-                                    headers={'Referer': 'https://www.{}/'.format(self._domain),},
+                                    headers={'Referer': 'https://www.{}/'.format(ctx.domain),},
+                                    meta={
+                                        'variation_asin': v_asin,
+                                        'variation_parent_asin': __parent_asin,
+                                    },
                                     cb_kwargs={
-                                        'domain': self._domain,
-                                        'job_id': self._job_id,
+                                        'domain': ctx.domain,
+                                        'job_id': ctx.job_id,
                                         'crawl_variations': False,
                                         'lat': lat,
                                         'lng': lng,
+                                        'fields': fields,
                                     })
                     # self.logger.info("[ASIN:{}] Request Ignored - initial asin ignored".format(self._asin))
                     # raise IgnoreRequest
-            yield self.__parse_amazon_item(response, variation_asins=__variation_asins)
+            yield self.__parse_amazon_item(ctx, variation_asins=__variation_asins, fields=fields)
 
                     # if listing_item.get('has_sizechart', False) and not AmazonItemApparelModelManager.fetch_one(parent_asin=__parent_asin):
                     #     amazon_apparel_parser = AmazonApparelParser()
@@ -72,59 +232,66 @@ class AmazonItemParser(object):
                     #             dont_filter=True) # we have own filtering function: _filter_asins()
 
 
-    def __parse_amazon_item(self, response, variation_asins):
+    def __parse_amazon_item(self, ctx, variation_asins, fields=None):
+        response = ctx.response
         amazon_item = ListingItem()
         amazon_item['url'] = response.request.url
-        amazon_item['domain'] = self._domain
+        amazon_item['domain'] = ctx.domain
         amazon_item['http_status'] = response.status
-        amazon_item['job_id'] = self._job_id
+        amazon_item['job_id'] = ctx.job_id
 
-        _parent_asin = self.__extract_parent_asin(response)
+        _parent_asin = self.__extract_parent_asin(ctx)
         amazon_item['data'] = {
-            'asin': self._asin,
+            'asin': ctx.asin,
             'parent_asin': _parent_asin,
             'variation_asins': variation_asins,
         }
-        _price = self.__extract_price(response)
-        _quantity = self.__extract_quantity(response)
+        _price = self.__extract_price(ctx)
+        _quantity = self.__extract_quantity(ctx)
         if _price is None:
             amazon_item['data']['status'] = settings.RESOURCES_LISTING_ITEM_STATUS_NO_PRICE_GIVEN
         elif _quantity == 0:
             amazon_item['data']['status'] = settings.RESOURCES_LISTING_ITEM_STATUS_OUT_OF_STOCK
-        elif self.__extract_asin_on_content(response) != self._asin:
+        elif self.__extract_asin_on_content(ctx) != ctx.asin:
             # invalid asin
             amazon_item['data']['status'] = settings.RESOURCES_LISTING_ITEM_STATUS_INVALID_SKU
-        elif self._asin and _parent_asin and self._asin != _parent_asin and len(variation_asins) > 0 and self._asin not in variation_asins:
+        elif ctx.asin and _parent_asin and ctx.asin != _parent_asin and len(variation_asins) > 0 and ctx.asin not in variation_asins:
             # a variation, but removed - inactive this variation
             amazon_item['data']['status'] = settings.RESOURCES_LISTING_ITEM_STATUS_SKU_NOT_IN_VARIATION
         else:
             try:
-                amazon_item['data']['picture_urls'] = self.__extract_picture_urls(response)
-                amazon_item['data']['category'] = self.__extract_category(response)
-                amazon_item['data']['title'] = self.__extract_title(response)
-                amazon_item['data']['price'] = _price
-                amazon_item['data']['original_price'] = self.__extract_original_price(response, default_price=_price)
-                amazon_item['data']['quantity'] = _quantity
-                amazon_item['data']['features'] = self.__extract_features(response)
-                amazon_item['data']['description'] = self.__extract_description(response)
-                amazon_item['data']['specifications'] = self.__extract_specifications(response)
-                amazon_item['data']['variation_specifics'] = self.__extract_variation_specifics(response)
-                amazon_item['data']['is_fba'] = self.__extract_is_fba(response)
-                amazon_item['data']['review_count'] = self.__extract_review_count(response)
-                amazon_item['data']['avg_rating'] = self.__extract_avg_rating(response)
-                amazon_item['data']['is_addon'] = self.__extract_is_addon(response)
-                amazon_item['data']['is_pantry'] = self.__extract_is_pantry(response)
-                amazon_item['data']['is_pantry'] = self.__extract_is_pantry(response)
-                amazon_item['data']['has_sizechart'] = self.__extract_has_sizechart(response)
-                amazon_item['data']['merchant_id'] = self.__extract_merchant_id(response)
-                amazon_item['data']['merchant_name'] = self.__extract_merchant_name(response)
-                amazon_item['data']['brand_name'] = self.__extract_brand_name(response)
-                amazon_item['data']['meta_title'] = self.__extract_meta_title(response)
-                amazon_item['data']['meta_description'] = self.__extract_meta_description(response)
-                amazon_item['data']['meta_keywords'] = self.__extract_meta_keywords(response)
-                amazon_item['meta_data'] = self.__extract_meta_data(response)
+                if fields == FIELDS_PRICE:
+                    # price tracking - only what pwweb builds an item price from
+                    amazon_item['data']['title'] = self.__extract_title(ctx)
+                    amazon_item['data']['price'] = _price
+                    amazon_item['data']['original_price'] = self.__extract_original_price(ctx, default_price=_price)
+                    amazon_item['data']['quantity'] = _quantity
+                else:
+                    amazon_item['data']['picture_urls'] = self.__extract_picture_urls(ctx)
+                    amazon_item['data']['category'] = self.__extract_category(ctx)
+                    amazon_item['data']['title'] = self.__extract_title(ctx)
+                    amazon_item['data']['price'] = _price
+                    amazon_item['data']['original_price'] = self.__extract_original_price(ctx, default_price=_price)
+                    amazon_item['data']['quantity'] = _quantity
+                    amazon_item['data']['features'] = self.__extract_features(ctx)
+                    amazon_item['data']['description'] = self.__extract_description(ctx)
+                    amazon_item['data']['specifications'] = self.__extract_specifications(ctx)
+                    amazon_item['data']['variation_specifics'] = self.__extract_variation_specifics(ctx)
+                    amazon_item['data']['is_fba'] = self.__extract_is_fba(ctx)
+                    amazon_item['data']['review_count'] = self.__extract_review_count(ctx)
+                    amazon_item['data']['avg_rating'] = self.__extract_avg_rating(ctx)
+                    amazon_item['data']['is_addon'] = self.__extract_is_addon(ctx)
+                    amazon_item['data']['is_pantry'] = self.__extract_is_pantry(ctx)
+                    amazon_item['data']['has_sizechart'] = self.__extract_has_sizechart(ctx)
+                    amazon_item['data']['merchant_id'] = self.__extract_merchant_id(ctx)
+                    amazon_item['data']['merchant_name'] = self.__extract_merchant_name(ctx)
+                    amazon_item['data']['brand_name'] = self.__extract_brand_name(ctx)
+                    amazon_item['data']['meta_title'] = self.__extract_meta_title(ctx)
+                    amazon_item['data']['meta_description'] = self.__extract_meta_description(ctx)
+                    amazon_item['data']['meta_keywords'] = self.__extract_meta_keywords(ctx)
+                    amazon_item['meta_data'] = self.__extract_meta_data(ctx)
             except Exception as e:
-                self.logger.exception("{}: [ASIN:{}] Failed parsing page - {}".format(utils.class_fullname(e), self._asin, str(e)))
+                self.logger.exception("{}: [ASIN:{}] Failed parsing page - {}".format(utils.class_fullname(e), ctx.asin, str(e)))
                 amazon_item['data']['status'] = settings.RESOURCES_LISTING_ITEM_STATUS_PARSING_FAILED_UNKNOWN_ERROR
             else:
                 amazon_item['data']['status'] = settings.RESOURCES_LISTING_ITEM_STATUS_GOOD
@@ -167,29 +334,27 @@ class AmazonItemParser(object):
     #     amazon_item['_redirected_asins'] = {}
     #     return amazon_item
 
-    def __extract_asin_on_content(self, response):
-        try:
-            # get asin from Add To Cart button
-            return response.css('form#addToCart input[type=hidden][name=ASIN]::attr(value)').extract()[0]
-        except IndexError as e:
-            self.logger.exception("{}: [ASIN:{}] index error on parsing asin: ASIN at Add To Cart button missing - {}".format(utils.class_fullname(e), self._asin, str(e)))
-            return None
-        except Exception as e:
-            self.logger.exception("{}: [ASIN:{}] error on parsing asin at __extract_asin_on_content - {}".format(utils.class_fullname(e), self._asin, str(e)))
-            return None
-
-    def __extract_category(self, response):
+    def __extract_field(self, ctx, name, **kwargs):
+        """ AMAZON_FIELDS field. errors are logged - returns the field default
+        """
         try:
-            return ' : '.join(map(str.strip, response.css('#wayfinding-breadcrumbs_feature_div > ul li:not(.a-breadcrumb-divider) > span > a::text').extract()))
+            return AMAZON_FIELDS.extract(ctx, name, **kwargs)
         except Exception as e:
-            self.logger.exception("{}: [ASIN:{}] error on parsing category - {}".format(utils.class_fullname(e), self._asin, str(e)))
-            return None
-
-    def __extract_title(self, response):
+            self.logger.exception("{}: [ASIN:{}] error on parsing {} - {}".format(utils.class_fullname(e), ctx.asin, name.replace('_', ' '), str(e)))
+            return kwargs.get('default', AMAZON_FIELDS.fields[name].default)
+
+    def __extract_asin_on_content(self, ctx):
+        asin = self.__extract_field(ctx, 'asin_on_content')
+        if asin is None:
+            self.logger.error("[ASIN:{}] error on parsing asin: ASIN at Add To Cart button missing".format(ctx.asin))
+        return asin
+    def __extract_category(self, ctx):
+        return self.__extract_field(ctx, 'category')
+    def __extract_title(self, ctx):
         try:
-            summary_col = response.css('#centerCol')
+            summary_col = ctx.css('#centerCol')
             if len(summary_col) < 1:
-                summary_col = response.css('#leftCol')
+                summary_col = ctx.css('#leftCol')
             if len(summary_col) < 1:
                 raise Exception("No title element found")
             title = None
@@ -200,66 +365,47 @@ class AmazonItemParser(object):
                     title = title_element[1].extract().strip()
                 return title
         except Exception as e:
-            self.logger.exception("{}: [ASIN:{}] error on parsing title - {}".format(utils.class_fullname(e), self._asin, str(e)))
+            self.logger.exception("{}: [ASIN:{}] error on parsing title - {}".format(utils.class_fullname(e), ctx.asin, str(e)))
             return None
 
-    def __extract_features(self, response):
+    def __extract_features(self, ctx):
         try:
-            feature_block = response.css('#feature-bullets')
+            feature_block = ctx.css('#feature-bullets')
             if len(feature_block) < 1:
-                feature_block = response.css('#fbExpandableSectionContent')
+                feature_block = ctx.css('#fbExpandableSectionContent')
             if len(feature_block) < 1:
                 return None
-            ret = ''
             features = feature_block.css('li:not(#replacementPartsFitmentBullet)')
-            if len(features) > 0:
-                ret = '<div id="feature-bullets" class="a-section a-spacing-medium a-spacing-top-small"><ul class="a-vertical a-spacing-none">'
-                for each_feature in features:
-                    ret = ret + utils.trim_emojis(each_feature.extract().strip())
-                ret = ret + '</ul></div>'
-            return utils.replace_html_anchors_to_spans(ret)
+            if len(features) < 1:
+                return ''
+            return _FEATURES_SANITIZER.sanitize([f.root for f in features], wrapper=_FEATURES_WRAPPER)
         except Exception as e:
-            self.logger.exception("{}: [ASIN:{}] error on parsing features - {}".format(utils.class_fullname(e), self._asin, str(e)))
+            self.logger.exception("{}: [ASIN:{}] error on parsing features - {}".format(utils.class_fullname(e), ctx.asin, str(e)))
             return None
 
-    def __extract_description_helper(self, response):
-        try:
-            description_block = response.css('#productDescription .productDescriptionWrapper')
-            if len(description_block) < 1:
-                description_block = response.css('#productDescription')
-            if len(description_block) < 1:
-                description_block = response.css('#descriptionAndDetails .productDescriptionWrapper')
-            if len(description_block) < 1:
-                description_block = response.css('#aplus .aplus-v2')
-            if len(description_block) < 1:
-                return None
-            description = description_block[0].extract()
-            disclaim_block = description_block.css('.disclaim')
-            if len(disclaim_block) > 0:
-                disclaim = description_block.css('.disclaim')[0].extract()
-                description.replace(disclaim, '')
-            return utils.replace_html_anchors_to_spans(description.strip())
-        except Exception as e:
-            raise e
+    def __extract_description_helper(self, ctx, iframe_html=None):
+        if iframe_html is not None:
+            description_blocks = _iframe_description_blocks(iframe_html)
+        else:
+            description_blocks = AMAZON_FIELDS.extract(ctx, 'description_blocks')
+        if description_blocks is None:
+            return None
+        return _DESCRIPTION_SANITIZER.sanitize(description_blocks[:1]).strip()
 
-    def __extract_description(self, response):
+    def __extract_description(self, ctx):
         try:
-            m = re.search(r"var iframeContent = \"(.+)\";\n", response.text)
+            m = ctx.search(_RE_IFRAME_CONTENT)
             if m:
-                description_iframe_str = urllib.parse.unquote(m.group(1))
-                from scrapy.http import HtmlResponse
-                description_iframe_response = HtmlResponse(url="description_iframe_string", body=description_iframe_str)
-                return self.__extract_description_helper(description_iframe_response)
+                return self.__extract_description_helper(ctx, iframe_html=urllib.parse.unquote(m.group(1)))
             else:
-                return self.__extract_description_helper(response)
-            return None
+                return self.__extract_description_helper(ctx)
         except Exception as e:
-            self.logger.exception("{}: [ASIN:{}] error on parsing description - {}".format(utils.class_fullname(e), self._asin, str(e)))
+            self.logger.exception("{}: [ASIN:{}] error on parsing description - {}".format(utils.class_fullname(e), ctx.asin, str(e)))
             return None
 
-    def __extract_specifications(self, response):
+    def __extract_specifications(self, ctx):
         try:
-            prod_det_tables = response.css('#prodDetails table.prodDetTable')
+            prod_det_tables = ctx.css('#prodDetails table.prodDetTable')
             specs = []
             for prod_det_table in prod_det_tables:
                 spec_entries = prod_det_table.css('tr')
@@ -274,177 +420,67 @@ class AmazonItemParser(object):
                 return json.dumps(specs)
             return None
         except Exception as e:
-            self.logger.exception("{}: [ASIN:{}] error on parsing specifications - {}".format(utils.class_fullname(e), self._asin, str(e)))
+            self.logger.exception("{}: [ASIN:{}] error on parsing specifications - {}".format(utils.class_fullname(e), ctx.asin, str(e)))
             return None
 
-    def __extract_review_count(self, response):
+    def __extract_review_count(self, ctx):
+        return self.__extract_field(ctx, 'review_count')
+    def __extract_avg_rating(self, ctx):
+        return self.__extract_field(ctx, 'avg_rating')
+    def __extract_is_addon(self, ctx):
+        return self.__extract_field(ctx, 'is_addon')
+    def __extract_is_pantry(self, ctx):
+        return self.__extract_field(ctx, 'is_pantry')
+    def __extract_has_sizechart(self, ctx):
+        return self.__extract_field(ctx, 'has_sizechart')
+    def __extract_is_fba(self, ctx):
         try:
-            if len(response.css('#summaryStars a::text')) > 0:
-                return utils.extract_int(response.css('#summaryStars a::text')[1].extract().replace(',', '').strip())
-            elif len(response.css('#acrCustomerReviewText::text')) > 0:
-                if len(response.css('#acrCustomerReviewText::text')) == 1:
-                    return utils.extract_int(response.css('#acrCustomerReviewText::text')[0].extract().replace(',', '').replace('customer reviews', '').replace('customer review', '').strip())
-                else:
-                    return utils.extract_int(response.css('#acrCustomerReviewText::text')[1].extract().replace(',', '').replace('customer reviews', '').replace('customer review', '').strip())
-            else:
-                return 0
-        except IndexError as e:
-            self.logger.exception("{}: [ASIN:{}] index error on parsing review count - {}".format(utils.class_fullname(e), self._asin, str(e)))
-            return 0
-        except Exception as e:
-            self.logger.exception("{}: [ASIN:{}] error on parsing review count - {}".format(utils.class_fullname(e), self._asin, str(e)))
-            return 0
-
-    def __extract_avg_rating(self, response):
-        try:
-            if len(response.css('#avgRating a > span::text')) > 0:
-                return float(response.css('#avgRating a > span::text')[0].extract().replace('out of 5 stars', '').strip())
-            elif len(response.css('#acrPopover a > i > span::text')) > 0:
-                return float(response.css('#acrPopover a > i > span::text')[0].extract().replace('out of 5 stars', '').strip())
-            else:
-                return 0.0
-        except IndexError as e:
-            self.logger.exception("{}: [ASIN:{}] index error on parsing average rating - {}".format(utils.class_fullname(e), self._asin, str(e)))
-            return 0.0
-        except Exception as e:
-            self.logger.exception("{}: [ASIN:{}] error on parsing average rating - {}".format(utils.class_fullname(e), self._asin, str(e)))
-            return 0.0
-
-    def __extract_is_addon(self, response):
-        try:
-            addon = response.css('#addOnItem_feature_div i.a-icon-addon')
-            return True if len(addon) > 0 else False
-        except Exception as e:
-            self.logger.exception("{}: [ASIN:{}] error on parsing addon - {}".format(utils.class_fullname(e), self._asin, str(e)))
-            return False
-
-    def __extract_is_pantry(self, response):
-        try:
-            pantry = response.css('img#pantry-badge')
-            return True if len(pantry) > 0 else False
-        except Exception as e:
-            self.logger.exception("{}: [ASIN:{}] error on parsing pantry - {}".format(utils.class_fullname(e), self._asin, str(e)))
-            return False
-
-    def __extract_has_sizechart(self, response):
-        try:
-            sizechart = response.css('a#size-chart-url')
-            return True if len(sizechart) > 0 else False
-        except Exception as e:
-            self.logger.exception("{}: [ASIN:{}] error on parsing size chart - {}".format(utils.class_fullname(e), self._asin, str(e)))
-            return False
-
-    def __extract_is_fba(self, response):
-        try:
-            element = response.css('#merchant-info::text')
-            if len(element) > 0 and 'sold by {}'.format(self._domain) in element[0].extract().strip().lower():
-                if self.__double_check_prime(response):
+            element = ctx.css('#merchant-info::text')
+            if len(element) > 0 and 'sold by {}'.format(ctx.domain) in element[0].extract().strip().lower():
+                if self.__double_check_prime(ctx):
                     return True
-            element = response.css('#merchant-info a#SSOFpopoverLink::text')
+            element = ctx.css('#merchant-info a#SSOFpopoverLink::text')
             if len(element) > 0 and 'fulfilled by amazon' in element[0].extract().strip().lower():
-                if self.__double_check_prime(response):
+                if self.__double_check_prime(ctx):
                     return True
-            element = response.css('#merchant-info #pe-text-availability-merchant-info::text')
-            if len(element) > 0 and 'sold by {}'.format(self._domain) in element[0].extract().strip().lower():
-                if self.__double_check_prime(response):
+            element = ctx.css('#merchant-info #pe-text-availability-merchant-info::text')
+            if len(element) > 0 and 'sold by {}'.format(ctx.domain) in element[0].extract().strip().lower():
+                if self.__double_check_prime(ctx):
                     return True
             return False
         except Exception as e:
-            self.logger.exception("{}: [ASIN:{}] error on parsing FBA - {}".format(utils.class_fullname(e), self._asin, str(e)))
+            self.logger.exception("{}: [ASIN:{}] error on parsing FBA - {}".format(utils.class_fullname(e), ctx.asin, str(e)))
             return False
 
-    def __double_check_prime(self, response):
+    def __double_check_prime(self, ctx):
         # some fba are not prime
-        return response.text.find('bbop-check-box') > 0 or len(response.css('#pe-bb-signup-button')) > 0 or (len(response.css('#ourprice_shippingmessage span b::text')) > 0 and response.css('#ourprice_shippingmessage span b::text')[0].extract().strip().lower() == 'free shipping')
-
-    def __extract_price(self, response):
-        # 1. check deal price block first
-        # 2. check sale price block second
-        # 3. if no deal/sale price block exists, check our price block
-        try:
-            price_element = None
-            if len(response.css('#priceblock_dealprice::text')) > 0:
-                price_element = response.css('#priceblock_dealprice::text')
-            elif len(response.css('#priceblock_saleprice::text')) > 0:
-                price_element = response.css('#priceblock_saleprice::text')
-            elif len(response.css('#priceblock_ourprice::text')) > 0:
-                price_element = response.css('#priceblock_ourprice::text')
-            elif len(response.css('#buyNewSection span.a-color-price.offer-price::text')) > 0:
-                price_element = response.css('#buyNewSection span.a-color-price.offer-price::text')
-
-            if not price_element:
-                self.logger.info("[ASIN:{}] No price element found".format(self._asin))
-                return None
-            else:
-                price_string = price_element[0].extract().strip()
-                return utils.money_to_float(price_string)
-        except Exception as e:
-            self.logger.exception("{}: [ASIN:{}] error on parsing price - {}".format(utils.class_fullname(e), self._asin, str(e)))
-            return None
-
-    def __extract_original_price(self, response, default_price):
-        try:
-            original_price_element = response.css('#price table tr td span.a-text-strike::text')
-            if len(original_price_element) < 1:
-                return default_price
-            else:
-                original_price_string = original_price_element[0].extract().strip()
-                return utils.money_to_float(original_price_string)
-        except Exception as e:
-            self.logger.exception("{}: [ASIN:{}] error on parsing market price - {}".format(utils.class_fullname(e), self._asin, str(e)))
-            return default_price
-
-    def __extract_quantity(self, response):
-        try:
-            quantity = 0
-            element = response.css('#availability:not(.a-hidden) span::text')
-            if len(element) < 1:
-                element = response.css('#availability:not(.a-hidden)::text')
-            if len(element) < 1:
-                element = response.css('#pantry-availability:not(.a-hidden) span::text')
-            if len(element) < 1:
-                return quantity # element not found
-
-            element_text = element[0].extract().strip().lower()
-            if 'out' in element_text:
-                quantity = 0 # out of stock
-            elif 'only' in element_text:
-                if 'more on the way' in element_text:
-                    quantity = 1000 # enough stock
-                else:
-                    quantity = utils.extract_int(element_text)
-            elif 'in stock on' in element_text: # will be stock on someday... so currently out of stock...
-                quantity = 0
-            elif 'will be released on' in element_text: # will be released on someday... so currently out of stock...
-                quantity = 0
-            elif 'usually ships within' in element_text: # delay shipping... so currently out of stock...
-                quantity = 0
-            else:
-                quantity = 1000 # enough stock
-            return quantity
-        except Exception as e:
-            self.logger.exception("{}: [ASIN:{}] error on parsing quantity - {}".format(utils.class_fullname(e), self._asin, str(e)))
-            return 0
-
-    def __extract_parent_asin(self, response):
+        return ctx.text.find('bbop-check-box') > 0 or len(ctx.css('#pe-bb-signup-button')) > 0 or (len(ctx.css('#ourprice_shippingmessage span b::text')) > 0 and ctx.css('#ourprice_shippingmessage span b::text')[0].extract().strip().lower() == 'free shipping')
+
+    def __extract_price(self, ctx):
+        price = self.__extract_field(ctx, 'price')
+        if price is None:
+            self.logger.info("[ASIN:{}] No price element found".format(ctx.asin))
+        return price
+    def __extract_original_price(self, ctx, default_price):
+        return self.__extract_field(ctx, 'original_price', default=default_price)
+    def __extract_quantity(self, ctx):
+        return self.__extract_field(ctx, 'quantity')
+    def __extract_parent_asin(self, ctx):
         ret = None
         try:
-            m = re.search(r"\"parent_asin\":\"([A-Z0-9]{10})\"", response.text)
-            if m:
-                ret = m.group(1)
+            parent_asin = ctx.script_data.get('parent_asin')
+            if isinstance(parent_asin, str) and _RE_ASIN.match(parent_asin):
+                ret = parent_asin
             return ret
         except Exception as e:
-            self.logger.exception("{}: [ASIN:{}] error on parsing parent asin - {}".format(utils.class_fullname(e), self._asin, str(e)))
+            self.logger.exception("{}: [ASIN:{}] error on parsing parent asin - {}".format(utils.class_fullname(e), ctx.asin, str(e)))
             return None
 
-    def __extract_picture_urls(self, response):
+    def __extract_picture_urls(self, ctx):
         ret = []
         try:
-            m = re.search(r"'colorImages': \{(.+)\},\n", response.text)
-            if m:
-                # work with json
-                json_dump = "{%s}" % m.group(1).replace('\'', '"')
-                image_data = json.loads(json_dump)
+            image_data = ctx.script_data.get('color_images')
+            if isinstance(image_data, dict):
                 for key in image_data:
                     images = image_data[key]
                     for image in images:
@@ -457,7 +493,7 @@ class AmazonItemParser(object):
             if len(ret) > 0:
                 return ret
             else:
-                original_image_url = response.css('#main-image-container > ul li.image.item img::attr(src)')
+                original_image_url = ctx.css('#main-image-container > ul li.image.item img::attr(src)')
                 # try primary image url
                 converted_picture_url = re.sub(settings.AMAZON_ITEM_IMAGE_CONVERT_PATTERN_FROM, settings.AMAZON_ITEM_IMAGE_CONVERT_STRING_TO_PRIMARY, original_image_url)
                 if not utils.validate_image_size(converted_picture_url):
@@ -469,47 +505,47 @@ class AmazonItemParser(object):
                     ret.append(converted_picture_url)
                 return ret
         except Exception as e:
-            self.logger.exception("{}: [ASIN:{}] error on parsing item pictures - {}".format(utils.class_fullname(e), self._asin, str(e)))
+            self.logger.exception("{}: [ASIN:{}] error on parsing item pictures - {}".format(utils.class_fullname(e), ctx.asin, str(e)))
             return []
 
-    def __extract_merchant_id(self, response):
+    def __extract_merchant_id(self, ctx):
         try:
-            if len(response.css('#merchant-info::text')) > 0 and self._domain in response.css('#merchant-info::text')[0].extract().strip().lower():
+            if len(ctx.css('#merchant-info::text')) > 0 and ctx.domain in ctx.css('#merchant-info::text')[0].extract().strip().lower():
                 return None
-            element = response.css('#merchant-info a:not(#SSOFpopoverLink)::attr(href)')
+            element = ctx.css('#merchant-info a:not(#SSOFpopoverLink)::attr(href)')
             if len(element) > 0:
                 uri = element[0].extract().strip()
                 return utils.extract_seller_id_from_uri(uri)
             return None
         except Exception as e:
-            self.logger.exception("{}: [ASIN:{}] error on parsing merchant id - {}".format(utils.class_fullname(e), self._asin, str(e)))
+            self.logger.exception("{}: [ASIN:{}] error on parsing merchant id - {}".format(utils.class_fullname(e), ctx.asin, str(e)))
             return None
 
-    def __extract_merchant_name(self, response):
+    def __extract_merchant_name(self, ctx):
         try:
-            if len(response.css('#merchant-info::text')) > 0 and self._domain in response.css('#merchant-info::text')[0].extract().strip().lower():
-                return self._domain
-            element = response.css('#merchant-info a:not(#SSOFpopoverLink)::text')
+            if len(ctx.css('#merchant-info::text')) > 0 and ctx.domain in ctx.css('#merchant-info::text')[0].extract().strip().lower():
+                return ctx.domain
+            element = ctx.css('#merchant-info a:not(#SSOFpopoverLink)::text')
             if len(element) > 0:
                 return element[0].extract().strip()
             return None
         except Exception as e:
-            self.logger.exception("{}: [ASIN:{}] error on parsing merchant name - {}".format(utils.class_fullname(e), self._asin, str(e)))
+            self.logger.exception("{}: [ASIN:{}] error on parsing merchant name - {}".format(utils.class_fullname(e), ctx.asin, str(e)))
             return None
 
-    def __extract_brand_name(self, response):
+    def __extract_brand_name(self, ctx):
         brand = None
-        if len(response.css('#brand')) > 0:
+        if len(ctx.css('#brand')) > 0:
             try:
-                if len(response.css('#brand::text')) > 0:
-                    brand = response.css('#brand::text')[0].extract().strip()
+                if len(ctx.css('#brand::text')) > 0:
+                    brand = ctx.css('#brand::text')[0].extract().strip()
             except Exception:
                 brand = None
             if brand is not None and brand != '':
                 return brand
             try:
-                if len(response.css('#brand::attr(href)')) > 0:
-                    brand_url = response.css('#brand::attr(href)')[0].extract().strip()
+                if len(ctx.css('#brand::attr(href)')) > 0:
+                    brand_url = ctx.css('#brand::attr(href)')[0].extract().strip()
                     if brand_url:
                         urlquerys = urllib.parse.parse_qs(urllib.parse.urlparse(brand_url).query)
                         if 'field-lbr_brands_browse-bin' in urlquerys:
@@ -518,17 +554,17 @@ class AmazonItemParser(object):
                 brand = None
             if brand is not None and brand != '':
                 return brand
-        elif len(response.css('#bylineInfo')) > 0:
+        elif len(ctx.css('#bylineInfo')) > 0:
             try:
-                if len(response.css('#bylineInfo::text')) > 0:
-                    brand = response.css('#bylineInfo::text')[0].extract().strip()
+                if len(ctx.css('#bylineInfo::text')) > 0:
+                    brand = ctx.css('#bylineInfo::text')[0].extract().strip()
             except Exception:
                 brand = None
             if brand is not None and brand != '':
                 return brand
             try:
-                if len(response.css('#bylineInfo::attr(href)')) > 0:
-                    brand_url = response.css('#bylineInfo::attr(href)')[0].extract().strip()
+                if len(ctx.css('#bylineInfo::attr(href)')) > 0:
+                    brand_url = ctx.css('#bylineInfo::attr(href)')[0].extract().strip()
                     if brand_url:
                         urlquerys = urllib.parse.parse_qs(urllib.parse.urlparse(brand_url).query)
                         if 'field-lbr_brands_browse-bin' in urlquerys:
@@ -539,121 +575,43 @@ class AmazonItemParser(object):
                 return brand
         return None
 
-    def __extract_meta_data(self, response):
+    def __extract_meta_data(self, ctx):
         meta_data = {}
-        for _m in response.xpath("//meta/@name"):  # has 'name' attributes?
-            _attr = _m.extract()
-            try:
-                meta_data[_attr] = response.xpath(f"//meta[@name='{_attr}']/@content")[0].extract()
-            except IndexError as e:
-                self.logger.exception(f"{utils.class_fullname(e)}: [ASIN:{self._asin}] index error on parsing meta {_attr} - {str(e)}")
-        for _m in response.xpath("//meta/@property"):  # has 'property' attributes?
-            _attr = _m.extract()
-            try:
-                meta_data[_attr] = response.xpath(f"//meta[@property='{_attr}']/@content")[0].extract()
-            except IndexError as e:
-                self.logger.exception(f"{utils.class_fullname(e)}: [ASIN:{self._asin}] index error on parsing meta {_attr} - {str(e)}")
+        # one pass over <meta> elements. the first content given to a name/property wins
+        for _m in ctx.css('meta[name], meta[property]'):
+            for _attr in [_m.attrib.get('name'), _m.attrib.get('property'),]:
+                if _attr is None or _attr in meta_data:
+                    continue
+                if 'content' in _m.attrib:
+                    meta_data[_attr] = _m.attrib['content']
         return meta_data
 
-    def __extract_meta_title(self, response):
-        try:
-            if len(response.xpath("//meta[@name='title']/@content")) > 0:
-                return response.xpath("//meta[@name='title']/@content")[0].extract()
-            else:
-                return None
-        except IndexError as e:
-            self.logger.exception("{}: [ASIN:{}] index error on parsing meta title - {}".format(utils.class_fullname(e), self._asin, str(e)))
-            return None
-        except Exception as e:
-            self.logger.exception("{}: [ASIN:{}] error on parsing meta title - {}".format(utils.class_fullname(e), self._asin, str(e)))
-            return None
-
-    def __extract_meta_description(self, response):
-        try:
-            if len(response.xpath("//meta[@name='description']/@content")) > 0:
-                return response.xpath("//meta[@name='description']/@content")[0].extract()
-            else:
-                return None
-        except IndexError as e:
-            self.logger.exception("{}: [ASIN:{}] index error on parsing meta description - {}".format(utils.class_fullname(e), self._asin, str(e)))
-            return None
-        except Exception as e:
-            self.logger.exception("{}: [ASIN:{}] error on parsing meta description - {}".format(utils.class_fullname(e), self._asin, str(e)))
-            return None
-
-    def __extract_meta_keywords(self, response):
-        try:
-            if len(response.xpath("//meta[@name='keywords']/@content")) > 0:
-                return response.xpath("//meta[@name='keywords']/@content")[0].extract()
-            else:
-                return None
-        except IndexError as e:
-            self.logger.exception("{}: [ASIN:{}] index error on parsing meta keywords - {}".format(utils.class_fullname(e), self._asin, str(e)))
-            return None
-        except Exception as e:
-            self.logger.exception("{}: [ASIN:{}] error on parsing meta keywords - {}".format(utils.class_fullname(e), self._asin, str(e)))
-            return None
-
-    def __extract_variation_asins(self, response):
+    def __extract_meta_title(self, ctx):
+        return self.__extract_field(ctx, 'meta_title')
+    def __extract_meta_description(self, ctx):
+        return self.__extract_field(ctx, 'meta_description')
+    def __extract_meta_keywords(self, ctx):
+        return self.__extract_field(ctx, 'meta_keywords')
+    def __extract_variation_asins(self, ctx):
         ret = []
-        m = re.search(r"\"asin_variation_values\":(\{.+?(?=\}\})\}\})", response.text)
-        if m:
-            try:
-                json_dump = m.group(1)
-                variations_data = json.loads(json_dump)
-                ret = list(variations_data.keys())
-            except Exception:
-                ret = []
-        if len(ret) < 1:
-            m = re.search(r"\"asinVariationValues\" : (\{.+?(?=\}\})\}\})", response.text)
-            if m:
-                try:
-                    json_dump = m.group(1)
-                    variations_data = json.loads(json_dump)
-                    ret = list(variations_data.keys())
-                except Exception:
-                    ret = []
+        variations_data = ctx.script_data.get('asin_variation_values')
+        if isinstance(variations_data, dict):
+            ret = list(variations_data.keys())
         if len(ret) < 1:
-            self.logger.warning("[ASIN:{}] error on parsing variation asins - unable to parse either asin_variation_values or asinVariationValues".format(self._asin))
+            self.logger.warning("[ASIN:{}] error on parsing variation asins - unable to parse either asin_variation_values or asinVariationValues".format(ctx.asin))
         return ret
 
-    def __extract_variation_specifics(self, response):
+    def __extract_variation_specifics(self, ctx):
         ret = {}
         # variation labels
-        variation_labels = {}
-        l = re.search(r"\"variationDisplayLabels\":(\{.+?(?=\})\})", response.text)
-        if l:
-            try:
-                variation_labels = json.loads(l.group(1))
-            except Exception:
-                variation_labels = {}
-        if not variation_labels:
-            l = re.search(r"\"variationDisplayLabels\" : (\{.+?(?=\})\})", response.text)
-            if l:
-                try:
-                    variation_labels = json.loads(l.group(1))
-                except Exception:
-                    variation_labels = {}
-        if not variation_labels:
-            self.logger.warning("[ASIN:{}] error on parsing variation specifics - unable to parse variationDisplayLabels".format(self._asin))
+        variation_labels = ctx.script_data.get('variation_display_labels')
+        if not variation_labels or not isinstance(variation_labels, dict):
+            self.logger.warning("[ASIN:{}] error on parsing variation specifics - unable to parse variationDisplayLabels".format(ctx.asin))
             return None
         # selected variations
-        selected_variations = {}
-        m = re.search(r"\"selected_variations\":(\{.+?(?=\})\})", response.text)
-        if m:
-            try:
-                selected_variations = json.loads(m.group(1))
-            except Exception:
-                selected_variations = {}
-        if not selected_variations:
-            m = re.search(r"\"selected_variations\" : (\{.+?(?=\})\})", response.text)
-            if m:
-                try:
-                    selected_variations = json.loads(m.group(1))
-                except Exception:
-                    selected_variations = {}
-        if not selected_variations:
-            self.logger.warning("[ASIN:{}] error on parsing variation specifics - unable to parse selected_variations".format(self._asin))
+        selected_variations = ctx.script_data.get('selected_variations')
+        if not selected_variations or not isinstance(selected_variations, dict):
+            self.logger.warning("[ASIN:{}] error on parsing variation specifics - unable to parse selected_variations".format(ctx.asin))
             return None
         for v_key, v_val in variation_labels.items():
             if v_key not in selected_variations:
@@ -662,19 +620,19 @@ class AmazonItemParser(object):
             ret[v_val] = selected_variations[v_key]
         return json.dumps(ret)
 
-    def __extract_redirected_asins(self, response):
+    def __extract_redirected_asins(self, ctx):
         try:
             redirected_asins = {}
-            redirect_urls = response.request.meta.get('redirect_urls', [])
+            redirect_urls = ctx.response.request.meta.get('redirect_urls', [])
             if len(redirect_urls) > 0:
                 index = 0
                 for r_url in redirect_urls:
-                    r_asin = utils.extract_sku_from_url(r_url, self._domain)
-                    if r_asin == self._asin:
+                    r_asin = utils.extract_sku_from_url(r_url, ctx.domain)
+                    if r_asin == ctx.asin:
                         continue
                     redirected_asins[index] = r_asin
                     index += 1
             return redirected_asins
         except Exception as e:
-            self.logger.exception("{}: [ASIN:{}] error on parsing redirected asins - {}".format(utils.class_fullname(e), self._asin, str(e)))
+            self.logger.exception("{}: [ASIN:{}] error on parsing redirected asins - {}".format(utils.class_fullname(e), ctx.asin, str(e)))
             return {}
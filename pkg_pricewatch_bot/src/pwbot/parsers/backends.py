@@ -0,0 +1,168 @@
+""" pwbot.parsers.backends
+
+    html document backends - the parser a page is parsed with, chosen per
+    domain (settings.PARSER_HTML_BACKENDS, domains not listed: lxml).
+
+        lxml    parsel/lxml (libxml2) - the default
+        lexbor  selectolax (lexbor html5 parser), if installed. css selectors,
+                including parsel's ::text and ::attr(name) pseudo elements,
+                run on lexbor. xpath (ctx.xpath, fieldspecs.XPath, ctx.select)
+                runs on an lxml tree of the same page, built the first time it
+                is needed - same results, without the speed up
+
+    a document is built once per page by fieldspecs.ExtractionContext. css
+    results are lists of strings and nodes - fieldspecs.to_html() serializes
+    either kind of node. ExtractionContext.css() wraps them into selectors
+    with the parsel api the parsers use (css, extract/get, attrib, indexing).
+
+    the backends build different trees of broken html, and serialize html
+    differently, so a domain is switched to lexbor only once
+    pwbot.tests.parity_backends shows the same items as lxml.
+"""
+
+import re
+import logging
+from parsel import Selector, SelectorList
+from pwbot import settings
+from pwbot.parsers import fieldspecs
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+# css ending with a parsel pseudo element - 'span.price::text', 'a::attr(href)'
+_RE_PSEUDO_ELEMENT = re.compile(r'^(.*?)::(?:(text)|attr\(([^)]+)\))\s*$', re.DOTALL)
+
+logger = logging.getLogger('pwbot.parsers.backends')
+_warned = set()
+
+
+class LxmlDocument(object):
+    name = 'lxml'
+
+    def __init__(self, text=None, root=None):
+        self.root = root if root is not None else Selector(text=text, type='html').root
+
+    @property
+    def lxml_root(self):
+        return self.root
+
+    def select_css(self, query, node=None):
+        result = fieldspecs.compile_css(query)(self.root if node is None else node)
+        return result if isinstance(result, list) else [result]
+
+    def selector_list(self, values):
+        return SelectorList([Selector(root=v, type='html') for v in values])
+
+    def script_texts(self):
+        """ bodies of the inline scripts
+        """
+        return [el.text for el in self.root.iter('script') if el.text and 'src' not in el.attrib]
+
+
+class LexborDocument(object):
+    name = 'lexbor'
+
+    def __init__(self, text):
+        self.text = text
+        self.tree = LexborHTMLParser(text)
+        self._lxml_root = None
+
+    @property
+    def lxml_root(self):
+        """ lxml tree of the same page - for xpath
+        """
+        if self._lxml_root is None:
+            self._lxml_root = Selector(text=self.text, type='html').root
+        return self._lxml_root
+
+    def select_css(self, query, node=None):
+        return lexbor_css(self.tree if node is None else node, query)
+
+    def selector_list(self, values):
+        return LexborSelectorList([LexborSelector(v) for v in values])
+
+    def script_texts(self):
+        return [text for text in (s.text(deep=True) for s in self.tree.css('script') if 'src' not in s.attributes) if text]
+
+
+def lexbor_css(node, query):
+    """ parsel css on a lexbor node - elements, or strings for ::text/::attr(name)
+    """
+    m = _RE_PSEUDO_ELEMENT.match(query)
+    if m is None:
+        return node.css(query)
+    if '::' in m.group(1):
+        raise ValueError('pseudo elements in a selector group are not supported - {}'.format(query))
+    if not m.group(1).strip():
+        raise ValueError('pseudo elements without an element selector are not supported - {}'.format(query))
+    elements = node.css(m.group(1))
+    if m.group(2):
+        # text nodes directly under the element, one value each - text()
+        return [child.text_content for element in elements for child in element.iter(include_text=True) if child.tag == '-text']
+    ret = []
+    for element in elements:
+        attributes = element.attributes
+        if m.group(3) in attributes:
+            # attribute without a value - '' as lxml
+            ret.append(attributes[m.group(3)] or '')
+    return ret
+
+
+class LexborSelector(object):
+    """ the parsel.Selector api the parsers use, on a lexbor node or a string
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def css(self, query):
+        if isinstance(self.root, str):
+            return LexborSelectorList()
+        return LexborSelectorList([LexborSelector(v) for v in lexbor_css(self.root, query)])
+
+    def get(self):
+        return fieldspecs.to_html(self.root)
+    extract = get
+
+    @property
+    def attrib(self):
+        if isinstance(self.root, str):
+            return {}
+        return {k: v or '' for k, v in self.root.attributes.items()}
+
+
+class LexborSelectorList(list):
+    def css(self, query):
+        return LexborSelectorList([s for selector in self for s in selector.css(query)])
+
+    def getall(self):
+        return [selector.get() for selector in self]
+    extract = getall
+
+    def get(self, default=None):
+        return self[0].get() if len(self) > 0 else default
+    extract_first = get
+
+
+def available():
+    """ names of the backends installed
+    """
+    return ['lxml',] + (['lexbor',] if LexborHTMLParser is not None else [])
+
+
+def get_document_class(domain=None, name=None):
+    """ name: backend name. default: settings.PARSER_HTML_BACKENDS of the domain, or lxml
+    """
+    name = name or settings.PARSER_HTML_BACKENDS.get(domain, 'lxml')
+    if name == 'lexbor':
+        if LexborHTMLParser is not None:
+            return LexborDocument
+        if name not in _warned:
+            _warned.add(name)
+            logger.warning('lexbor html backend requested, but selectolax is not installed - lxml used')
+    elif name != 'lxml':
+        raise ValueError('unknown html backend - {}'.format(name))
+    return LxmlDocument
+
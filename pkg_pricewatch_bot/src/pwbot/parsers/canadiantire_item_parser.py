@@ -1,112 +1,127 @@
 """ pwbot.parsers.canadiantire_item_parser
 """
 
-import json
 import logging
 import urllib.parse
 from scrapy.http import JsonRequest, Request
 from scrapy.exceptions import IgnoreRequest
 from pwbot import settings, utils, parsers
 from pwbot.items import ListingItem
+from pwbot.parsers import fastjson, fieldspecs
+
+# data components read by the parsers and pwweb (resources.modelBuilders). others are not decoded
+CANADIANTIRE_CA_DATA_COMPONENTS = ['SkuSelectors', 'ProductStickyToc', 'BrandLogoLink',]
 
 
 class CanadiantireCaItemParser(object):
-    _domain = None
-    _job_id = None
-    _sku = None
-    _parent_sku = None
-    _referer_for_jsonrequest = None
+    """ stateless - one instance (pwbot.parsers) parses every response. per page state is kept in fieldspecs.ExtractionContext,
+        and passed to the api callbacks by cb_kwargs
+    """
 
     def __init__(self):
         self.logger = logging.getLogger(utils.class_fullname(self))
 
-    def __get_preloaded_data_components(self, response):
+    def __get_preloaded_data_components(self, ctx):
         _data = {}
-        for _dcomp in response.xpath('//@data-component').extract():
-            _xpath_dconf = response.xpath('//*[@data-component="{}"]/@data-config'.format(_dcomp))
-            if len(_xpath_dconf) > 0:
-                _data[_dcomp] = json.loads(_xpath_dconf[0].extract())
+        # one pass over the components. the first config of a component wins
+        for _el in ctx.xpath('//*[@data-component and @data-config]'):
+            _dcomp = _el.attrib['data-component']
+            if _dcomp in _data or (settings.PARSER_PRUNE_EMBEDDED_DATA and _dcomp not in CANADIANTIRE_CA_DATA_COMPONENTS):
+                continue
+            _data[_dcomp] = fastjson.loads(_el.attrib['data-config'])
         return _data
 
-    def __extract_meta_data(self, response):
+    def __extract_meta_data(self, ctx):
         meta_data = {}
-        for _m in response.xpath("//meta/@name"):  # has 'name' attributes?
+        for _m in ctx.xpath("//meta/@name"):  # has 'name' attributes?
             _attr = _m.extract()
             try:
-                meta_data[_attr] = response.xpath(f"//meta[@name='{_attr}']/@content")[0].extract()
+                meta_data[_attr] = ctx.xpath(f"//meta[@name='{_attr}']/@content")[0].extract()
             except IndexError as e:
-                self.logger.exception(f"{utils.class_fullname(e)}: [SKU:{self._sku}] index error on parsing meta {_attr} - {str(e)}")
-        for _m in response.xpath("//meta/@property"):  # has 'property' attributes?
+                self.logger.exception(f"{utils.class_fullname(e)}: [SKU:{ctx.sku}] index error on parsing meta {_attr} - {str(e)}")
+        for _m in ctx.xpath("//meta/@property"):  # has 'property' attributes?
             _attr = _m.extract()
             try:
-                meta_data[_attr] = response.xpath(f"//meta[@property='{_attr}']/@content")[0].extract()
+                meta_data[_attr] = ctx.xpath(f"//meta[@property='{_attr}']/@content")[0].extract()
             except IndexError as e:
-                self.logger.exception(f"{utils.class_fullname(e)}: [SKU:{self._sku}] index error on parsing meta {_attr} - {str(e)}")
+                self.logger.exception(f"{utils.class_fullname(e)}: [SKU:{ctx.sku}] index error on parsing meta {_attr} - {str(e)}")
         return meta_data
 
     def parse_item(self, response, domain, job_id, crawl_variations, lat='43.769037', lng='-79.371951'):
-        self._referer_for_jsonrequest = response.request.url
-        self._domain = domain
-        self._job_id = job_id
-        self._sku = utils.extract_sku_from_url(response.url, self._domain)
-        if not self._sku:
-            self.logger.exception("[{}][null] Request ignored - no SKU".format(self._domain))
+        ctx = fieldspecs.ExtractionContext(response, domain=domain, job_id=job_id, sku=utils.extract_sku_from_url(response.url, domain))
+        if not ctx.sku:
+            self.logger.exception("[{}][null] Request ignored - no SKU".format(ctx.domain))
             raise IgnoreRequest
         if response.status != 200:
             # broken link or inactive item
-            yield self.build_listing_item(response)
+            yield self.build_listing_item(ctx)
         else:
-            _data = self.__get_preloaded_data_components(response)
-            _meta_data = self.__extract_meta_data(response)
-            self._parent_sku = _data.get('SkuSelectors', {}).get('pCode', '{}P'.format(self._sku))
+            _data = self.__get_preloaded_data_components(ctx)
+            _meta_data = self.__extract_meta_data(ctx)
+            _parent_sku = _data.get('SkuSelectors', {}).get('pCode', '{}P'.format(ctx.sku))
             if crawl_variations:
                 _skus = list(_data.get('SkuSelectors', {}).get('skuListProperties', {}).keys())
             else:
-                _skus = [self._sku]
-            yield self.build_listing_item(response, data=_data, meta_data=_meta_data)
-            yield JsonRequest(settings.CANADIANTIRE_CA_API_STORES_LINK_FORMAT.format(lat=lat, lng=lng, pid=self._parent_sku),
-                        callback=self.parse_near_stores,
+                _skus = [ctx.sku]
+            yield self.build_listing_item(ctx, data=_data, meta_data=_meta_data)
+            yield JsonRequest(settings.CANADIANTIRE_CA_API_STORES_LINK_FORMAT.format(lat=lat, lng=lng, pid=_parent_sku),
+                        callback=parsers.parse_canadiantire_ca_near_stores,
                         errback=parsers.resp_error_handler,
                         meta={
                             # avoid error - Crawled (503) <GET https://api-triangle.canadiantire.ca/robots.txt>
                             'dont_obey_robotstxt': True,
+                            # on the critical path of the product (pwbot.middlewares.LatencyAwareMiddleware)
+                            'hedge': True,
                         },
                         headers={
-                            'Referer': self._referer_for_jsonrequest,
+                            'Referer': response.request.url,
                         },
                         cb_kwargs={
                             'skus': _skus,
+                            'domain': ctx.domain,
+                            'job_id': ctx.job_id,
+                            'parent_sku': _parent_sku,
+                            'referer': response.request.url,
                         })
 
-    def parse_near_stores(self, response, skus):
-        store_ids = [i.get('storeNumber', '0') for i in response.json()]
-        yield self.build_listing_item(response, data=response.json())
+    def parse_near_stores(self, response, skus, domain, job_id, parent_sku, referer):
+        ctx = fieldspecs.ExtractionContext(response, domain=domain, job_id=job_id, parent_sku=parent_sku)
+        _data = fastjson.loads(response.body)
+        store_ids = [i.get('storeNumber', '0') for i in _data]
+        yield self.build_listing_item(ctx, data=_data)
         yield Request(settings.CANADIANTIRE_CA_API_ITEM_PRICE_LINK_FORMAT.format(sku=urllib.parse.quote(','.join(skus)),
                                                                                     store=urllib.parse.quote(','.join(store_ids)),
-                                                                                    pid=self._parent_sku),
-                    callback=self.parse_api,
+                                                                                    pid=parent_sku),
+                    callback=parsers.parse_canadiantire_ca_api,
                     errback=parsers.resp_error_handler,
                     meta={
                         # avoid error - Crawled (503)
                         'dont_obey_robotstxt': True,
+                        'hedge': True,
                     },
                     headers={
-                        'Referer': self._referer_for_jsonrequest,
+                        'Referer': referer,
+                    },
+                    cb_kwargs={
+                        'domain': domain,
+                        'job_id': job_id,
                     })
 
-    def parse_api(self, response):
-        return self.build_listing_item(response, data=response.json())
+    def parse_api(self, response, domain, job_id):
+        ctx = fieldspecs.ExtractionContext(response, domain=domain, job_id=job_id)
+        return self.build_listing_item(ctx, data=fastjson.loads(response.body))
 
-    def build_listing_item(self, response, data=None, meta_data=None):
-        """ response: scrapy.http.response.html.HtmlResponse
+    def build_listing_item(self, ctx, data=None, meta_data=None):
+        """ ctx: fieldspecs.ExtractionContext
             data: json
         """
+        response = ctx.response
         listing_item = ListingItem()
         listing_item['url'] = response.request.url
-        listing_item['domain'] = self._domain
+        listing_item['domain'] = ctx.domain
         listing_item['http_status'] = response.status
         listing_item['data'] = data
         listing_item['meta_data'] = meta_data
-        listing_item['job_id'] = self._job_id
+        listing_item['job_id'] = ctx.job_id
         return listing_item
 
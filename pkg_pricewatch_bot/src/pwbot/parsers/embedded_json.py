@@ -0,0 +1,93 @@
+""" pwbot.parsers.embedded_json
+
+    single pass scanner of json values embedded in inline <script> bodies,
+    i.e. amazon's '"parent_asin":"B008I25JB2"' or "'colorImages': { 'initial': [...] }".
+
+    all known keys are located by one compiled alternation, so a script body
+    is walked once however many keys are looked for. each value is decoded
+    once, from where its key ends, with json.JSONDecoder.raw_decode - no need
+    to guess where the value ends.
+"""
+
+import re
+import json
+
+_decoder = json.JSONDecoder()
+_WS = re.compile(r'\s*')
+# javascript object literal key - double/single quoted or bare
+_JS_KEY = re.compile(r"""(?:"((?:[^"\\]|\\.)*)"|'((?:[^'\\]|\\.)*)'|([A-Za-z_$][\w$]*))\s*:\s*""")
+
+
+def decode_value(text, pos):
+    """ decode one json value starting at text[pos]. returns (value, end)
+
+        objects with single quoted or bare keys (javascript object literals)
+        are accepted as long as their values are json.
+        raises ValueError if no value can be decoded
+    """
+    try:
+        return _decoder.raw_decode(text, pos)
+    except ValueError:
+        if pos >= len(text) or text[pos] != '{':
+            raise
+    try:
+        return _decode_js_object(text, pos)
+    except IndexError:
+        raise ValueError('unterminated object at {}'.format(pos))
+
+
+def _decode_js_object(text, pos):
+    ret = {}
+    pos = _WS.match(text, pos + 1).end()
+    while text[pos] != '}':
+        m = _JS_KEY.match(text, pos)
+        if not m:
+            raise ValueError('invalid object key at {}'.format(pos))
+        key = next(g for g in m.groups() if g is not None)
+        ret[key], pos = decode_value(text, m.end())
+        pos = _WS.match(text, pos).end()
+        if text[pos] == ',':
+            pos = _WS.match(text, pos + 1).end()
+        elif text[pos] != '}':
+            raise ValueError('expecting , or }} at {}'.format(pos))
+    return ret, pos + 1
+
+
+class EmbeddedJsonScanner(object):
+    """ keys: list of (key with its quotes, name), i.e. ('"parent_asin"', 'parent_asin').
+        several keys may share a name (aliases).
+        build once (module level) and reuse for every page.
+
+        scan() returns {name: value}. a name found several times gets the
+        first non-empty value, or the first value if all of them are empty.
+    """
+
+    def __init__(self, keys):
+        self._names = {} # (quote, key) -> name
+        for key, name in keys:
+            self._names[(key[0], key[1:-1])] = name
+        self._quotes = sorted(set(q for q, _ in self._names.keys()))
+        # one alternation per quote character - faster to match than one per key
+        self._pattern = re.compile('(?:{})\\s*:\\s*'.format('|'.join(
+            '{0}({1}){0}'.format(re.escape(q), '|'.join(sorted((re.escape(k) for _q, k in self._names.keys() if _q == q), key=len, reverse=True)))
+            for q in self._quotes)))
+
+    def scan(self, texts):
+        found = {}
+        remaining = set(self._names.values())
+        for text in texts:
+            for m in self._pattern.finditer(text):
+                name = self._names[(self._quotes[m.lastindex - 1], m.group(m.lastindex))]
+                if name not in remaining:
+                    continue
+                try:
+                    value, _ = decode_value(text, m.end())
+                except ValueError:
+                    continue
+                if name not in found or value not in [None, '', {}, [],]:
+                    found[name] = value
+                if value not in [None, '', {}, [],]:
+                    remaining.discard(name)
+                    if not remaining:
+                        return found
+        return found
@@ -0,0 +1,67 @@
+""" pwbot.parsers.fastjson
+
+    json decoding of the data embedded in store pages (walmart/canadiantire).
+
+    backend: orjson if installed (settings.PARSER_JSON_BACKEND), json otherwise.
+
+    select() keeps only the given paths of a decoded tree, so an item carries
+    (and pwweb stores) the parts of the page state that are actually read,
+    not the whole multi-megabyte state. the full tree is freed right after
+    decoding.
+"""
+
+import json
+from pwbot import settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson.JSONDecodeError is a subclass of json.JSONDecodeError
+JSONDecodeError = json.JSONDecodeError
+
+
+def backend():
+    return 'orjson' if orjson is not None and settings.PARSER_JSON_BACKEND == 'orjson' else 'json'
+
+
+def loads(s):
+    """ s: str or bytes
+    """
+    if backend() == 'orjson':
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError:
+            # i.e. NaN or Infinity - json takes them (or raises the same error)
+            pass
+    return json.loads(s)
+
+
+def select(data, paths):
+    """ subtree of data holding only the given paths. missing paths are skipped.
+        paths: list of dotted paths, i.e. ['entities.skus', 'product.item']
+    """
+    ret = {}
+    for path in paths:
+        keys = path.split('.')
+        src = data
+        for key in keys:
+            if not isinstance(src, dict) or key not in src:
+                break
+            src = src[key]
+        else:
+            dst = ret
+            for key in keys[:-1]:
+                dst = dst.setdefault(key, {})
+            dst[keys[-1]] = src
+    return ret
+
+
+def loads_paths(s, paths=None):
+    """ decode s, and keep the given paths only (unless settings.PARSER_PRUNE_EMBEDDED_DATA is off)
+    """
+    data = loads(s)
+    if paths is None or not settings.PARSER_PRUNE_EMBEDDED_DATA or not isinstance(data, dict):
+        return data
+    return select(data, paths)
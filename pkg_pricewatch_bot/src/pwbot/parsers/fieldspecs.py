@@ -0,0 +1,250 @@
+""" pwbot.parsers.fieldspecs
+
+    declarative field specs: field -> ordered fallback selectors -> post-processor.
+
+    selectors are compiled once per process - css is translated to xpath and
+    both are compiled to lxml.etree.XPath objects at import - and evaluated
+    against the lxml tree of a response through an ExtractionContext, which
+    memoizes every selection, so a selector shared by several fields (or by a
+    spec and imperative code through ctx.css/ctx.xpath) runs once per page.
+
+    i.e.
+        STORE_FIELDS = FieldSpec({
+            'price': Field(['#price-now::text', '#price::attr(content)',], post=money, default=None),
+            'in_stock': Field(['#add-to-cart',], post=exists, default=False),
+        }, link_format='https://www.{domain}/product/{sku}', sku_pattern=re.compile(r'/product/([0-9]+)'))
+        register('homedepot.ca', STORE_FIELDS)
+
+    a registered domain is crawled by StoreItemPageSpider (skus through
+    link_format, urls as they are) and parsed by pwbot.parsers.parse_store_item
+    without any store specific code.
+"""
+
+import functools
+from lxml import etree
+from parsel import Selector, SelectorList
+from parsel.csstranslator import HTMLTranslator
+from pwbot import utils
+
+_translator = HTMLTranslator()
+_NAMESPACES = {'re': 'http://exslt.org/regular-expressions'}
+_UNSET = object()
+
+# domain -> FieldSpec
+FIELD_SPECS = {}
+
+
+@functools.lru_cache(maxsize=None)
+def compile_xpath(query):
+    return etree.XPath(query, namespaces=_NAMESPACES, smart_strings=False)
+
+
+@functools.lru_cache(maxsize=None)
+def compile_css(query):
+    """ parsel css, including ::text and ::attr(name) pseudo elements
+    """
+    return compile_xpath(_translator.css_to_xpath(query))
+
+
+class Css(object):
+    def __init__(self, query):
+        self.query = query
+        self.compiled = compile_css(query)
+
+    def select(self, ctx):
+        return ctx.select_css(self.query)
+
+
+class XPath(Css):
+    """ evaluated on lxml whatever the document backend
+    """
+    def __init__(self, query):
+        self.query = query
+        self.compiled = compile_xpath(query)
+
+    def select(self, ctx):
+        return ctx.select(self.compiled)
+
+
+class Regex(object):
+    """ pattern: compiled regular expression, searched over the page text
+    """
+    def __init__(self, pattern, group=1):
+        self.pattern = pattern
+        self.group = group
+
+    def select(self, ctx):
+        m = ctx.search(self.pattern)
+        return [m.group(self.group)] if m else []
+
+
+# post-processors - get the values of the first selector that matched
+def first(values):
+    return values[0]
+
+def first_stripped(values):
+    return values[0].strip()
+
+def exists(values):
+    return True
+
+def money(values):
+    return utils.money_to_float(values[0].strip())
+
+def joined(separator):
+    def _joined(values):
+        return separator.join(v.strip() for v in values)
+    return _joined
+
+def outer_html(values):
+    return [to_html(v) for v in values]
+
+def to_html(value):
+    """ same as parsel Selector.extract() - of an lxml element, or a lexbor node (pwbot.parsers.backends)
+    """
+    if isinstance(value, str):
+        return value
+    if isinstance(value, etree._Element):
+        return etree.tostring(value, method='html', encoding='unicode', with_tail=False)
+    return value.html
+
+
+class Field(object):
+    """ selectors: ordered fallbacks - css strings, Css, XPath or Regex
+        post: function(values of the first selector that matched). None: the values as they are
+        default: value if no selector matched
+    """
+
+    def __init__(self, selectors, post=first, default=None):
+        self.selectors = [Css(s) if isinstance(s, str) else s for s in selectors]
+        self.post = post
+        self.default = default
+
+    def extract(self, ctx, default=_UNSET):
+        for selector in self.selectors:
+            values = selector.select(ctx)
+            if len(values) > 0:
+                return self.post(values) if self.post is not None else values
+        return self.default if default is _UNSET else default
+
+
+class FieldSpec(object):
+    """ fields: {name: Field}. post-processor errors are raised to the caller
+        link_format: item page url of a sku - formatted with domain and sku. None: urls only
+        sku_pattern: compiled regular expression, group 1 is the sku of an item page url.
+            None: the sku comes from the 'sku' field of the page
+    """
+
+    def __init__(self, fields, link_format=None, sku_pattern=None):
+        self.fields = fields
+        self.link_format = link_format
+        self.sku_pattern = sku_pattern
+
+    def link(self, domain, sku):
+        if self.link_format is None:
+            return None
+        return self.link_format.format(domain=domain, sku=sku)
+
+    def sku_from_url(self, url):
+        m = self.sku_pattern.search(url) if self.sku_pattern is not None else None
+        return m.group(1) if m else None
+
+    def extract(self, ctx, name, default=_UNSET):
+        return self.fields[name].extract(ctx, default)
+
+    def extract_all(self, ctx):
+        return {name: field.extract(ctx) for name, field in self.fields.items()}
+
+
+def register(domains, spec):
+    for domain in domains if isinstance(domains, (list, tuple)) else [domains]:
+        FIELD_SPECS[domain] = spec
+
+
+class ExtractionContext(object):
+    """ extraction context of a single response
+
+        results of selectors and regex searches on the whole page are
+        memoized, so each of them is evaluated once per page however many
+        fields use it. per page parser state (domain, job id, sku...) is kept
+        here as well - parsers are stateless and shared by all responses.
+
+        the page is parsed by the html backend of the domain
+        (pwbot.parsers.backends) - css selectors run on it. xpath always runs
+        on lxml.
+    """
+
+    def __init__(self, response, **state):
+        self.response = response
+        self.__dict__.update(state)
+        self._document = None
+        self._selections = {}
+        self._matches = {}
+
+    @property
+    def text(self):
+        return self.response.text
+
+    @property
+    def document(self):
+        """ pwbot.parsers.backends document of the page - parsed once
+        """
+        if self._document is None:
+            self._document = self._build_document()
+        return self._document
+
+    def _build_document(self):
+        from pwbot.parsers import backends
+        document_class = backends.get_document_class(getattr(self, 'domain', None))
+        if document_class is backends.LxmlDocument:
+            # the response's own selector - shared with response.css()
+            return backends.LxmlDocument(root=self.response.selector.root)
+        return document_class(self.response.text)
+
+    @property
+    def root(self):
+        """ lxml tree of the page
+        """
+        return self.document.lxml_root
+
+    def select(self, compiled):
+        """ compiled: lxml.etree.XPath. returns the raw lxml results
+        """
+        if compiled not in self._selections:
+            result = compiled(self.root)
+            self._selections[compiled] = result if isinstance(result, list) else [result]
+        return self._selections[compiled]
+
+    def select_css(self, query):
+        """ returns the raw results of the document backend - strings and nodes
+        """
+        key = ('css', query)
+        if key not in self._selections:
+            self._selections[key] = self.document.select_css(query)
+        return self._selections[key]
+
+    def css(self, query):
+        # selectors over the memoized results - for imperative code chaining .css()/.extract()
+        key = ('css', query, SelectorList)
+        if key not in self._selections:
+            self._selections[key] = self.document.selector_list(self.select_css(query))
+        return self._selections[key]
+
+    def xpath(self, query):
+        compiled = compile_xpath(query)
+        key = (compiled, SelectorList)
+        if key not in self._selections:
+            self._selections[key] = SelectorList([Selector(root=r, type='html') for r in self.select(compiled)])
+        return self._selections[key]
+
+    def script_texts(self):
+        """ bodies of the inline <script> elements
+        """
+        return self.document.script_texts()
+
+    def search(self, pattern):
+        """ pattern: compiled regular expression
+        """
+        if pattern not in self._matches:
+            self._matches[pattern] = pattern.search(self.response.text)
+        return self._matches[pattern]
@@ -0,0 +1,137 @@
+""" pwbot.parsers.fieldstats
+
+    per field extraction stats of the store parsers: calls, cumulative and max
+    time, failures - by domain and field (the __extract_*/__get_* methods).
+
+    enable() wraps the extractors of the parser classes with timing wrappers,
+    disable() puts the original methods back - no overhead at all when off.
+    both can be called at any time, i.e. from the telnet console:
+        >>> from pwbot.parsers import fieldstats
+        >>> fieldstats.enable()
+
+    failures: exceptions raised by an extractor, and exceptions logged by
+    logger.exception() in the extractor's own except branch (a logging
+    filter on the parser loggers, installed while enabled).
+
+    pwbot.extensions.ParserFieldStats writes the stats to the crawler stats
+    at spider_closed. pages parsed in the worker pool (pwbot.parsers.pool)
+    are not counted - the extension is not enabled with PARSER_POOL_ENABLED.
+    spec driven parsing (StoreItemParser) is counted as a whole, under the
+    'fields' field.
+"""
+
+import re
+import time
+import logging
+import functools
+
+# (domain, field) -> [calls, total seconds, max seconds, failures]
+_stats = None
+# (domain, field) of the extractors being run
+_active = []
+# (class, attribute name) -> original function
+_originals = {}
+
+
+def parser_classes():
+    from pwbot.parsers.amazon_item_parser import AmazonItemParser
+    from pwbot.parsers.walmart_item_parser import WalmartComItemParser, WalmartCaItemParser
+    from pwbot.parsers.canadiantire_item_parser import CanadiantireCaItemParser
+    from pwbot.parsers.store_item_parser import StoreItemParser
+    return [AmazonItemParser, WalmartComItemParser, WalmartCaItemParser, CanadiantireCaItemParser, StoreItemParser,]
+
+
+def extractors(cls):
+    """ {field name: attribute name} of the extractor methods of a parser class - __extract_<field>/__get_<field>
+    """
+    prefix = '_{}__'.format(cls.__name__)
+    ret = {}
+    for name, value in vars(cls).items():
+        if not name.startswith(prefix) or not callable(value):
+            continue
+        m = re.match(r'(?:extract|get)_(\w+)$', name[len(prefix):])
+        # amazon __extract_field is the spec field helper, not a field
+        if m and m.group(1) != 'field':
+            ret[m.group(1)] = name
+    return ret
+
+
+class _FailureFilter(logging.Filter):
+    def filter(self, record):
+        if _active and record.exc_info and record.exc_info[0] is not None:
+            _record(_active[-1], None, failed=True)
+        return True
+
+_failure_filter = _FailureFilter()
+
+
+def _record(key, elapsed, failed=False):
+    if _stats is None:
+        return
+    s = _stats.setdefault(key, [0, 0.0, 0.0, 0])
+    if elapsed is not None:
+        s[0] += 1
+        s[1] += elapsed
+        s[2] = max(s[2], elapsed)
+    if failed:
+        s[3] += 1
+
+
+def _timed(func, field):
+    @functools.wraps(func)
+    def wrapper(self, ctx, *args, **kwargs):
+        key = (getattr(ctx, 'domain', None), field)
+        _active.append(key)
+        started = time.perf_counter()
+        failed = False
+        try:
+            return func(self, ctx, *args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            _active.pop()
+            _record(key, time.perf_counter() - started, failed)
+    return wrapper
+
+
+def is_enabled():
+    return _stats is not None
+
+
+def enable():
+    global _stats
+    if _stats is not None:
+        return
+    _stats = {}
+    for cls in parser_classes():
+        for field, name in extractors(cls).items():
+            _originals[(cls, name)] = vars(cls)[name]
+            setattr(cls, name, _timed(vars(cls)[name], field))
+        logging.getLogger('{}.{}'.format(cls.__module__, cls.__name__)).addFilter(_failure_filter)
+
+
+def disable():
+    """ returns the stats collected since enable()
+    """
+    global _stats
+    for (cls, name), func in _originals.items():
+        setattr(cls, name, func)
+    _originals.clear()
+    for cls in parser_classes():
+        logging.getLogger('{}.{}'.format(cls.__module__, cls.__name__)).removeFilter(_failure_filter)
+    collected, _stats = collected_stats(), None
+    return collected
+
+
+def collected_stats():
+    """ {stats key: value} - parser/<domain>/<field>/calls|time_ms|max_ms|failures
+    """
+    ret = {}
+    for (domain, field), (calls, total, longest, failures) in (_stats or {}).items():
+        prefix = 'parser/{}/{}'.format(domain, field)
+        ret['{}/calls'.format(prefix)] = calls
+        ret['{}/time_ms'.format(prefix)] = round(total * 1000, 3)
+        ret['{}/max_ms'.format(prefix)] = round(longest * 1000, 3)
+        ret['{}/failures'.format(prefix)] = failures
+    return ret
@@ -0,0 +1,188 @@
+""" pwbot.parsers.pool
+
+    off-reactor parsing - store pages are parsed by a pool of worker processes
+    instead of on the twisted reactor thread (settings.PARSER_POOL_ENABLED).
+
+    a worker gets the response as plain data (url, status, headers, body,
+    request url/cookies/meta), runs the pwbot.parsers function by name, and
+    sends the results back as plain data: items as dicts, follow-up requests
+    as request dicts with their callbacks by name. the results are rebuilt
+    into ListingItem and Request objects on the reactor thread.
+
+    follow-up requests whose callback is a page parser (i.e. amazon variations)
+    are parsed in the pool again. other callbacks (walmart.ca and canadiantire.ca
+    api calls) run in the main process - they only decode small json bodies.
+
+    backpressure: at most max_pending pages are handed to the pool at once
+    (default: CONCURRENT_REQUESTS). pages waiting for a slot stay in scrapy's
+    scraper slot, so scrapy stops downloading once SCRAPER_SLOT_MAX_ACTIVE_SIZE
+    is reached - the same as when the parsing is slow on the reactor thread.
+"""
+
+import os
+import logging
+import concurrent.futures
+from twisted.internet import defer, threads
+from scrapy import Request
+from scrapy.http import HtmlResponse
+from scrapy.utils.misc import load_object
+from pwbot import utils
+from pwbot.items import ListingItem
+
+try:
+    from scrapy.utils.defer import maybe_deferred_to_future
+except ImportError:
+    # scrapy < 2.6 - deferreds are awaited as they are (no asyncio reactor)
+    def maybe_deferred_to_future(d):
+        return d
+
+POOLED_PARSERS = ['parse_amazon_item', 'parse_walmart_com_item', 'parse_walmart_ca_item', 'parse_canadiantire_ca_item', 'parse_store_item',]
+
+_PLAIN_TYPES = (str, bytes, int, float, bool, list, tuple, dict, type(None))
+
+
+def dump_response(response):
+    """ response: scrapy.http.response.html.HtmlResponse
+        returns a dict a worker process can rebuild the response from
+    """
+    request = response.request
+    return {
+        'url': response.url,
+        'status': response.status,
+        'headers': response.headers.to_unicode_dict(),
+        'body': response.body,
+        'request': {
+            'url': request.url,
+            'cookies': request.cookies,
+            # parsers only read plain values (i.e. redirect_urls)
+            'meta': {k: v for k, v in request.meta.items() if isinstance(v, _PLAIN_TYPES)},
+        },
+    }
+
+
+def load_response(data):
+    request = Request(data['request']['url'], cookies=data['request']['cookies'], meta=data['request']['meta'])
+    return HtmlResponse(data['url'], status=data['status'], headers=data['headers'], body=data['body'], request=request)
+
+
+def _dump_callback(callback):
+    if callback is None:
+        return None
+    return '{}.{}'.format(callback.__module__, callback.__name__)
+
+
+def _load_callback(path, route=None):
+    if path is None:
+        return None
+    callback = load_object(path)
+    if route is not None and callback.__module__ == 'pwbot.parsers' and callback.__name__ in POOLED_PARSERS:
+        return route(callback.__name__)
+    return callback
+
+
+def dump_result(result):
+    if isinstance(result, Request):
+        return {
+            'type': 'request',
+            'class': utils.class_fullname(result),
+            'url': result.url,
+            'method': result.method,
+            'headers': {k.decode('latin1'): [v.decode('latin1') for v in vs] for k, vs in result.headers.items()},
+            'body': result.body,
+            'cookies': result.cookies,
+            'meta': result.meta,
+            'cb_kwargs': result.cb_kwargs,
+            'priority': result.priority,
+            'dont_filter': result.dont_filter,
+            'callback': _dump_callback(result.callback),
+            'errback': _dump_callback(result.errback),
+        }
+    return {'type': 'item', 'item': dict(result)}
+
+
+def load_result(data, route=None):
+    """ route: function(parser name) returning the callback of follow-up page requests
+    """
+    if data['type'] == 'request':
+        return load_object(data['class'])(data['url'],
+                    method=data['method'],
+                    headers=data['headers'],
+                    body=data['body'],
+                    cookies=data['cookies'],
+                    meta=data['meta'],
+                    cb_kwargs=data['cb_kwargs'],
+                    priority=data['priority'],
+                    dont_filter=data['dont_filter'],
+                    callback=_load_callback(data['callback'], route),
+                    errback=_load_callback(data['errback'], route))
+    return ListingItem(data['item'])
+
+
+def run_parser(name, response_data, kwargs):
+    """ worker process entry point. returns a list of dump_result() dicts
+    """
+    from pwbot import parsers
+    results = getattr(parsers, name)(load_response(response_data), **kwargs)
+    return [dump_result(r) for r in results or []]
+
+
+class ParserPool(object):
+    """ usage:
+            pool = ParserPool.from_crawler(crawler)
+            Request(url, callback=pool.callback('parse_amazon_item'), ...)
+            ...
+            pool.close() # a deferred
+    """
+
+    def __init__(self, size=None, max_pending=None):
+        self.logger = logging.getLogger(utils.class_fullname(self))
+        self.size = size or os.cpu_count() or 1
+        self.max_pending = max_pending or self.size
+        self._executor = None
+        self._semaphore = defer.DeferredSemaphore(self.max_pending)
+        self._callbacks = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(size=crawler.settings.getint('PARSER_POOL_SIZE') or None,
+                max_pending=crawler.settings.getint('PARSER_POOL_MAX_PENDING') or crawler.settings.getint('CONCURRENT_REQUESTS'))
+
+    def callback(self, name):
+        """ spider callback parsing the response by pwbot.parsers.<name> in the pool
+        """
+        if name not in self._callbacks:
+            async def _callback(response, **kwargs):
+                return await maybe_deferred_to_future(self.parse(name, response, **kwargs))
+            _callback.__name__ = name
+            self._callbacks[name] = _callback
+        return self._callbacks[name]
+
+    def parse(self, name, response, **kwargs):
+        """ returns a deferred fired with the list of items and requests
+        """
+        response_data = dump_response(response)
+        d = self._semaphore.run(self._submit, name, response_data, kwargs)
+        d.addCallback(lambda results: [load_result(r, route=self.callback) for r in results])
+        return d
+
+    def _submit(self, name, response_data, kwargs):
+        from twisted.internet import reactor
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.size)
+            self.logger.info('parser pool started - {} workers, {} pending pages max'.format(self.size, self.max_pending))
+        d = defer.Deferred()
+        def _done(future):
+            if future.exception() is not None:
+                reactor.callFromThread(d.errback, future.exception())
+            else:
+                reactor.callFromThread(d.callback, future.result())
+        self._executor.submit(run_parser, name, response_data, kwargs).add_done_callback(_done)
+        return d
+
+    def close(self):
+        """ returns a deferred fired once the workers exited - waited for in a thread, off the reactor
+        """
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return defer.succeed(None)
+        return threads.deferToThread(executor.shutdown, wait=True)
@@ -0,0 +1,114 @@
+""" pwbot.parsers.sanitizer
+
+    html of page fragments (i.e. amazon features and description) cleaned
+    in one walk over a copy of the fragment tree, and serialized once:
+        - <a> with text only -> <span class="link-replacement">text</span>
+          (utils.replace_html_anchors_to_spans on the tree)
+        - non ascii characters removed from text and attribute values
+          (utils.trim_emojis on the tree) - ascii_only
+        - elements removed with their content, the text after them kept:
+          drop_tags (<script>), drop_classes (i.e. 'disclaim')
+
+    the page tree is not changed - selections memoized by the extraction
+    context stay as they are for the other fields.
+"""
+
+import copy
+import lxml.html
+from lxml import etree
+from pwbot.parsers import fieldspecs
+
+
+def _ascii(text):
+    return text.encode('ascii', errors='ignore').decode('ascii')
+
+
+def _copy(value):
+    """ a copy of an lxml element, or an lxml element of a lexbor node (pwbot.parsers.backends)
+    """
+    if isinstance(value, etree._Element):
+        ret = copy.deepcopy(value)
+        ret.tail = None
+        return ret
+    return lxml.html.fragment_fromstring(fieldspecs.to_html(value))
+
+
+def _drop(el):
+    """ remove el and its content, keep its tail
+    """
+    parent = el.getparent()
+    if el.tail:
+        previous = el.getprevious()
+        if previous is not None:
+            previous.tail = (previous.tail or '') + el.tail
+        else:
+            parent.text = (parent.text or '') + el.tail
+    parent.remove(el)
+
+
+class HtmlSanitizer(object):
+    """ build once (module level) and reuse for every page.
+    """
+
+    def __init__(self, ascii_only=False, drop_tags=('script',), drop_classes=()):
+        self.ascii_only = ascii_only
+        self.drop_tags = set(drop_tags)
+        self.drop_classes = set(drop_classes)
+
+    def sanitize(self, elements, wrapper=None):
+        """ elements: selected lxml elements (or lexbor nodes)
+            wrapper: html of the container the elements are put in - in its innermost
+                element, i.e. '<div><ul class="a"></ul></div>'. None: the elements as they are
+            returns the html
+        """
+        if wrapper is not None:
+            root = lxml.html.fragment_fromstring(wrapper)
+            container = root
+            while len(container) > 0:
+                container = container[-1]
+            for element in elements:
+                container.append(_copy(element))
+            return '' if self._clean(root) is None else self._html(root)
+        ret = []
+        for element in elements:
+            root = self._clean(_copy(element))
+            if root is not None:
+                ret.append(self._html(root))
+        return ''.join(ret)
+
+    def _html(self, root):
+        return etree.tostring(root, method='html', encoding='unicode', with_tail=False)
+
+    def _clean(self, root):
+        """ returns the root, or None if the root itself is dropped
+        """
+        dropped = []
+        for el in root.iter():
+            if not isinstance(el.tag, str):
+                # comments, processing instructions
+                if self.ascii_only:
+                    el.text = _ascii(el.text) if el.text else el.text
+                    el.tail = _ascii(el.tail) if el.tail else el.tail
+                continue
+            if el.tag in self.drop_tags or (self.drop_classes and not self.drop_classes.isdisjoint((el.get('class') or '').split())):
+                dropped.append(el)
+                continue
+            if self.ascii_only:
+                if el.text:
+                    el.text = _ascii(el.text)
+                if el.tail:
+                    el.tail = _ascii(el.tail)
+                for name, value in el.attrib.items():
+                    if not value.isascii():
+                        el.set(name, _ascii(value))
+            if el.tag == 'a' and len(el) == 0 and el.text:
+                text, tail = el.text, el.tail
+                el.clear()
+                el.tag = 'span'
+                el.set('class', 'link-replacement')
+                el.text, el.tail = text, tail
+        for el in dropped:
+            if el is root:
+                return None
+            _drop(el)
+        return root
@@ -0,0 +1,62 @@
+""" pwbot.parsers.store_item_parser
+"""
+
+import logging
+from scrapy.exceptions import IgnoreRequest
+from pwbot import settings, utils
+from pwbot.items import ListingItem
+from pwbot.parsers import fieldspecs
+
+
+class StoreItemParser(object):
+    """ spec driven parser of the domains registered in fieldspecs.FIELD_SPECS - no store specific code.
+
+        item data: {field name: value} of the domain spec, plus 'sku' and 'status'.
+        sku: from the url (spec sku_pattern) or the spec 'sku' field.
+
+        stateless - one instance (pwbot.parsers) parses every response.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(utils.class_fullname(self))
+
+    def parse_item(self, response, domain, job_id, crawl_variations=False, lat=None, lng=None):
+        if domain not in fieldspecs.FIELD_SPECS:
+            self.logger.error("[{}] Request ignored - no field spec".format(domain))
+            raise IgnoreRequest
+        spec = fieldspecs.FIELD_SPECS[domain]
+        ctx = fieldspecs.ExtractionContext(response, domain=domain, job_id=job_id)
+        ctx.sku = utils.extract_sku_from_url(response.url, domain) or spec.sku_from_url(response.url)
+        if not ctx.sku and 'sku' in spec.fields and response.status == 200:
+            ctx.sku = spec.extract(ctx, 'sku')
+        if not ctx.sku:
+            self.logger.error("[{}][null] Request ignored - no SKU".format(domain))
+            raise IgnoreRequest
+        listing_item = ListingItem()
+        listing_item['url'] = response.request.url
+        listing_item['domain'] = domain
+        listing_item['http_status'] = response.status
+        listing_item['job_id'] = job_id
+        if response.status == 200:
+            listing_item['data'] = {'sku': ctx.sku}
+            try:
+                listing_item['data'].update(self.__extract_fields(ctx, spec))
+                listing_item['meta_data'] = self.__extract_meta_data(ctx)
+            except Exception as e:
+                self.logger.exception("{}: [{}][{}] Failed parsing page - {}".format(utils.class_fullname(e), domain, ctx.sku, str(e)))
+                listing_item['data']['status'] = settings.RESOURCES_LISTING_ITEM_STATUS_PARSING_FAILED_UNKNOWN_ERROR
+            else:
+                listing_item['data']['status'] = settings.RESOURCES_LISTING_ITEM_STATUS_GOOD
+        yield listing_item
+
+    def __extract_fields(self, ctx, spec):
+        return spec.extract_all(ctx)
+
+    def __extract_meta_data(self, ctx):
+        meta_data = {}
+        # one pass over <meta> elements. the first content given to a name/property wins
+        for _m in ctx.select(fieldspecs.compile_xpath("//meta[(@name or @property) and @content]")):
+            for _attr in [_m.attrib.get('name'), _m.attrib.get('property'),]:
+                if _attr is not None and _attr not in meta_data:
+                    meta_data[_attr] = _m.attrib['content']
+        return meta_data
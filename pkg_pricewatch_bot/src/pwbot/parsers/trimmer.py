@@ -0,0 +1,184 @@
+""" pwbot.parsers.trimmer
+
+    byte level pre-trimmer - cuts the regions a parser reads out of a large
+    html page, so only a small synthetic document is parsed into a DOM.
+
+    regions are located by anchors, without parsing:
+        ids             elements by id, i.e. b'centerCol' - the whole element,
+                        up to its balanced end tag (void elements: the tag only)
+        script markers  inline <script> elements whose body contains the
+                        marker, i.e. b'"parent_asin"'
+        meta            every <meta> tag
+
+    the regions are put together in page order, so selectors see the same
+    elements in the same order as on the whole page. an anchor inside an
+    already taken region is not cut twice.
+
+    trim() returns None - parse the whole page - whenever the page can't be
+    trimmed safely: a required id missing (unknown page layout), an id found
+    outside of a start tag, an element without a balanced end tag, an element
+    which may end without an end tag (<p>, <li>...), or uppercase <SCRIPT>
+    tags (scripts can't be told apart).
+    an id not found on the page is not an error - the element isn't on the
+    page, so the selectors wouldn't find it in the whole page either.
+"""
+
+import re
+import bisect
+import functools
+
+_VOID_TAGS = {b'area', b'base', b'br', b'col', b'embed', b'hr', b'img', b'input', b'link', b'meta', b'param', b'source', b'track', b'wbr',}
+# end tag may be left out - the element end can't be found by counting tags
+_OPTIONAL_END_TAGS = {b'p', b'li', b'dt', b'dd', b'tr', b'td', b'th', b'thead', b'tbody', b'tfoot', b'option', b'optgroup', b'colgroup', b'caption', b'rb', b'rt', b'rp',}
+_ATTRS = rb"""(?:\s+[^\s"'>/=]+(?:\s*=\s*(?:"[^"]*"|'[^']*'|[^\s"'=<>`]+))?)*"""
+# start tag up to an attribute - '<div class="a" '
+_RE_TAG_PREFIX = re.compile(rb'<[a-zA-Z][a-zA-Z0-9-]*' + _ATTRS + rb'\s+')
+# whole start tag - attribute values may contain '>'
+_RE_START_TAG = re.compile(rb'<([a-zA-Z][a-zA-Z0-9-]*)' + _ATTRS + rb'\s*/?>')
+# a single pass over the page finds these - element ids are found by a second one
+_RE_MARKUP = re.compile(rb'<(meta\b|(?i:script)\b|!--)')
+
+
+@functools.lru_cache(maxsize=None)
+def _balance_pattern(tag):
+    # start/end tags of the element type - comments, script and style bodies skipped
+    return re.compile(rb'<!--.*?-->|<script\b.*?</script\s*>|<style\b.*?</style\s*>|<(/?)' + re.escape(tag) + rb'(?=[\s/>])', re.DOTALL | re.IGNORECASE)
+
+
+class _Untrimmable(Exception):
+    pass
+
+
+class HtmlTrimmer(object):
+    """ ids: element ids to keep
+        script_markers: keep inline scripts containing any of them
+        required: ids the page must have - trim() returns None otherwise
+        meta: keep <meta> tags
+        build once (module level) and reuse for every page.
+    """
+
+    def __init__(self, ids, script_markers=(), required=(), meta=True):
+        self.ids = [_bytes(i) for i in ids]
+        self.script_markers = [_bytes(m) for m in script_markers]
+        self.required = set(_bytes(i) for i in required)
+        self.meta = meta
+        # every id by one compiled alternation - the page is scanned once
+        self._id_pattern = re.compile(rb"""id=(["'])(""" + b'|'.join(re.escape(i) for i in sorted(self.ids, key=len, reverse=True)) + rb')\1')
+
+    def trim(self, body):
+        """ body: bytes of the page, in an ascii compatible encoding
+            returns the bytes of the trimmed document, or None
+        """
+        try:
+            spans = self._spans(body)
+        except _Untrimmable:
+            return None
+        fragments = []
+        last_end = -1
+        for start, end in sorted(spans):
+            if start < last_end:
+                if end > last_end:
+                    # overlapping, not nested - badly formed page
+                    return None
+                continue
+            fragments.append(body[start:end])
+            last_end = end
+        return b'<html>' + b'\n'.join(fragments) + b'</html>'
+
+    def _spans(self, body):
+        """ (start, end) of every region. raises _Untrimmable
+        """
+        spans = []
+        # (start, end) of scripts and comments - an anchor in them is not an element
+        skipped = []
+        pos = 0
+        while True:
+            m = _RE_MARKUP.search(body, pos)
+            if m is None:
+                break
+            kind = m.group(1)
+            if kind == b'!--':
+                end = body.find(b'-->', m.end())
+                if end < 0:
+                    raise _Untrimmable()
+                end += 3
+                skipped.append((m.start(), end))
+            elif kind == b'meta':
+                t = _RE_START_TAG.match(body, m.start())
+                if t is None:
+                    raise _Untrimmable()
+                end = t.end()
+                if self.meta:
+                    spans.append((m.start(), end))
+            elif kind == b'script':
+                close = body.find(b'</script', m.end())
+                end = body.find(b'>', close) + 1 if close >= 0 else 0
+                if end < 1:
+                    raise _Untrimmable()
+                skipped.append((m.start(), end))
+                for marker in self.script_markers:
+                    if body.find(marker, m.end(), close) >= 0:
+                        spans.append((m.start(), end))
+                        break
+            else:
+                # <SCRIPT> - its end tag can't be found by a plain search
+                raise _Untrimmable()
+            pos = end
+
+        skipped_starts = [start for start, _ in skipped]
+        found = set()
+        for m in self._id_pattern.finditer(body):
+            pos = m.start()
+            # an attribute, not i.e. data-id="..."
+            if pos < 1 or not body[pos - 1:pos].isspace():
+                continue
+            i = bisect.bisect_right(skipped_starts, pos) - 1
+            if i >= 0 and skipped[i][1] > pos:
+                continue
+            # of a start tag: '<tag ... id="..."'
+            start = body.rfind(b'<', 0, pos)
+            if start < 0 or not _RE_TAG_PREFIX.fullmatch(body, start, pos):
+                raise _Untrimmable()
+            found.add(m.group(2))
+            spans.append((start, self._element_end(body, start)))
+        if not self.required <= found:
+            raise _Untrimmable()
+        return spans
+
+    def _element_end(self, body, start):
+        m = _RE_START_TAG.match(body, start)
+        if not m:
+            raise _Untrimmable()
+        tag = m.group(1).lower()
+        if tag in _VOID_TAGS:
+            return m.end()
+        if tag in _OPTIONAL_END_TAGS:
+            raise _Untrimmable()
+        depth = 1
+        for t in _balance_pattern(tag).finditer(body, m.end()):
+            if t.group(1) is None:
+                # comment, script or style
+                continue
+            if t.group(1):
+                depth -= 1
+                if depth == 0:
+                    end = body.find(b'>', t.end())
+                    if end < 0:
+                        break
+                    return end + 1
+            else:
+                depth += 1
+        raise _Untrimmable()
+
+
+def _bytes(value):
+    return value.encode('utf-8') if isinstance(value, str) else value
+
+
+def ascii_compatible(encoding):
+    """ byte offsets of markup are the same in the decoded text - i.e. utf-8, latin-1. not utf-16
+    """
+    try:
+        return '<>"\'='.encode(encoding) == b'<>"\'='
+    except (LookupError, TypeError):
+        return False
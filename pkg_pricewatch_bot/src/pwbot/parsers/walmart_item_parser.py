@@ -2,148 +2,153 @@
 """
 
 import re
-import json
 import logging
 from scrapy.http import JsonRequest, Request
 from scrapy.exceptions import IgnoreRequest
 from pwbot import settings, utils, parsers
 from pwbot.items import ListingItem
+from pwbot.parsers import fastjson, fieldspecs
+
+# parts of the preloaded state read by the parsers and pwweb (resources.modelBuilders, resources.models.RawData)
+WALMART_COM_PRELOADED_DATA_PATHS = ['item.product.buyBox',]
+_PRELOADED_STATE_PATTERN = re.compile(r"window\.__PRELOADED_STATE__=({.*?});", re.MULTILINE | re.DOTALL)
+WALMART_CA_PRELOADED_DATA_PATHS = ['entities.skus', 'product.item', 'product.activeSkuId', 'catchment.storeId', 'common.experience', 'locale.lang',]
 
 
 class WalmartComItemParser(object):
-    _domain = None
-    _job_id = None
-    _sku = None
+    """ stateless - one instance (pwbot.parsers) parses every response. per page state is kept in fieldspecs.ExtractionContext
+    """
 
     def __init__(self):
         self.logger = logging.getLogger(utils.class_fullname(self))
 
-    def __get_preloaded_data(self, response):
+    def __get_preloaded_data(self, ctx):
         try:
-            _data = response.xpath('//script[@id="item"]/text()').extract()[0]
+            _data = ctx.xpath('//script[@id="item"]/text()').extract()[0]
         except IndexError as e:
-            self.logger.exception("{}: [{}][{}] unable to find preloaded data - {}".format(utils.class_fullname(e), self._domain, self._sku, str(e)))
+            self.logger.exception("{}: [{}][{}] unable to find preloaded data - {}".format(utils.class_fullname(e), ctx.domain, ctx.sku, str(e)))
             raise IgnoreRequest
-        return json.loads(_data)
+        return fastjson.loads_paths(_data, WALMART_COM_PRELOADED_DATA_PATHS)
 
-    def __extract_meta_data(self, response):
+    def __extract_meta_data(self, ctx):
         meta_data = {}
-        for _m in response.xpath("//meta/@name"):  # has 'name' attributes?
+        for _m in ctx.xpath("//meta/@name"):  # has 'name' attributes?
             _attr = _m.extract()
             try:
-                meta_data[_attr] = response.xpath(f"//meta[@name='{_attr}']/@content")[0].extract()
+                meta_data[_attr] = ctx.xpath(f"//meta[@name='{_attr}']/@content")[0].extract()
             except IndexError as e:
-                self.logger.exception(f"{utils.class_fullname(e)}: [SKU:{self._sku}] index error on parsing meta {_attr} - {str(e)}")
-        for _m in response.xpath("//meta/@property"):  # has 'property' attributes?
+                self.logger.exception(f"{utils.class_fullname(e)}: [SKU:{ctx.sku}] index error on parsing meta {_attr} - {str(e)}")
+        for _m in ctx.xpath("//meta/@property"):  # has 'property' attributes?
             _attr = _m.extract()
             try:
-                meta_data[_attr] = response.xpath(f"//meta[@property='{_attr}']/@content")[0].extract()
+                meta_data[_attr] = ctx.xpath(f"//meta[@property='{_attr}']/@content")[0].extract()
             except IndexError as e:
-                self.logger.exception(f"{utils.class_fullname(e)}: [SKU:{self._sku}] index error on parsing meta {_attr} - {str(e)}")
+                self.logger.exception(f"{utils.class_fullname(e)}: [SKU:{ctx.sku}] index error on parsing meta {_attr} - {str(e)}")
         return meta_data
 
     def parse_item(self, response, domain, job_id, crawl_variations=False, lat=None, lng=None):
-        self._domain = domain
-        self._job_id = job_id
-        self._sku = utils.extract_sku_from_url(response.url, self._domain)
-        if not self._sku:
-            self.logger.exception("[{}][null] Request ignored - no parent SKU".format(self._domain))
+        ctx = fieldspecs.ExtractionContext(response, domain=domain, job_id=job_id, sku=utils.extract_sku_from_url(response.url, domain))
+        if not ctx.sku:
+            self.logger.exception("[{}][null] Request ignored - no parent SKU".format(ctx.domain))
             raise IgnoreRequest
         if response.status != 200:
             # broken link or inactive item
-            yield self.build_listing_item(response)
+            yield self.build_listing_item(ctx)
         else:
-            _data = self.__get_preloaded_data(response)
-            _meta_data = self.__extract_meta_data(response)
+            _data = self.__get_preloaded_data(ctx)
+            _meta_data = self.__extract_meta_data(ctx)
             if crawl_variations:
                 for p in _data.get('item', {}).get('product', {}).get('buyBox', {}).get('products', []):
                     if 'usItemId' in p:
-                        yield Request(settings.WALMART_COM_ITEM_LINK_FORMAT.format(self._domain,
+                        yield Request(settings.WALMART_COM_ITEM_LINK_FORMAT.format(ctx.domain,
                                                                                 p['usItemId'],
                                                                                 settings.WALMART_COM_ITEM_VARIATION_LINK_POSTFIX),
                                     callback=parsers.parse_walmart_com_item,
                                     errback=parsers.resp_error_handler,
                                     cb_kwargs={
-                                        'domain': self._domain,
-                                        'job_id': self._job_id,
+                                        'domain': ctx.domain,
+                                        'job_id': ctx.job_id,
                                         'crawl_variations': False,
                                         'lat': lat,
                                         'lng': lng,
                                     })
-            yield self.build_listing_item(response, data=_data, meta_data=_meta_data)
+            yield self.build_listing_item(ctx, data=_data, meta_data=_meta_data)
 
-    def build_listing_item(self, response, data=None, meta_data=None):
-        """ response: scrapy.http.response.html.HtmlResponse
+    def build_listing_item(self, ctx, data=None, meta_data=None):
+        """ ctx: fieldspecs.ExtractionContext
             data: json
         """
+        response = ctx.response
         listing_item = ListingItem()
         listing_item['url'] = response.request.url
-        listing_item['domain'] = self._domain
+        listing_item['domain'] = ctx.domain
         listing_item['http_status'] = response.status
         listing_item['data'] = data
         listing_item['meta_data'] = meta_data
-        listing_item['job_id'] = self._job_id
+        listing_item['job_id'] = ctx.job_id
         return listing_item
 
 class WalmartCaItemParser(object):
-    _domain = None
-    _job_id = None
-    _parent_sku = None
-    _referer_for_jsonrequest = None
+    """ stateless - one instance (pwbot.parsers) parses every response. per page state is kept in fieldspecs.ExtractionContext,
+        and passed to the api callbacks by cb_kwargs
+    """
 
     def __init__(self):
         self.logger = logging.getLogger(utils.class_fullname(self))
 
-    def __get_preloaded_data(self, response):
-        _pattern = re.compile(r"window\.__PRELOADED_STATE__=({.*?});", re.MULTILINE | re.DOTALL)
+    def __get_preloaded_data(self, ctx):
         _data = '{}'
         try:
-            _data = response.xpath("//script[contains(., 'window.__PRELOADED_STATE__')]/text()").re(_pattern)[0]
+            _data = ctx.xpath("//script[contains(., 'window.__PRELOADED_STATE__')]/text()").re(_PRELOADED_STATE_PATTERN)[0]
         except IndexError as e:
-            self.logger.exception("{}: [{}][{}] unable to find preloaded data - {}".format(utils.class_fullname(e), self._domain, self._parent_sku, str(e)))
+            self.logger.exception("{}: [{}][{}] unable to find preloaded data - {}".format(utils.class_fullname(e), ctx.domain, ctx.parent_sku, str(e)))
             raise IgnoreRequest
-        return json.loads(_data)
+        return fastjson.loads_paths(_data, WALMART_CA_PRELOADED_DATA_PATHS)
 
-    def __extract_meta_data(self, response):
+    def __extract_meta_data(self, ctx):
         meta_data = {}
-        for _m in response.xpath("//meta/@name"):  # has 'name' attributes?
+        for _m in ctx.xpath("//meta/@name"):  # has 'name' attributes?
             _attr = _m.extract()
             try:
-                meta_data[_attr] = response.xpath(f"//meta[@name='{_attr}']/@content")[0].extract()
+                meta_data[_attr] = ctx.xpath(f"//meta[@name='{_attr}']/@content")[0].extract()
             except IndexError as e:
-                self.logger.exception(f"{utils.class_fullname(e)}: [SKU:{self._parent_sku}] index error on parsing meta {_attr} - {str(e)}")
-        for _m in response.xpath("//meta/@property"):  # has 'property' attributes?
+                self.logger.exception(f"{utils.class_fullname(e)}: [SKU:{ctx.parent_sku}] index error on parsing meta {_attr} - {str(e)}")
+        for _m in ctx.xpath("//meta/@property"):  # has 'property' attributes?
             _attr = _m.extract()
             try:
-                meta_data[_attr] = response.xpath(f"//meta[@property='{_attr}']/@content")[0].extract()
+                meta_data[_attr] = ctx.xpath(f"//meta[@property='{_attr}']/@content")[0].extract()
             except IndexError as e:
-                self.logger.exception(f"{utils.class_fullname(e)}: [SKU:{self._parent_sku}] index error on parsing meta {_attr} - {str(e)}")
+                self.logger.exception(f"{utils.class_fullname(e)}: [SKU:{ctx.parent_sku}] index error on parsing meta {_attr} - {str(e)}")
         return meta_data
 
     def parse_item(self, response, domain, job_id, crawl_variations=False, lat=None, lng=None):
-        self._referer_for_jsonrequest = response.request.url
-        self._domain = domain
-        self._job_id = job_id
-        self._parent_sku = utils.extract_sku_from_url(response.url, self._domain)
-        if not self._parent_sku:
-            self.logger.exception("[{}][null] Request ignored - no parent SKU".format(self._domain))
+        ctx = fieldspecs.ExtractionContext(response, domain=domain, job_id=job_id, parent_sku=utils.extract_sku_from_url(response.url, domain))
+        if not ctx.parent_sku:
+            self.logger.exception("[{}][null] Request ignored - no parent SKU".format(ctx.domain))
             raise IgnoreRequest
         if response.status != 200:
             # broken link or inactive item
-            yield self.build_listing_item(response)
+            yield self.build_listing_item(ctx)
         else:
-            _data = self.__get_preloaded_data(response)
-            _meta_data = self.__extract_meta_data(response)
-            yield self.build_listing_item(response, data=_data, meta_data=_meta_data)
-            yield JsonRequest(settings.WALMART_CA_API_ITEM_PRICE_LINK_FORMAT.format(self._parent_sku),
-                        callback=self.parse_json_response,
+            _data = self.__get_preloaded_data(ctx)
+            _meta_data = self.__extract_meta_data(ctx)
+            yield self.build_listing_item(ctx, data=_data, meta_data=_meta_data)
+            yield JsonRequest(settings.WALMART_CA_API_ITEM_PRICE_LINK_FORMAT.format(ctx.parent_sku),
+                        callback=parsers.parse_walmart_ca_json_response,
                         errback=parsers.resp_error_handler,
                         meta={
                             # crawlera proxy interrupt ajax calls
                             'dont_proxy': True,
+                            # on the critical path of the product (pwbot.middlewares.LatencyAwareMiddleware)
+                            'hedge': True,
                         },
                         headers={
-                            'Referer': self._referer_for_jsonrequest,
+                            'Referer': response.request.url,
+                        },
+                        cb_kwargs={
+                            'domain': ctx.domain,
+                            'job_id': ctx.job_id,
+                            'parent_sku': ctx.parent_sku,
                         },
                         data={
                             "pricingStoreId": str(response.request.cookies.get('defaultNearestStoreId')),
@@ -164,48 +169,56 @@ class WalmartCaItemParser(object):
                     yield JsonRequest(settings.WALMART_CA_API_ITEM_FIND_IN_STORE_LINK_FORMAT.format(lat=lat,
                                                                                                     lng=lng,
                                                                                                     upc=sku_data['upc'][0],
-                                                                                                    pid=self._parent_sku),
-                            callback=self.parse_json_response,
+                                                                                                    pid=ctx.parent_sku),
+                            callback=parsers.parse_walmart_ca_json_response,
                             errback=parsers.resp_error_handler,
                             meta={
                                 # crawlera proxy interrupt ajax calls
                                 'dont_proxy': True,
+                                'hedge': True,
                             },
                             headers={
-                                'Referer': self._referer_for_jsonrequest,
+                                'Referer': response.request.url,
+                            },
+                            cb_kwargs={
+                                'domain': ctx.domain,
+                                'job_id': ctx.job_id,
+                                'parent_sku': ctx.parent_sku,
                             })
 
-    def parse_json_response(self, response):
+    def parse_json_response(self, response, domain, job_id, parent_sku):
+        ctx = fieldspecs.ExtractionContext(response, domain=domain, job_id=job_id, parent_sku=parent_sku)
         try:
-            json_data = json.loads(response.text)
+            json_data = fastjson.loads(response.body)
         except TypeError as e:
             self.logger.exception("{}: [{}][{}] invalid resp. ({}) - {}".format(utils.class_fullname(e),
-                                                                                            self._domain,
-                                                                                            self._parent_sku,
+                                                                                            ctx.domain,
+                                                                                            ctx.parent_sku,
                                                                                             response.url,
                                                                                             str(e)))
             raise IgnoreRequest
-        except json.decoder.JSONDecodeError as e:
+        except fastjson.JSONDecodeError as e:
             self.logger.exception("{}: [{}][{}] invalid resp. ({}) - {}".format(utils.class_fullname(e),
-                                                                                            self._domain,
-                                                                                            self._parent_sku,
+                                                                                            ctx.domain,
+                                                                                            ctx.parent_sku,
                                                                                             response.url,
                                                                                             str(e)))
             raise IgnoreRequest
         else:
-            return self.build_listing_item(response, data=json_data)
+            return self.build_listing_item(ctx, data=json_data)
 
-    def build_listing_item(self, response, data=None, meta_data=None):
-        """ response: scrapy.http.response.html.HtmlResponse
+    def build_listing_item(self, ctx, data=None, meta_data=None):
+        """ ctx: fieldspecs.ExtractionContext
             data: json
         """
+        response = ctx.response
         listing_item = ListingItem()
         listing_item['url'] = response.request.url
-        listing_item['domain'] = self._domain
+        listing_item['domain'] = ctx.domain
         listing_item['http_status'] = response.status
         listing_item['data'] = data
         listing_item['meta_data'] = meta_data
-        listing_item['job_id'] = self._job_id
+        listing_item['job_id'] = ctx.job_id
         return listing_item
 
     # def __parse_item_helper(self, response):
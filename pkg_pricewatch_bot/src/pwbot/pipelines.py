@@ -6,6 +6,274 @@
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 
 
+import json
+import time
+import logging
+import treq
+from twisted.internet import task, defer
+from scrapy.exporters import PythonItemExporter
+from scrapy.exceptions import DropItem
+from pwbot import utils, transport
+from pwbot.spool import ItemSpool
+from pwbot.settings import config
+
+
+class RawDataExportPipeline(object):
+    """ pwbot.pipelines.RawDataExportPipeline
+
+        buffer scraped ListingItems and send them to pwweb in batches.
+
+        a batch is flushed once PWWEB_EXPORT_BATCH_SIZE items are buffered, or
+        every PWWEB_EXPORT_FLUSH_INTERVAL seconds. at most PWWEB_EXPORT_MAX_IN_FLIGHT
+        batches are sent at once - process_item() holds the next item back
+        until a slot is free, so a slow pwweb slows the crawl down instead of
+        growing the buffer unbounded.
+
+        batches are encoded/compressed as PWWEB_EXPORT_ENCODING and
+        PWWEB_EXPORT_COMPRESSION (see pwbot.transport). if pwweb cannot
+        decode them (415), the pipeline falls back to plain json.
+
+        with PWWEB_SPOOL_ENABLED every item is appended to a local spool
+        (see pwbot.spool) before it is buffered, and acknowledged once pwweb
+        accepted its batch. process_item() then never waits: a full batch
+        with no free slot stays on disk, and is replayed as soon as a slot is
+        free or on the next flush interval. undelivered items are replayed
+        when the spider closes, on the next run, or with 'python run.py replay'.
+    """
+
+    def __init__(self, stats, batch_size=100, flush_interval=5.0, max_in_flight=4, encoding='json', compression=None, spool=None, pool=None):
+        self.logger = logging.getLogger(utils.class_fullname(self))
+        self._stats = stats
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._semaphore = defer.DeferredSemaphore(max_in_flight)
+        self._buffer = []
+        self._in_flight = []
+        self._sending = set() # spool ids in flight
+        self._spooled = False # spooled records wait for a free slot
+        self._replaying = False
+        self._loop = None
+        if not transport.is_available_encoding(encoding):
+            self.logger.warning("encoding '{}' not available. fall back to json".format(encoding))
+            encoding = 'json'
+        if not transport.is_available_compression(compression):
+            self.logger.warning("compression '{}' not available. fall back to gzip".format(compression))
+            compression = 'gzip'
+        self._encoding = encoding
+        self._compression = compression
+        self._spool = spool
+        self._pool = pool
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(stats=crawler.stats,
+                batch_size=crawler.settings.getint('PWWEB_EXPORT_BATCH_SIZE', 100),
+                flush_interval=crawler.settings.getfloat('PWWEB_EXPORT_FLUSH_INTERVAL', 5.0),
+                max_in_flight=crawler.settings.getint('PWWEB_EXPORT_MAX_IN_FLIGHT', 4),
+                encoding=crawler.settings.get('PWWEB_EXPORT_ENCODING', 'json'),
+                compression=crawler.settings.get('PWWEB_EXPORT_COMPRESSION'),
+                spool=ItemSpool(crawler.settings.get('PWWEB_SPOOL_DIRPATH'),
+                    segment_size=crawler.settings.getint('PWWEB_SPOOL_SEGMENT_SIZE', 64 * 1024 * 1024)
+                ) if crawler.settings.getbool('PWWEB_SPOOL_ENABLED', False) else None,
+                pool=transport.get_pool(
+                    max_persistent_per_host=crawler.settings.getint('PWWEB_HTTP_POOL_MAXSIZE_PER_HOST', 8),
+                    cached_connection_timeout=crawler.settings.getint('PWWEB_HTTP_POOL_IDLE_TIMEOUT', 240)))
+
+    def open_spider(self, spider):
+        self._loop = task.LoopingCall(self._flush_on_interval)
+        self._loop.start(self._flush_interval, now=False)
+        if self._spool is not None:
+            # items left over by previous runs. whatever does not fit in a free slot is sent later
+            self._replay(wait=False)
+
+    def close_spider(self, spider):
+        """ flush what is left and wait for every batch in flight,
+            so spider_closed (build item prices) runs on complete data
+        """
+        if self._loop and self._loop.running:
+            self._loop.stop()
+        d = self._flush()
+        d.addCallback(lambda _: defer.DeferredList(list(self._in_flight)))
+        if self._spool is not None:
+            d.addCallback(lambda _: self._replay())
+            d.addCallback(lambda _: defer.DeferredList(list(self._in_flight)))
+            d.addBoth(self._close_spool)
+        return d
+
+    def process_item(self, item, spider):
+        if type(item).__name__ not in ['ListingItem',]:
+            raise DropItem("Invalid item type - {}".format(type(item).__name__))
+        record = self._serialize(item)
+        self._buffer.append((self._spool.append(record) if self._spool is not None else None, record))
+        self._set_queue_depth()
+        if len(self._buffer) < self._batch_size:
+            return item
+        if self._spool is not None:
+            self._flush(wait=False)
+            return item
+        d = self._flush()
+        d.addCallback(lambda _: item)
+        return d
+
+    def _serialize(self, item, **kwargs):
+        e = PythonItemExporter(binary=False, **kwargs)
+        return e.export_item(item)
+
+    def _set_queue_depth(self):
+        self._stats.set_value('pwbot/export/queue_depth', len(self._buffer))
+        self._stats.max_value('pwbot/export/queue_depth_max', len(self._buffer))
+
+    def _flush_on_interval(self):
+        if len(self._buffer) > 0:
+            self._flush(wait=False)
+        self._replay_spooled()
+
+    def _replay_spooled(self):
+        if self._spooled and not self._replaying and self._semaphore.tokens > 0:
+            self._replay(wait=False)
+
+    def _flush(self, wait=True):
+        """ returns a deferred fired as soon as the batch has a free slot
+            (not when the batch is delivered)
+        """
+        if len(self._buffer) < 1:
+            return defer.succeed(None)
+        batch, self._buffer = self._buffer, []
+        self._set_queue_depth()
+        if self._spool is not None:
+            # one fsync per batch
+            self._spool.sync()
+            if not wait and self._semaphore.tokens < 1:
+                # pwweb is behind. the batch stays on disk and is sent on replay
+                self._stats.inc_value('pwbot/export/items_spooled', len(batch))
+                self._spooled = True
+                return defer.succeed(None)
+        return self._send(batch)
+
+    @defer.inlineCallbacks
+    def _replay(self, wait=True):
+        """ send records not acknowledged yet from the spool - but the ones
+            buffered or in flight. with wait=False, stop as soon as no slot is free
+        """
+        self._replaying, self._spooled = True, False
+        try:
+            skip = self._sending | set(_id for _id, _ in self._buffer)
+            batch = []
+            for entry in self._spool.pending():
+                if entry[0] in skip:
+                    continue
+                batch.append(entry)
+                if len(batch) < self._batch_size:
+                    continue
+                if not wait and self._semaphore.tokens < 1:
+                    self._spooled = True
+                    return
+                self._stats.inc_value('pwbot/export/items_replayed', len(batch))
+                yield self._send(batch)
+                batch = []
+            if len(batch) > 0:
+                if not wait and self._semaphore.tokens < 1:
+                    self._spooled = True
+                    return
+                self._stats.inc_value('pwbot/export/items_replayed', len(batch))
+                yield self._send(batch)
+        finally:
+            self._replaying = False
+
+    def _close_spool(self, result):
+        self._spool.close()
+        return result
+
+    def _send(self, batch):
+        """ batch: list of (spool id, record)
+        """
+        records = [record for _, record in batch]
+        ids = set(_id for _id, _ in batch if _id is not None)
+        acquired = self._semaphore.acquire()
+        delivered = defer.Deferred()
+        self._in_flight.append(delivered)
+        self._sending |= ids
+
+        def _send(_):
+            self._stats.set_value('pwbot/export/batches_in_flight', len(self._in_flight))
+            started = time.time()
+            d = self._post_batch(records)
+            d.addCallbacks(self._cb_batch_sent, self._eb_batch_failed,
+                        callbackArgs=(records, started), errbackArgs=(records,))
+            d.addCallback(_ack)
+            d.addBoth(_done)
+
+        def _ack(delivered):
+            if delivered and self._spool is not None:
+                self._spool.ack([_id for _id, _ in batch])
+
+        def _done(_):
+            self._semaphore.release()
+            self._in_flight.remove(delivered)
+            self._sending -= ids
+            self._stats.set_value('pwbot/export/batches_in_flight', len(self._in_flight))
+            delivered.callback(None)
+            # the free slot goes to spooled records first
+            if self._spool is not None:
+                self._replay_spooled()
+
+        acquired.addCallback(_send)
+        return acquired
+
+    def _post_batch(self, batch):
+        d = self._post(batch, self._encoding, self._compression)
+
+        def _cb(resp):
+            if resp.code != 415 or (self._encoding, self._compression) == ('json', None):
+                return resp
+            self.logger.warning("{}: pwweb does not accept {}/{} payloads. fall back to plain json".format(resp.code, self._encoding, self._compression))
+            self._encoding, self._compression = 'json', None
+            d_text = resp.text(encoding='UTF-8')
+            d_text.addCallback(lambda _: self._post(batch, self._encoding, self._compression))
+            return d_text
+
+        d.addCallback(_cb)
+        return d
+
+    def _post(self, batch, encoding, compression):
+        body, headers = transport.encode_payload(batch, encoding, compression)
+        self._stats.inc_value('pwbot/export/bytes_sent', len(body))
+        return treq.post('http://{}:{}/api/resource/raw_data/bulk/'.format(
+                    config['PriceWatchWeb']['host'], config['PriceWatchWeb']['port']),
+            body,
+            headers=headers,
+            pool=self._pool
+        )
+
+    @defer.inlineCallbacks
+    def _cb_batch_sent(self, resp, batch, started):
+        text = yield resp.text(encoding='UTF-8')
+        latency = time.time() - started
+        self._stats.set_value('pwbot/export/flush_latency_last', latency)
+        self._stats.max_value('pwbot/export/flush_latency_max', latency)
+        self._stats.inc_value('pwbot/export/flush_latency_total', latency)
+        if resp.code >= 400:
+            self._stats.inc_value('pwbot/export/batches_failed')
+            self._stats.inc_value('pwbot/export/items_failed', len(batch))
+            self.logger.error("{}: HTTP Error: failed to create/update {} items - {}".format(resp.code, len(batch), text))
+            return False
+        self._stats.inc_value('pwbot/export/batches_sent')
+        errors = json.loads(text).get('errors', []) if resp.code == 207 else []
+        for e in errors:
+            self.logger.error("{}: failed to create/update item ({}) - {}".format(resp.code, batch[e['index']].get('url'), e['errors']))
+        self._stats.inc_value('pwbot/export/items_sent', len(batch) - len(errors))
+        if len(errors) > 0:
+            self._stats.inc_value('pwbot/export/items_failed', len(errors))
+        # invalid records will not get better on resend. acknowledge them as well
+        return True
+
+    def _eb_batch_failed(self, failure, batch):
+        self._stats.inc_value('pwbot/export/batches_failed')
+        self._stats.inc_value('pwbot/export/items_failed', len(batch))
+        self.logger.error("{}: failed to send {} items - {}".format(utils.class_fullname(failure.value), len(batch), failure.getErrorMessage()))
+        return False
+
+
 # import logging
 # from scrapy.exceptions import DropItem
 
@@ -22,4 +290,4 @@
 #             return item
 #         except Exception as e:
 #             self.logger.exception("{}: Error on saving item to db - {}".format(utils.class_fullname(e), str(e)))
-#             raise DropItem
\ No newline at end of file
+#             raise DropItem
@@ -0,0 +1,216 @@
+""" pwbot.proxies
+
+    proxy sessions and their health, for pwbot.middlewares.BanRetryMiddleware.
+
+    a session is whatever a backend routes a request through - a proxy url
+    (static), a scrapoxy instance, a crawlera session. ProxyPool knows the
+    sessions by id only and keeps a health score of each:
+
+        score       ewma of the outcomes (ok: 1, error/ban: 0), from 1.0
+        ban         the session cools down PROXY_POOL_COOLDOWN seconds
+        score below PROXY_POOL_MIN_SCORE
+                    cools down as well, and comes back at PROXY_POOL_MIN_SCORE
+
+    pick() shares requests between the available sessions in proportion to
+    their scores. backends (PROXY_POOL_BACKEND):
+
+        'static'    PROXY_POOL_URLS are the proxies. every request is routed
+                    through one of them (meta 'proxy')
+        'scrapoxy'  PROXY_POOL_URLS[0] is the scrapoxy proxy. sessions are its
+                    instances (x-cache-proxyname response header), learned from
+                    the responses. retries are pinned to another instance
+        'crawlera'  routed by scrapy_crawlera.CrawleraMiddleware. retries go
+                    through a new/another crawlera session (X-Crawlera-Session)
+
+    meta 'dont_proxy' requests are not routed.
+"""
+
+import time
+from urllib.parse import urlsplit, urlunsplit
+from pwbot import throttle
+
+
+def display(session):
+    """ a session id without credentials (proxy urls) - for logs
+    """
+    if session is None or '@' not in session:
+        return session
+    parts = urlsplit(session)
+    return urlunsplit((parts.scheme, parts.netloc.rsplit('@', 1)[1], parts.path, parts.query, parts.fragment))
+
+
+class ProxyHealth(object):
+    def __init__(self, score=1.0):
+        self.score = score
+        self.picks = 0
+        self.oks = 0
+        self.errors = 0
+        self.bans = 0
+        self.cooldown_until = 0.0
+
+
+class ProxyPool(object):
+    def __init__(self, sessions=(), alpha=0.2, min_score=0.3, cooldown=300.0, clock=time.time):
+        self.alpha = alpha
+        self.min_score = min_score
+        self.cooldown = cooldown
+        self.clock = clock
+        self.sessions = {}
+        for session in sessions:
+            self.add(session)
+
+    def add(self, session):
+        if session not in self.sessions:
+            self.sessions[session] = ProxyHealth()
+        return self.sessions[session]
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def is_available(self, session):
+        health = self.sessions.get(session)
+        return health is not None and health.cooldown_until <= self.clock()
+
+    def record(self, session, outcome):
+        """ outcome: throttle.OK, throttle.ERROR, throttle.BAN
+            returns True if the session started to cool down
+        """
+        if session is None:
+            return False
+        health = self.add(session)
+        if outcome == throttle.OK:
+            health.oks += 1
+        elif outcome == throttle.BAN:
+            health.bans += 1
+        else:
+            health.errors += 1
+        health.score = (1 - self.alpha) * health.score + self.alpha * (1.0 if outcome == throttle.OK else 0.0)
+        if outcome == throttle.BAN or health.score < self.min_score:
+            if health.cooldown_until <= self.clock():
+                health.cooldown_until = self.clock() + self.cooldown
+                health.score = max(health.score, self.min_score)
+                return True
+        return False
+
+    def pick(self, exclude=()):
+        """ an available session not in exclude, by score. the one cooling down
+            the shortest if none is available. None if the pool has no other sessions
+        """
+        now = self.clock()
+        candidates = [(s, h) for s, h in self.sessions.items() if s not in exclude]
+        if len(candidates) < 1:
+            return None
+        available = [(s, h) for s, h in candidates if h.cooldown_until <= now]
+        if len(available) > 0:
+            # requests in proportion to the scores
+            session, health = min(available, key=lambda c: (c[1].picks + 1) / max(c[1].score, 0.01))
+        else:
+            session, health = min(candidates, key=lambda c: c[1].cooldown_until)
+        health.picks += 1
+        return session
+
+
+class ProxyBackend(object):
+    """ how requests are routed through the sessions of a proxy service
+    """
+
+    name = None
+    # every request is routed through a session of the pool
+    pin_all = False
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls()
+
+    def sessions(self):
+        """ the sessions known before the crawl
+        """
+        return []
+
+    def session_of(self, request, response=None):
+        """ the session the request/response went through, or None
+        """
+        return None
+
+    def route(self, request, session=None, retry=False):
+        """ route the request (in place) through the session. session None: any
+        """
+        pass
+
+
+class StaticProxyBackend(ProxyBackend):
+    name = 'static'
+    pin_all = True
+
+    def __init__(self, urls):
+        self.urls = list(urls)
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(settings.getlist('PROXY_POOL_URLS'))
+
+    def sessions(self):
+        return self.urls
+
+    def session_of(self, request, response=None):
+        return request.meta.get('proxy')
+
+    def route(self, request, session=None, retry=False):
+        if session is not None:
+            request.meta['proxy'] = session
+
+
+class ScrapoxyBackend(ProxyBackend):
+    name = 'scrapoxy'
+    header = 'x-cache-proxyname'
+
+    def __init__(self, url):
+        self.url = url
+
+    @classmethod
+    def from_settings(cls, settings):
+        urls = settings.getlist('PROXY_POOL_URLS')
+        if len(urls) < 1:
+            raise ValueError("PROXY_POOL_URLS: the scrapoxy proxy url is required")
+        return cls(urls[0])
+
+    def session_of(self, request, response=None):
+        session = response.headers.get(self.header) if response is not None else None
+        if session is None:
+            session = request.headers.get(self.header)
+        return session.decode('utf-8') if session is not None else None
+
+    def route(self, request, session=None, retry=False):
+        request.meta['proxy'] = self.url
+        if session is not None:
+            request.headers[self.header] = session
+        elif self.header in request.headers:
+            del request.headers[self.header]
+
+
+class CrawleraBackend(ProxyBackend):
+    name = 'crawlera'
+    header = 'X-Crawlera-Session'
+
+    def session_of(self, request, response=None):
+        session = response.headers.get(self.header) if response is not None else None
+        if session is None:
+            session = request.headers.get(self.header)
+        if session is None or session == b'create':
+            return None
+        return session.decode('utf-8')
+
+    def route(self, request, session=None, retry=False):
+        # crawlera rotates by itself. only retries get a session
+        if retry:
+            request.headers[self.header] = session if session is not None else 'create'
+
+
+BACKENDS = {backend.name: backend for backend in [StaticProxyBackend, ScrapoxyBackend, CrawleraBackend,]}
+
+
+def build_backend(settings):
+    name = settings.get('PROXY_POOL_BACKEND')
+    if name not in BACKENDS:
+        raise ValueError("PROXY_POOL_BACKEND: unknown backend {}. one of {}".format(name, ', '.join(sorted(BACKENDS))))
+    return BACKENDS[name].from_settings(settings)
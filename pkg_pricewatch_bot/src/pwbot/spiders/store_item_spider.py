@@ -3,18 +3,22 @@
 
 import json
 import treq
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import inlineCallbacks, DeferredList
 from scrapy import Request
 from scrapy import signals
-from scrapy.exporters import PythonItemExporter
-from scrapy.exceptions import DropItem
-from pwbot import settings, parsers, utils
+from pwbot import settings, parsers, utils, transport
+from pwbot.parsers import fieldspecs
+from pwbot.parsers.amazon_item_parser import FIELDS_PRICE
+from pwbot.parsers.pool import ParserPool
 from pwbot.spiders import BasePwbotCrawlSpider
 from pwbot.settings import config
 
 
 class StoreItemPageSpider(BasePwbotCrawlSpider):
     """ pwbot.spiders.store_item_spider.StoreItemPageSpider
+
+        domains registered in pwbot.parsers.fieldspecs are crawled as well,
+        and parsed by pwbot.parsers.parse_store_item.
     """
 
     name = 'StoreItemPageSpider'
@@ -27,15 +31,20 @@ class StoreItemPageSpider(BasePwbotCrawlSpider):
     _crawl_variations = True
     _lat = None
     _lng = None
+    _fields = None
+    _parser_pool = None
 
     def __init__(self, *a, **kw):
         super().__init__(*a, **kw)
+        self.allowed_domains = self.allowed_domains + [d for d in fieldspecs.FIELD_SPECS if d not in self.allowed_domains]
         self._domain = kw['domain'] if 'domain' in kw and kw['domain'] in self.allowed_domains else None
         self._skus = kw['skus'].split(',') if 'skus' in kw else []
         self._urls = kw['urls'].split(',') if 'urls' in kw else []
         self._crawl_variations = utils.true_or_false(kw['crawl_variations']) if 'crawl_variations' in kw else None
         self._lat = kw['lat'] if 'lat' in kw else None
         self._lng = kw['lng'] if 'lng' in kw else None
+        # fields=price: price tracking - compact items with the status determining fields only (amazon)
+        self._fields = kw['fields'] if 'fields' in kw and kw['fields'] in [FIELDS_PRICE,] else None
 
     def start_requests(self):
         if len(self._skus) > 0:
@@ -43,17 +52,23 @@ class StoreItemPageSpider(BasePwbotCrawlSpider):
                 _dont_obey_robotstxt = False
                 if self._domain in ['amazon.com', 'amazon.ca',]:
                     url = settings.AMAZON_ITEM_LINK_FORMAT.format(self._domain, sku, settings.AMAZON_ITEM_VARIATION_LINK_POSTFIX)
-                    callback = parsers.parse_amazon_item
+                    callback = self._callback(parsers.parse_amazon_item)
                 elif self._domain in ['walmart.com',]:
                     url = settings.WALMART_COM_ITEM_LINK_FORMAT.format(self._domain, sku, settings.WALMART_COM_ITEM_VARIATION_LINK_POSTFIX)
-                    callback = parsers.parse_walmart_com_item
+                    callback = self._callback(parsers.parse_walmart_com_item)
                 elif self._domain in ['walmart.ca',]:
                     url = settings.WALMART_CA_ITEM_LINK_FORMAT.format(self._domain, sku)
-                    callback = parsers.parse_walmart_ca_item
+                    callback = self._callback(parsers.parse_walmart_ca_item)
                 elif self._domain in ['canadiantire.ca',]:
                     _dont_obey_robotstxt = True # temp solution: avoid 504 Connection Time-out
                     url = settings.CANADIANTIRE_CA_ITEM_LINK_FORMAT.format(self._domain, sku)
-                    callback = parsers.parse_canadiantire_ca_item
+                    callback = self._callback(parsers.parse_canadiantire_ca_item)
+                elif self._domain in fieldspecs.FIELD_SPECS:
+                    url = fieldspecs.FIELD_SPECS[self._domain].link(self._domain, sku)
+                    if url is None:
+                        self.logger.error("[{}][{}] SKU ignored - no link_format in the field spec".format(self._domain, sku))
+                        continue
+                    callback = self._callback(parsers.parse_store_item)
                 else:
                     continue
                 yield Request(url,
@@ -68,6 +83,7 @@ class StoreItemPageSpider(BasePwbotCrawlSpider):
                                 'crawl_variations': self._crawl_variations,
                                 'lat': self._lat,
                                 'lng': self._lng,
+                                'fields': self._fields,
                             })
         if len(self._urls) > 0:
             for _u in self._urls:
@@ -77,21 +93,24 @@ class StoreItemPageSpider(BasePwbotCrawlSpider):
                     url = settings.AMAZON_ITEM_LINK_FORMAT.format(domain,
                                                             utils.extract_sku_from_url(url=_u, domain=domain),
                                                             settings.AMAZON_ITEM_VARIATION_LINK_POSTFIX)
-                    callback = parsers.parse_amazon_item
+                    callback = self._callback(parsers.parse_amazon_item)
                 elif domain in ['walmart.com',]:
                     url = settings.WALMART_COM_ITEM_LINK_FORMAT.format(domain,
                                                             utils.extract_sku_from_url(url=_u, domain=domain),
                                                             settings.WALMART_COM_ITEM_VARIATION_LINK_POSTFIX)
-                    callback = parsers.parse_walmart_com_item
+                    callback = self._callback(parsers.parse_walmart_com_item)
                 elif domain in ['walmart.ca',]:
                     url = settings.WALMART_CA_ITEM_LINK_FORMAT.format(domain,
                                                             utils.extract_sku_from_url(url=_u, domain=domain))
-                    callback = parsers.parse_walmart_ca_item
+                    callback = self._callback(parsers.parse_walmart_ca_item)
                 elif domain in ['canadiantire.ca',]:
                     _dont_obey_robotstxt = True # temp solution: avoid 504 Connection Time-out
                     url = settings.CANADIANTIRE_CA_ITEM_LINK_FORMAT.format(domain,
                                                             utils.extract_sku_from_url(url=_u, domain=domain))
-                    callback = parsers.parse_canadiantire_ca_item
+                    callback = self._callback(parsers.parse_canadiantire_ca_item)
+                elif domain in fieldspecs.FIELD_SPECS:
+                    url = _u
+                    callback = self._callback(parsers.parse_store_item)
                 else:
                     continue
                 yield Request(url,
@@ -106,46 +125,46 @@ class StoreItemPageSpider(BasePwbotCrawlSpider):
                                 'job_id': self._job_id,
                                 'lat': self._lat,
                                 'lng': self._lng,
+                                'fields': self._fields,
                             })
 
+    def start_skus(self):
+        """ {domain: [skus]} of the job - skus and urls
+        """
+        ret = {}
+        if self._domain and len(self._skus) > 0:
+            ret[self._domain] = list(self._skus)
+        for _u in self._urls:
+            domain = utils.extract_domain_from_url(_u)
+            sku = utils.extract_sku_from_url(url=_u, domain=domain) if domain in self.allowed_domains else None
+            if not sku and domain in fieldspecs.FIELD_SPECS:
+                sku = fieldspecs.FIELD_SPECS[domain].sku_from_url(_u)
+            if sku:
+                ret.setdefault(domain, []).append(sku)
+        return ret
+
     @classmethod
     def from_crawler(cls, crawler, *args, **kwargs):
         spider = super().from_crawler(crawler, *args, **kwargs)
-        crawler.signals.connect(spider.item_scraped, signal=signals.item_scraped)
+        # scraped items are sent to the server by pwbot.pipelines.RawDataExportPipeline
         crawler.signals.connect(spider.spider_closed, signal=signals.spider_closed)
+        if crawler.settings.getbool('PARSER_POOL_ENABLED'):
+            spider._parser_pool = ParserPool.from_crawler(crawler)
         return spider
 
-    def _serialize(self, item, **kwargs):
-        e = PythonItemExporter(binary=False, **kwargs)
-        return e.export_item(item)
-
-    def item_scraped(self, item, response, spider):
-        """ Send the scraped item to the server
+    def _callback(self, parser):
+        """ parser: pwbot.parsers function. parsed in the worker pool if enabled
         """
-        if type(item).__name__ not in ['ListingItem',]:
-            raise DropItem("Invalid item type - {}".format(type(item).__name__))
-
-        _logger = self.logger
-        @inlineCallbacks
-        def _cb(resp):
-            text = yield resp.text(encoding='UTF-8')
-            if resp.code >= 400:
-                _logger.error("{}: HTTP Error: failed to create/update item - {}".format(resp.code, text))
-
-        d = treq.post('http://{}:{}/api/resource/raw_data/'.format(
-                    config['PriceWatchWeb']['host'], config['PriceWatchWeb']['port']),
-            json.dumps(self._serialize(item)).encode('ascii'),
-            headers={b'Content-Type': [b'application/json']}
-        )
-        d.addCallback(_cb)
-        # The next item will be scraped only after
-        # deferred (d) is fired
-        return d
+        if self._parser_pool is not None:
+            return self._parser_pool.callback(parser.__name__)
+        return parser
 
     def spider_closed(self, spider):
         """ This signal supports returning deferreds from their handlers.
         """
         _logger = self.logger
+        # the workers exit while item prices are built
+        closing = [self._parser_pool.close(),] if self._parser_pool is not None else []
         @inlineCallbacks
         def _cb(resp):
             text = yield resp.text(encoding='UTF-8')
@@ -157,12 +176,13 @@ class StoreItemPageSpider(BasePwbotCrawlSpider):
             json.dumps({
                 'job_id': self._job_id
             }).encode('ascii'),
-            headers={b'Content-Type': [b'application/json']}
+            headers={b'Content-Type': [b'application/json']},
+            pool=transport.get_pool()
         )
         d.addCallback(_cb)
-        # The next item will be scraped only after
-        # deferred (d) is fired
-        return d
+        d.addErrback(lambda f: _logger.error("{}: failed to build item prices - {}".format(utils.class_fullname(f.value), f.getErrorMessage())))
+        d.addBoth(lambda _: transport.close_pool())
+        return DeferredList(closing + [d,])
 
 # class AmazonItemPageSpider(StoreItemPageSpider):
 
@@ -0,0 +1,145 @@
+""" pwbot.spool
+
+    local append-only spool of scraped items.
+
+    every item is appended to a segment file (one json record per line)
+    before it is sent to pwweb, and acknowledged once pwweb accepted it.
+    acknowledged line numbers are appended to a '.ack' file next to the
+    segment. a segment is removed as soon as all its records are
+    acknowledged, so whatever is left in the directory is undelivered and
+    can be replayed later.
+
+    segments are locked (flock) while a process writes or replays them, so
+    several scrapyd jobs can share the same spool directory.
+"""
+
+import os
+import time
+import json
+import fcntl
+import logging
+from pwbot import utils
+
+
+class ItemSpool(object):
+    SEGMENT_EXT = '.seg'
+    ACK_EXT = '.ack'
+
+    def __init__(self, dirpath, segment_size=64 * 1024 * 1024):
+        self.logger = logging.getLogger(utils.class_fullname(self))
+        self._dirpath = dirpath
+        self._segment_size = segment_size
+        self._segment = None
+        self._file = None
+        self._lineno = 0
+        self._locks = {} # segment -> locked file object
+        os.makedirs(self._dirpath, exist_ok=True)
+
+    def append(self, record):
+        """ append a record to the current segment. returns its id: (segment, line number)
+            the record is not durable until sync() is called
+        """
+        if self._file is None or self._file.tell() >= self._segment_size:
+            self._rotate()
+        self._file.write(json.dumps(record).encode('ascii') + b'\n')
+        self._lineno += 1
+        return (self._segment, self._lineno)
+
+    def sync(self):
+        """ flush and fsync the current segment - call once per batch, not per record
+        """
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def ack(self, ids):
+        """ mark records as delivered
+        """
+        linenos = {}
+        for segment, lineno in ids:
+            linenos.setdefault(segment, []).append(lineno)
+        for segment, _linenos in linenos.items():
+            with open(self._path(segment, self.ACK_EXT), 'ab') as f:
+                f.write(''.join('{}\n'.format(l) for l in _linenos).encode('ascii'))
+            if segment != self._segment:
+                self._remove_if_acked(segment)
+
+    def pending(self):
+        """ iterate (id, record) of every record not acknowledged yet, in the
+            current segment and in segments left over by previous runs.
+            segments locked by other running processes are skipped.
+        """
+        self.sync()
+        for segment in self._segments():
+            if segment != self._segment and not self._lock(segment):
+                continue
+            acked = self._acked(segment)
+            with open(self._path(segment, self.SEGMENT_EXT), 'rb') as f:
+                for lineno, line in enumerate(f, start=1):
+                    if lineno in acked or not line.endswith(b'\n'):
+                        # acknowledged, or partially written on a crash
+                        continue
+                    yield ((segment, lineno), json.loads(line))
+
+    def close(self):
+        """ remove fully acknowledged segments and release the locks
+        """
+        self.sync()
+        self._segment, self._file = None, None
+        for segment in list(self._locks.keys()):
+            self._remove_if_acked(segment)
+        for f in self._locks.values():
+            f.close()
+        self._locks = {}
+
+    def _rotate(self):
+        # the previous segment stays open (and locked) until all its records are acknowledged
+        if self._file is not None:
+            self.sync()
+        self._segment = '{}-{}'.format(time.time_ns(), os.getpid())
+        self._file = open(self._path(self._segment, self.SEGMENT_EXT), 'ab')
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._locks[self._segment] = self._file
+        self._lineno = 0
+
+    def _lock(self, segment):
+        if segment in self._locks:
+            return True
+        f = open(self._path(segment, self.SEGMENT_EXT), 'rb')
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return False
+        self._locks[segment] = f
+        return True
+
+    def _segments(self):
+        return sorted(n[:-len(self.SEGMENT_EXT)] for n in os.listdir(self._dirpath) if n.endswith(self.SEGMENT_EXT))
+
+    def _path(self, segment, ext):
+        return os.path.join(self._dirpath, segment + ext)
+
+    def _acked(self, segment):
+        try:
+            with open(self._path(segment, self.ACK_EXT), 'rb') as f:
+                return set(int(l) for l in f.read().split())
+        except FileNotFoundError:
+            return set()
+
+    def _remove_if_acked(self, segment):
+        try:
+            with open(self._path(segment, self.SEGMENT_EXT), 'rb') as f:
+                # a torn last line (crash) is not a record - pending() skips it
+                num_of_records = sum(1 for line in f if line.endswith(b'\n'))
+        except FileNotFoundError:
+            return
+        if len(self._acked(segment)) < num_of_records:
+            return
+        for ext in [self.SEGMENT_EXT, self.ACK_EXT,]:
+            try:
+                os.remove(self._path(segment, ext))
+            except FileNotFoundError:
+                pass
+        if segment in self._locks and segment != self._segment:
+            self._locks.pop(segment).close()
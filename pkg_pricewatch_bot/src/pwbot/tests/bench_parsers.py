@@ -0,0 +1,238 @@
+""" benchmark the store page parsers - machine readable, to compare parser changes release to release
+
+    python -m pwbot.tests.bench_parsers [--rounds 10] [--scale 1,4] [--domains amazon.ca,walmart.ca] [--output bench.json]
+
+    corpus: the testlists html pages (amazon), and synthetic pages for the
+    domains without saved pages (walmart.com, walmart.ca, canadiantire.ca).
+    loaded once. --scale n synthesizes n times larger pages: the page body is
+    repeated n-1 times (without element ids) before </body>.
+
+    for each domain and scale, in a forked process (so peak rss is per run):
+        pages_per_sec       every round parses each page from a fresh response
+        fields              mean/max ms of each field extractor, with a fresh
+                            extraction context per call (html already parsed)
+        peak_rss_kb         peak resident set size of the run (delta: above the rss at start)
+        alloc_peak_kb       tracemalloc peak of parsing one page (max over pages)
+        alloc_retained_kb   memory still allocated after the items are dropped (leaks)
+                            (tracemalloc sees python allocations only - lxml trees are in peak_rss_kb)
+
+    prints the json report, or writes it to --output.
+"""
+import re
+import sys
+import gc
+import json
+import time
+import inspect
+import logging
+import argparse
+import platform
+import tracemalloc
+import multiprocessing
+from datetime import datetime
+import lxml
+import parsel
+import scrapy
+from scrapy.http import HtmlResponse, Request
+from pwbot import parsers, utils as pwbot_utils
+from pwbot.parsers import fieldspecs, fieldstats
+from pwbot.parsers.amazon_item_parser import AmazonItemParserContext
+from pwbot.tests import utils
+from pwbot.tests.test_amazon_item_parser import build_response
+from pwbot.tests.test_fastjson import PRELOADED_STATE
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+_RE_ID_ATTR = re.compile(r"""\sid=(?:"[^"]*"|'[^']*')""")
+_RE_BODY = re.compile(r'<body[^>]*>(.*)</body>', re.DOTALL | re.IGNORECASE)
+
+SYNTHETIC_PAGES = {
+    'walmart.com': ('https://www.walmart.com/ip/Hotel-Spa-Robe/123456789',
+        '<html><head><meta name="title" content="Robe"><meta property="og:title" content="Robe"></head><body>'
+        '<script id="item" type="application/json">{}</script>'
+        '<div class="prod-ProductTitle">Robe</div>{}</body></html>'.format(
+            json.dumps({'item': {'product': {'buyBox': {'products': [{'usItemId': '123456789', 'priceMap': {'price': 39.99}}]}}, 'reviews': ['x' * 1000] * 20}}),
+            '<p class="about">x</p>' * 500)),
+    'walmart.ca': ('https://www.walmart.ca/en/ip/hotel-spa-robe/6000199112683',
+        '<html><head><meta name="title" content="Robe"></head><body><script>window.__PRELOADED_STATE__={};</script>{}</body></html>'.format(
+            json.dumps(PRELOADED_STATE), '<p class="about">x</p>' * 500)),
+    'canadiantire.ca': ('https://www.canadiantire.ca/en/pdp/mastercraft-drill-0541234p.html',
+        '<html><head><meta name="title" content="Drill"></head><body>'
+        '<div data-component="SkuSelectors" data-config=\'{}\'></div>'
+        '<div data-component="ProductReviews" data-config=\'{}\'></div>{}</body></html>'.format(
+            json.dumps({'pCode': '0541234P', 'skuListProperties': {'0541234': {}}}),
+            json.dumps({'reviews': ['x' * 1000] * 20}), '<p class="about">x</p>' * 500)),
+}
+
+# domain -> (parse function, parser, extraction context factory)
+DOMAIN_PARSERS = {
+    'amazon.com': (parsers.parse_amazon_item, parsers._amazon_item_parser,
+        lambda response, domain: AmazonItemParserContext(response, domain=domain, job_id='bench', asin=pwbot_utils.extract_sku_from_url(response.url, domain))),
+    'amazon.ca': (parsers.parse_amazon_item, parsers._amazon_item_parser,
+        lambda response, domain: AmazonItemParserContext(response, domain=domain, job_id='bench', asin=pwbot_utils.extract_sku_from_url(response.url, domain))),
+    'walmart.com': (parsers.parse_walmart_com_item, parsers._walmart_com_item_parser,
+        lambda response, domain: fieldspecs.ExtractionContext(response, domain=domain, job_id='bench', sku=pwbot_utils.extract_sku_from_url(response.url, domain))),
+    'walmart.ca': (parsers.parse_walmart_ca_item, parsers._walmart_ca_item_parser,
+        lambda response, domain: fieldspecs.ExtractionContext(response, domain=domain, job_id='bench', parent_sku=pwbot_utils.extract_sku_from_url(response.url, domain))),
+    'canadiantire.ca': (parsers.parse_canadiantire_ca_item, parsers._canadiantire_ca_item_parser,
+        lambda response, domain: fieldspecs.ExtractionContext(response, domain=domain, job_id='bench', sku=pwbot_utils.extract_sku_from_url(response.url, domain))),
+}
+
+
+def load_corpus():
+    """ returns {domain: [response, ...]}
+    """
+    corpus = {}
+    for t in utils.get_testlist('TestAmazonItemParser'):
+        corpus.setdefault(t['domain'], []).append(build_response(t['url'], t['html_filename'], t['domain']))
+    for domain, (url, html) in SYNTHETIC_PAGES.items():
+        corpus.setdefault(domain, []).append(HtmlResponse(url, request=Request(url, cookies={'defaultNearestStoreId': '1061'}), body=html.encode('utf-8')))
+    return corpus
+
+
+def scale_response(response, scale):
+    """ response with a scale times larger body. element ids are removed from the copies,
+        so the fields still select the original elements first
+    """
+    if scale <= 1:
+        return response
+    text = response.text
+    m = _RE_BODY.search(text)
+    if not m:
+        return response
+    filler = _RE_ID_ATTR.sub('', m.group(1)) * (scale - 1)
+    return response.replace(body=(text[:m.end(1)] + filler + text[m.end(1):]).encode('utf-8'), encoding='utf-8')
+
+
+def field_extractors(parser):
+    """ {field name: bound extractor} - the private __extract_*/__get_* methods of the parser
+    """
+    return {field: getattr(parser, name) for field, name in fieldstats.extractors(parser.__class__).items()}
+
+
+def parse(parse_function, response, domain):
+    return list(parse_function(response.replace(), domain=domain, job_id='bench', crawl_variations=False, lat='43.7292', lng='-79.393') or [])
+
+
+def _rss_kb():
+    if resource is None:
+        return None
+    # kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def bench_domain(domain, responses, rounds):
+    parse_function, parser, new_context = DOMAIN_PARSERS[domain]
+    rss_start = _rss_kb()
+    parse(parse_function, responses[0], domain) # warm up
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for response in responses:
+            parse(parse_function, response, domain)
+    elapsed = time.perf_counter() - started
+
+    fields = {}
+    for name, extractor in field_extractors(parser).items():
+        # extra arguments (i.e. default_price) given as None
+        args = [None for p in list(inspect.signature(extractor).parameters.values())[1:] if p.default is p.empty]
+        timings = []
+        for _ in range(rounds):
+            for response in responses:
+                ctx = new_context(response.replace(), domain)
+                ctx.root # html parsed out of the measure
+                started = time.perf_counter()
+                extractor(ctx, *args)
+                timings.append(time.perf_counter() - started)
+        fields[name] = {
+            'mean_ms': round(sum(timings) / len(timings) * 1000, 4),
+            'max_ms': round(max(timings) * 1000, 4),
+        }
+
+    alloc_peak = 0
+    gc.collect()
+    tracemalloc.start()
+    for response in responses:
+        tracemalloc.reset_peak()
+        parse(parse_function, response, domain)
+        alloc_peak = max(alloc_peak, tracemalloc.get_traced_memory()[1])
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    rss_peak = _rss_kb()
+    return {
+        'domain': domain,
+        'pages': len(responses),
+        'page_kb': round(sum(len(r.body) for r in responses) / len(responses) / 1024, 1),
+        'pages_per_sec': round(rounds * len(responses) / elapsed, 2),
+        'fields': fields,
+        'peak_rss_kb': rss_peak,
+        'peak_rss_delta_kb': rss_peak - rss_start if rss_peak is not None else None,
+        'alloc_peak_kb': round(alloc_peak / 1024, 1),
+        'alloc_retained_kb': round(retained / 1024, 1),
+    }
+
+
+def _bench_in_child(conn, domain, responses, rounds):
+    logging.disable(logging.CRITICAL)
+    try:
+        conn.send(bench_domain(domain, responses, rounds))
+    finally:
+        conn.close()
+
+
+def run(corpus, rounds=10, scales=(1,), domains=None):
+    """ returns the report dict
+    """
+    results = []
+    # fork: the child gets the loaded corpus, and its own peak rss
+    ctx = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+    for scale in scales:
+        for domain in sorted(domains or corpus.keys()):
+            responses = [scale_response(r, scale) for r in corpus[domain]]
+            if ctx is None:
+                result = bench_domain(domain, responses, rounds)
+            else:
+                parent_conn, child_conn = ctx.Pipe(duplex=False)
+                process = ctx.Process(target=_bench_in_child, args=(child_conn, domain, responses, rounds))
+                process.start()
+                child_conn.close()
+                result = parent_conn.recv()
+                process.join()
+            result['scale'] = scale
+            results.append(result)
+    return {
+        'created_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'versions': {'scrapy': scrapy.__version__, 'parsel': parsel.__version__, 'lxml': lxml.__version__},
+        'rounds': rounds,
+        'results': results,
+    }
+
+
+def main(argv=None):
+    argparser = argparse.ArgumentParser(description='pwbot parser benchmark')
+    argparser.add_argument('--rounds', type=int, default=10)
+    argparser.add_argument('--scale', default='1', help='comma separated page size multipliers, i.e. 1,4,16')
+    argparser.add_argument('--domains', default=None, help='comma separated domains. default: all')
+    argparser.add_argument('--output', default=None, help='json report file. default: stdout')
+    args = argparser.parse_args(argv)
+    logging.disable(logging.CRITICAL)
+    corpus = load_corpus()
+    report = run(corpus, rounds=args.rounds,
+                scales=[int(s) for s in args.scale.split(',')],
+                domains=args.domains.split(',') if args.domains else None)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
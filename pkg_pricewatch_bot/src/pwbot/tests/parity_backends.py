@@ -0,0 +1,108 @@
+""" parity of the html backends - same ListingItems from lxml and another backend (pwbot.parsers.backends)
+
+    python -m pwbot.tests.parity_backends [--backend lexbor] [--domains amazon.ca,walmart.ca] [--output parity.json]
+
+    corpus: the pages of pwbot.tests.bench_parsers (testlists amazon pages and
+    synthetic pages). every page is parsed by its domain parser twice - lxml,
+    then the backend - and the results are diffed field by field: item
+    fields, data and meta_data keys, and the urls/cb_kwargs of follow-up
+    requests.
+
+    prints the json report, or writes it to --output. exit status 1 if any
+    field differs - a domain goes to settings.PARSER_HTML_BACKENDS only
+    with no differences.
+"""
+import sys
+import json
+import logging
+import argparse
+from scrapy import Request
+from pwbot import settings
+from pwbot.parsers import backends
+from pwbot.tests.bench_parsers import DOMAIN_PARSERS, load_corpus
+
+_MISSING = '<missing>'
+
+
+def parse(domain, response, backend):
+    """ results of the domain parser with the backend - items as dicts, requests as (url, cb_kwargs)
+    """
+    parse_function = DOMAIN_PARSERS[domain][0]
+    original = settings.PARSER_HTML_BACKENDS
+    settings.PARSER_HTML_BACKENDS = dict(original, **{domain: backend})
+    try:
+        results = parse_function(response.replace(), domain=domain, job_id='parity', crawl_variations=True, lat='43.7292', lng='-79.393')
+        return [('request', r.url, r.cb_kwargs) if isinstance(r, Request) else ('item', dict(r)) for r in results or []]
+    finally:
+        settings.PARSER_HTML_BACKENDS = original
+
+
+def diff_items(expected, actual, prefix=''):
+    """ [(field path, expected, actual)] of two item dicts - nested data/meta_data dicts by key
+    """
+    ret = []
+    for key in sorted(set(expected.keys()) | set(actual.keys())):
+        e, a = expected.get(key, _MISSING), actual.get(key, _MISSING)
+        if isinstance(e, dict) and isinstance(a, dict) and key in ['data', 'meta_data',]:
+            ret.extend(diff_items(e, a, prefix='{}{}.'.format(prefix, key)))
+        elif e != a:
+            ret.append(('{}{}'.format(prefix, key), e, a))
+    return ret
+
+
+def diff_results(expected, actual):
+    ret = []
+    if len(expected) != len(actual):
+        ret.append(('results', len(expected), len(actual)))
+    for index, (e, a) in enumerate(zip(expected, actual)):
+        if e[0] != a[0]:
+            ret.append(('[{}]'.format(index), e[0], a[0]))
+        elif e[0] == 'item':
+            ret.extend(('[{}].{}'.format(index, path), ev, av) for path, ev, av in diff_items(e[1], a[1]))
+        elif e != a:
+            ret.append(('[{}].request'.format(index), e[1:], a[1:]))
+    return ret
+
+
+def run(corpus, backend='lexbor', domains=None):
+    """ returns the report dict
+    """
+    report = {'backend': backend, 'domains': {}}
+    for domain in sorted(domains or corpus.keys()):
+        differences = []
+        for response in corpus[domain]:
+            for path, e, a in diff_results(parse(domain, response, 'lxml'), parse(domain, response, backend)):
+                differences.append({'url': response.url, 'field': path, 'lxml': e, backend: a})
+        fields = {}
+        for d in differences:
+            fields[d['field']] = fields.get(d['field'], 0) + 1
+        report['domains'][domain] = {
+            'pages': len(corpus[domain]),
+            'differences': len(differences),
+            'fields': fields,
+            'details': differences,
+        }
+    return report
+
+
+def main(argv=None):
+    argparser = argparse.ArgumentParser(description='pwbot html backend parity')
+    argparser.add_argument('--backend', default='lexbor', help='backend compared with lxml. installed: {}'.format(', '.join(backends.available())))
+    argparser.add_argument('--domains', default=None, help='comma separated domains. default: all')
+    argparser.add_argument('--output', default=None, help='json report file. default: stdout')
+    args = argparser.parse_args(argv)
+    if args.backend not in backends.available():
+        argparser.error('backend not installed - {}'.format(args.backend))
+    logging.disable(logging.CRITICAL)
+    report = run(load_corpus(), backend=args.backend, domains=args.domains.split(',') if args.domains else None)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+    else:
+        json.dump(report, sys.stdout, indent=2, default=str)
+        sys.stdout.write('\n')
+    return 1 if any(d['differences'] > 0 for d in report['domains'].values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,6 +4,7 @@ import os
 import unittest
 from pathlib import Path
 from scrapy.http import HtmlResponse, Request
+from pwbot import settings
 from pwbot.parsers import parse_amazon_item
 from pwbot.tests import utils
 
@@ -24,9 +25,11 @@ def build_response(url, html_filename, domain):
 
 
 class TestAmazonItemParser(unittest.TestCase):
-    def setUp(self):
-        self.testlist = utils.get_testlist(self.__class__.__name__)
-        for t in self.testlist:
+    @classmethod
+    def setUpClass(cls):
+        # pages are parsed once for all tests
+        cls.testlist = utils.get_testlist(cls.__name__)
+        for t in cls.testlist:
             t['items'] = list(parse_amazon_item(build_response(t['url'], t['html_filename'], t['domain']),
                                                 domain=t['domain'],
                                                 job_id='tempjobid',
@@ -142,5 +145,43 @@ class TestAmazonItemParser(unittest.TestCase):
                         raise Exception("Invalid 'item' object passed - {}".format(i.__class__.__name__))
 
 
+
+class TestAmazonItemParserPriceOnly(unittest.TestCase):
+    """ fields='price' - price tracking items
+    """
+    PRICE_ONLY_KEYS = {'asin', 'parent_asin', 'variation_asins', 'status', 'title', 'price', 'original_price', 'quantity',}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.testlist = utils.get_testlist('TestAmazonItemParser')
+        for t in cls.testlist:
+            response = build_response(t['url'], t['html_filename'], t['domain'])
+            t['item'] = list(parse_amazon_item(response.replace(), domain=t['domain'], job_id='tempjobid', crawl_variations=False))[0]
+            t['price_only_item'] = list(parse_amazon_item(response.replace(), domain=t['domain'], job_id='tempjobid', crawl_variations=False, fields='price'))[0]
+            t['price_only_results'] = list(parse_amazon_item(response.replace(), domain=t['domain'], job_id='tempjobid', crawl_variations=True, fields='price'))
+
+    def test_same_status_and_prices(self):
+        for t in self.testlist:
+            with self.subTest(asin=t['expected_asin']):
+                for key in ['status', 'title', 'price', 'original_price', 'quantity',]:
+                    self.assertEqual(t['price_only_item']['data'].get(key), t['item']['data'].get(key))
+
+    def test_compact_item(self):
+        for t in self.testlist:
+            with self.subTest(asin=t['expected_asin']):
+                if t['price_only_item']['data']['status'] == settings.RESOURCES_LISTING_ITEM_STATUS_GOOD:
+                    self.assertEqual(set(t['price_only_item']['data'].keys()), self.PRICE_ONLY_KEYS)
+                else:
+                    self.assertTrue(set(t['price_only_item']['data'].keys()) < self.PRICE_ONLY_KEYS)
+                self.assertNotIn('meta_data', t['price_only_item'])
+
+    def test_variation_requests_price_only(self):
+        for t in self.testlist:
+            with self.subTest(asin=t['expected_asin']):
+                requests = [r for r in t['price_only_results'] if isinstance(r, Request)]
+                for r in requests:
+                    self.assertEqual(r.cb_kwargs['fields'], 'price')
+
+
 if __name__ == '__main__':
     unittest.main()
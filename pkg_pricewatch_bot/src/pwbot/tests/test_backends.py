@@ -0,0 +1,74 @@
+""" test html document backends
+"""
+import unittest
+from unittest import mock
+from pwbot import settings
+from pwbot.parsers import backends, fieldspecs, parse_store_item
+from pwbot.tests import parity_backends
+from pwbot.tests.test_fieldspecs import SPEC, build_response
+
+QUERIES = [
+    'h1.title::text',
+    '.price::text',
+    '#product::attr(data-sku)',
+    '#stock:not(.hidden)',
+    'ul.crumbs li > a::text',
+    'meta[name=title]::attr(content)',
+    'meta[name], meta[property]',
+    '#missing::text',
+]
+
+
+class TestBackends(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(setattr, settings, 'PARSER_HTML_BACKENDS', settings.PARSER_HTML_BACKENDS)
+
+    def test_document_class(self):
+        settings.PARSER_HTML_BACKENDS = {'example.com': 'lexbor',}
+        self.assertIs(backends.get_document_class('example.ca'), backends.LxmlDocument)
+        with mock.patch.object(backends, 'LexborHTMLParser', None):
+            self.assertIs(backends.get_document_class('example.com'), backends.LxmlDocument)
+        with self.assertRaises(ValueError):
+            backends.get_document_class(name='html5lib')
+
+    @unittest.skipUnless(backends.LexborHTMLParser, 'selectolax not installed')
+    def test_lexbor_same_as_lxml(self):
+        settings.PARSER_HTML_BACKENDS = {'example.com': 'lexbor',}
+        lxml_ctx = fieldspecs.ExtractionContext(build_response())
+        lexbor_ctx = fieldspecs.ExtractionContext(build_response(), domain='example.com')
+        self.assertIsInstance(lexbor_ctx.document, backends.LexborDocument)
+        for query in QUERIES:
+            with self.subTest(query=query):
+                self.assertEqual(lexbor_ctx.css(query).extract(), lxml_ctx.css(query).extract())
+        self.assertEqual(lexbor_ctx.css('#product').css('.price::text').extract(), [' $89.99 ', '$129.00'])
+        self.assertEqual([m.attrib.get('name') for m in lexbor_ctx.css('meta[name], meta[property]')], ['title', None])
+        self.assertEqual(SPEC.extract_all(lexbor_ctx), SPEC.extract_all(lxml_ctx))
+        # xpath on the lxml tree of the page
+        self.assertEqual(lexbor_ctx.xpath('//h1/text()').extract(), [' Cordless Drill '])
+        self.assertEqual(lexbor_ctx.script_texts(), lxml_ctx.script_texts())
+
+    @unittest.skipUnless(backends.LexborHTMLParser, 'selectolax not installed')
+    def test_parse_store_item(self):
+        fieldspecs.register(['example.com',], SPEC)
+        self.addCleanup(fieldspecs.FIELD_SPECS.pop, 'example.com')
+        items = {}
+        for backend in ['lxml', 'lexbor',]:
+            settings.PARSER_HTML_BACKENDS = {'example.com': backend,}
+            items[backend] = [dict(i) for i in parse_store_item(build_response(), domain='example.com', job_id='tempjobid')]
+        self.assertEqual(items['lexbor'], items['lxml'])
+
+
+class TestParityHarness(unittest.TestCase):
+    def test_diff_results(self):
+        expected = [('request', 'https://a', {'fields': None}), ('item', {'url': 'https://b', 'data': {'price': 1.0, 'title': 'x'}, 'meta_data': {'title': 'x'}})]
+        actual = [('request', 'https://a', {'fields': None}), ('item', {'url': 'https://b', 'data': {'price': 1.5}, 'meta_data': {'title': 'x'}})]
+        self.assertEqual(parity_backends.diff_results(expected, expected), [])
+        self.assertEqual(parity_backends.diff_results(expected, actual), [
+            ('[1].data.price', 1.0, 1.5),
+            ('[1].data.title', 'x', parity_backends._MISSING),
+        ])
+        self.assertEqual(parity_backends.diff_results(expected, actual[:1]), [('results', 2, 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+""" test embedded json scanner
+"""
+import unittest
+from pwbot.parsers.embedded_json import EmbeddedJsonScanner, decode_value
+
+
+class TestEmbeddedJsonScanner(unittest.TestCase):
+    def setUp(self):
+        self.scanner = EmbeddedJsonScanner([
+            ('"parent_asin"', 'parent_asin'),
+            ('"asin_variation_values"', 'asin_variation_values'),
+            ('"asinVariationValues"', 'asin_variation_values'),
+            ("'colorImages'", 'color_images'),
+        ])
+
+    def test_decode_value(self):
+        self.assertEqual(decode_value('x = {"a": [1, {"b": "}}"}]};', 4), ({'a': [1, {'b': '}}'}]}, 27))
+        # javascript object literal with json values
+        self.assertEqual(decode_value("{ 'initial': [{\"hiRes\":null}], bare: 1, }", 0)[0], {'initial': [{'hiRes': None}], 'bare': 1})
+        with self.assertRaises(ValueError):
+            decode_value("{ 'initial': [", 0)
+
+    def test_scan(self):
+        scripts = [
+            """var data = {'colorImages': { 'initial': [{"large":"https://images-na.ssl-images-amazon.com/images/I/41Stlg1g7OL._AC_.jpg"}]},\n'colorToAsin': {'initial': {}}};""",
+            """{"asin_variation_values":{},"parent_asin":"B009CVKNT6"}""",
+            """{"asinVariationValues" : {"B008I25JB2":{"ASIN":"B008I25JB2"}}, "parent_asin":"B008I25JB2"}""",
+        ]
+        found = self.scanner.scan(scripts)
+        self.assertEqual(found['color_images'], {'initial': [{'large': 'https://images-na.ssl-images-amazon.com/images/I/41Stlg1g7OL._AC_.jpg'}]})
+        # first non-empty value of either alias
+        self.assertEqual(list(found['asin_variation_values'].keys()), ['B008I25JB2'])
+        self.assertEqual(found['parent_asin'], 'B009CVKNT6')
+
+    def test_scan_ignores_undecodable(self):
+        self.assertEqual(self.scanner.scan(['{"parent_asin":undefined}']), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
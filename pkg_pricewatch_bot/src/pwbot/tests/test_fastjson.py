@@ -0,0 +1,49 @@
+""" test store page json decoding
+"""
+import json
+import unittest
+from scrapy.http import HtmlResponse, JsonRequest, Request
+from pwbot.items import ListingItem
+from pwbot.parsers import fastjson, parse_walmart_ca_item
+
+
+PRELOADED_STATE = {
+    'catchment': {'storeId': '1061', 'lat': 43.7292},
+    'common': {'experience': 'grocery', 'bannerMessage': 'x' * 1000},
+    'locale': {'lang': 'en'},
+    'entities': {
+        'skus': {'6000199112683': {'name': 'Robe', 'upc': ['5818510180']}},
+        'reviews': [{'text': 'x' * 1000}] * 10,
+    },
+    'product': {'activeSkuId': '6000199112683', 'item': {'id': '6000199112683', 'skus': ['6000199112683']}, 'recommendations': []},
+}
+
+
+class TestFastJson(unittest.TestCase):
+    def test_select(self):
+        self.assertEqual(fastjson.select(PRELOADED_STATE, ['entities.skus', 'product.item.id', 'product.missing', 'locale.lang.missing']),
+                        {'entities': {'skus': PRELOADED_STATE['entities']['skus']}, 'product': {'item': {'id': '6000199112683'}}})
+
+    def test_loads_falls_back_to_json(self):
+        self.assertEqual(fastjson.loads(b'{"price": NaN}').keys(), {'price'})
+        with self.assertRaises(fastjson.JSONDecodeError):
+            fastjson.loads('{"id": ')
+
+    def test_walmart_ca_preloaded_data_pruned(self):
+        url = 'https://www.walmart.ca/en/ip/hotel-spa-robe/6000199112683'
+        body = '<html><head><script>window.__PRELOADED_STATE__={};</script></head><body></body></html>'.format(json.dumps(PRELOADED_STATE))
+        response = HtmlResponse(url, request=Request(url, cookies={'defaultNearestStoreId': '1061'}), body=body.encode('utf-8'))
+        results = list(parse_walmart_ca_item(response, domain='walmart.ca', job_id='tempjobid', crawl_variations=False, lat='43.7292', lng='-79.393'))
+        self.assertIsInstance(results[0], ListingItem)
+        self.assertEqual(results[0]['data'], {
+            'catchment': {'storeId': '1061'},
+            'common': {'experience': 'grocery'},
+            'locale': {'lang': 'en'},
+            'entities': {'skus': PRELOADED_STATE['entities']['skus']},
+            'product': {'activeSkuId': '6000199112683', 'item': PRELOADED_STATE['product']['item']},
+        })
+        self.assertEqual([r.__class__ for r in results[1:]], [JsonRequest, JsonRequest])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+""" test declarative field specs
+"""
+import re
+import unittest
+from scrapy.http import HtmlResponse, Request
+from scrapy.utils.test import get_crawler
+from pwbot import settings
+from pwbot.items import ListingItem
+from pwbot.parsers import fieldspecs, parse_store_item
+from pwbot.spiders.store_item_spider import StoreItemPageSpider
+
+PAGE = """<html><head><meta name="title" content="Cordless Drill"><meta property="og:title" content="Drill"></head><body>
+<div id="product" data-sku="1000123456">
+    <h1 class="title"> Cordless Drill </h1>
+    <span class="price sale"> $89.99 </span><span class="price">$129.00</span>
+    <div id="stock" class="hidden">Out of stock</div>
+    <ul class="crumbs"><li><a>Tools</a></li><li><a> Drills </a></li></ul>
+</div>
+<script>var product = {"rating": 4.5};</script>
+</body></html>"""
+
+SPEC = fieldspecs.FieldSpec({
+    'sku': fieldspecs.Field(['#product::attr(data-sku)',]),
+    'title': fieldspecs.Field(['h1.title::text',], post=fieldspecs.first_stripped),
+    'price': fieldspecs.Field(['.price.deal::text', '.price.sale::text', '.price::text',], post=fieldspecs.money),
+    'in_stock': fieldspecs.Field(['#stock:not(.hidden)',], post=fieldspecs.exists, default=True),
+    'category': fieldspecs.Field([fieldspecs.XPath('//ul[@class="crumbs"]/li/a/text()'),], post=fieldspecs.joined(' : '), default=''),
+    'avg_rating': fieldspecs.Field([fieldspecs.Regex(re.compile(r'"rating": ([\d.]+)')),], post=lambda values: float(values[0])),
+    'brand': fieldspecs.Field(['#brand::text',]),
+})
+
+
+def build_response(url='https://www.example.com/p/cordless-drill'):
+    return HtmlResponse(url, request=Request(url), body=PAGE.encode('utf-8'))
+
+
+class TestFieldSpecs(unittest.TestCase):
+    def test_extract_all(self):
+        ctx = fieldspecs.ExtractionContext(build_response())
+        self.assertEqual(SPEC.extract_all(ctx), {
+            'sku': '1000123456',
+            'title': 'Cordless Drill',
+            'price': 89.99,
+            'in_stock': True,
+            'category': 'Tools : Drills',
+            'avg_rating': 4.5,
+            'brand': None,
+        })
+        self.assertEqual(SPEC.extract(ctx, 'brand', default='n/a'), 'n/a')
+
+    def test_compiled_once_and_memoized(self):
+        self.assertIs(fieldspecs.compile_css('.price::text'), SPEC.fields['price'].selectors[2].compiled)
+        ctx = fieldspecs.ExtractionContext(build_response())
+        self.assertIs(ctx.select(fieldspecs.compile_css('.price::text')), ctx.select(fieldspecs.compile_css('.price::text')))
+        # parsel selectors over the same results for imperative code
+        self.assertEqual(ctx.css('#product').css('.price::text').extract(), [' $89.99 ', '$129.00'])
+
+    def test_parse_store_item(self):
+        fieldspecs.register(['example.com',], SPEC)
+        self.addCleanup(fieldspecs.FIELD_SPECS.pop, 'example.com')
+        items = list(parse_store_item(build_response(), domain='example.com', job_id='tempjobid'))
+        self.assertEqual(len(items), 1)
+        self.assertIsInstance(items[0], ListingItem)
+        self.assertEqual(items[0]['data']['sku'], '1000123456')
+        self.assertEqual(items[0]['data']['price'], 89.99)
+        self.assertEqual(items[0]['data']['status'], settings.RESOURCES_LISTING_ITEM_STATUS_GOOD)
+        self.assertEqual(items[0]['meta_data'], {'title': 'Cordless Drill', 'og:title': 'Drill'})
+
+    def test_crawl_registered_domain(self):
+        fieldspecs.register(['example.com',], fieldspecs.FieldSpec(SPEC.fields,
+                    link_format='https://www.{domain}/p/{sku}', sku_pattern=re.compile(r'/p/(\d+)')))
+        self.addCleanup(fieldspecs.FIELD_SPECS.pop, 'example.com')
+        spider = StoreItemPageSpider.from_crawler(get_crawler(StoreItemPageSpider), domain='example.com', skus='1000123456',
+                    urls='https://www.example.com/p/1000654321,https://www.example.com/p/cordless-drill')
+        self.assertIn('example.com', spider.allowed_domains)
+        requests = list(spider.start_requests())
+        self.assertEqual([r.url for r in requests], ['https://www.example.com/p/1000123456',
+                    'https://www.example.com/p/1000654321', 'https://www.example.com/p/cordless-drill',])
+        self.assertEqual(spider.start_skus(), {'example.com': ['1000123456', '1000654321',]})
+        # sku from the url, before the page
+        items = list(requests[0].callback(build_response(requests[0].url), **requests[0].cb_kwargs))
+        self.assertEqual((items[0]['data']['sku'], items[0]['data']['price']), ('1000123456', 89.99))
+        items = list(requests[2].callback(build_response(requests[2].url), **requests[2].cb_kwargs))
+        self.assertEqual(items[0]['data']['sku'], '1000123456')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+""" test per field extraction stats
+"""
+import unittest
+from scrapy.http import HtmlResponse, Request
+from scrapy.utils.test import get_crawler
+from pwbot.extensions import ParserFieldStats
+from pwbot.parsers import fieldspecs, fieldstats, parse_amazon_item, parse_store_item
+from pwbot.parsers.amazon_item_parser import AmazonItemParser
+from pwbot.spiders.store_item_spider import StoreItemPageSpider
+from pwbot.tests import utils
+from pwbot.tests.test_amazon_item_parser import build_response
+from pwbot.tests import test_fieldspecs
+
+
+class TestFieldStats(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(fieldstats.disable)
+        t = utils.get_testlist('TestAmazonItemParser')[0]
+        self.domain = t['domain']
+        self.response = build_response(t['url'], t['html_filename'], t['domain'])
+
+    def parse(self):
+        return list(parse_amazon_item(self.response.replace(), domain=self.domain, job_id='tempjobid', crawl_variations=False))
+
+    def test_enable_disable(self):
+        original = vars(AmazonItemParser)['_AmazonItemParser__extract_title']
+        fieldstats.enable()
+        self.assertIsNot(vars(AmazonItemParser)['_AmazonItemParser__extract_title'], original)
+        self.parse()
+        stats = fieldstats.disable()
+        # originals back - nothing left to run when off
+        self.assertIs(vars(AmazonItemParser)['_AmazonItemParser__extract_title'], original)
+        self.assertFalse(fieldstats.is_enabled())
+        self.assertEqual(stats['parser/{}/title/calls'.format(self.domain)], 1)
+        self.assertEqual(stats['parser/{}/title/failures'.format(self.domain)], 0)
+        self.assertGreater(stats['parser/{}/title/time_ms'.format(self.domain)], 0)
+        self.assertNotIn('parser/{}/field/calls'.format(self.domain), stats)
+        self.parse()
+        self.assertEqual(fieldstats.collected_stats(), {})
+
+    def test_logged_failures_counted(self):
+        url = 'https://www.amazon.com/dp/B008I25JB2'
+        body = b'<html><body><span id="priceblock_ourprice">Currently unavailable</span></body></html>'
+        fieldstats.enable()
+        with self.assertLogs('pwbot.parsers.amazon_item_parser.AmazonItemParser', level='ERROR'):
+            list(parse_amazon_item(HtmlResponse(url, request=Request(url), body=body), domain='amazon.com', job_id='tempjobid', crawl_variations=False))
+        stats = fieldstats.collected_stats()
+        self.assertEqual(stats['parser/amazon.com/price/failures'], 1)
+        self.assertEqual(stats['parser/amazon.com/quantity/failures'], 0)
+
+    def test_extension_writes_crawler_stats(self):
+        crawler = get_crawler(StoreItemPageSpider, {'PARSER_FIELD_STATS_ENABLED': True})
+        ext = ParserFieldStats.from_crawler(crawler)
+        ext.spider_opened(None)
+        self.assertTrue(fieldstats.is_enabled())
+        self.parse()
+        ext.spider_closed(None)
+        self.assertFalse(fieldstats.is_enabled())
+        self.assertEqual(crawler.stats.get_value('parser/{}/price/calls'.format(self.domain)), 1)
+
+    def test_store_item_parser(self):
+        fieldspecs.register(['example.com',], test_fieldspecs.SPEC)
+        self.addCleanup(fieldspecs.FIELD_SPECS.pop, 'example.com')
+        fieldstats.enable()
+        list(parse_store_item(test_fieldspecs.build_response(), domain='example.com', job_id='tempjobid'))
+        stats = fieldstats.collected_stats()
+        self.assertEqual((stats['parser/example.com/fields/calls'], stats['parser/example.com/meta_data/calls']), (1, 1))
+
+    def test_not_enabled_with_parser_pool(self):
+        crawler = get_crawler(StoreItemPageSpider, {'PARSER_FIELD_STATS_ENABLED': True, 'PARSER_POOL_ENABLED': True})
+        with self.assertLogs('pwbot.extensions.ParserFieldStats', level='WARNING'):
+            ext = ParserFieldStats.from_crawler(crawler)
+        ext.spider_opened(None)
+        self.assertFalse(fieldstats.is_enabled())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+""" test sqlite http cache storage
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from scrapy import Request, Spider
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+from pwbot.httpcache import SqliteCacheStorage, zstandard
+
+BODY = b'<html><body><div id="centerCol"><span id="productTitle">Drill</span></div></body></html>' * 20
+
+
+def build_response(url, body=BODY):
+    return HtmlResponse(url, status=200, headers={'Content-Type': 'text/html; charset=utf-8', 'X-Test': 'a'}, body=body)
+
+
+class TestSqliteCacheStorage(unittest.TestCase):
+    def setUp(self):
+        self.dirpath = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dirpath)
+
+    def open_storage(self, **settings):
+        crawler = get_crawler(Spider, settings_dict=dict({
+            'HTTPCACHE_SQLITE_PATH': os.path.join(self.dirpath, 'cache', 'httpcache.sqlite3'),
+            'HTTPCACHE_EXPIRATION_SECS': 0,
+            'HTTPCACHE_COMPRESSION': 'zstd',
+        }, **settings))
+        spider = Spider.from_crawler(crawler, name='test')
+        storage = SqliteCacheStorage(crawler.settings)
+        storage.open_spider(spider)
+        self.addCleanup(storage.close_spider, spider)
+        return storage, spider
+
+    def test_store_retrieve(self):
+        storage, spider = self.open_storage()
+        request = Request('https://www.amazon.ca/dp/B008I25JB2/?th=1&psc=1')
+        self.assertIsNone(storage.retrieve_response(spider, request))
+        storage.store_response(spider, request, build_response(request.url))
+        response = storage.retrieve_response(spider, Request(request.url))
+        self.assertIsInstance(response, HtmlResponse)
+        self.assertEqual((response.url, response.status, response.body), (request.url, 200, BODY))
+        self.assertEqual(response.headers.get('X-Test'), b'a')
+        self.assertEqual(storage.compression, 'zstd' if zstandard is not None else 'gzip')
+        # compressed
+        self.assertLess(storage._size(), len(BODY) // 4)
+        # readable with another codec configured
+        storage.close_spider(spider)
+        storage, spider = self.open_storage(HTTPCACHE_COMPRESSION='gzip')
+        self.assertEqual(storage.retrieve_response(spider, request).body, BODY)
+
+    def test_domain_expiration(self):
+        storage, spider = self.open_storage(HTTPCACHE_DOMAIN_EXPIRATION_SECS={'amazon.ca': 60,})
+        for url in ['https://www.amazon.ca/dp/B008I25JB2', 'https://www.walmart.ca/en/ip/6000197183322']:
+            storage.store_response(spider, Request(url), build_response(url))
+        storage._db.execute('UPDATE responses SET stored_at = stored_at - 120')
+        self.assertIsNone(storage.retrieve_response(spider, Request('https://www.amazon.ca/dp/B008I25JB2')))
+        # HTTPCACHE_EXPIRATION_SECS = 0: never expire
+        self.assertIsNotNone(storage.retrieve_response(spider, Request('https://www.walmart.ca/en/ip/6000197183322')))
+        self.assertEqual(spider.crawler.stats.get_value('pwbot/httpcache/expired'), 1)
+
+    def test_lru_eviction(self):
+        storage, spider = self.open_storage(HTTPCACHE_COMPRESSION=None, HTTPCACHE_SQLITE_MAX_SIZE=len(BODY) * 3 + 500)
+        urls = ['https://www.amazon.ca/dp/B00000000{}'.format(i) for i in range(3)]
+        for url in urls:
+            storage.store_response(spider, Request(url), build_response(url))
+        # the first one used again - the second is the least recently used
+        storage._db.execute('UPDATE responses SET accessed_at = accessed_at - 10')
+        self.assertIsNotNone(storage.retrieve_response(spider, Request(urls[0])))
+        storage.store_response(spider, Request('https://www.amazon.ca/dp/B000000009'), build_response('https://www.amazon.ca/dp/B000000009'))
+        self.assertIsNone(storage.retrieve_response(spider, Request(urls[1])))
+        self.assertIsNotNone(storage.retrieve_response(spider, Request(urls[0])))
+        self.assertLessEqual(storage._size(), storage.max_size)
+        self.assertGreater(spider.crawler.stats.get_value('pwbot/httpcache/evicted'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
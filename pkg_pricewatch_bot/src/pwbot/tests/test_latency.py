@@ -0,0 +1,207 @@
+""" test latency aware timeouts and hedged requests
+"""
+import os
+import sys
+import json
+import types
+import unittest
+import subprocess
+from unittest import mock
+from twisted.internet import defer, task
+from scrapy import Request, Spider
+from scrapy.http import TextResponse
+from scrapy.utils.test import get_crawler
+from pwbot.middlewares import LatencyAwareMiddleware
+
+# a crawl of a hedged request, in its own process - the twisted reactor does not restart.
+# the first download of /slow stalls for 3s
+CRAWL_SCRIPT = """
+import json, sys, time, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import scrapy
+from scrapy.crawler import CrawlerProcess
+
+class SlowHandler(BaseHTTPRequestHandler):
+    stalled = []
+
+    def do_GET(self):
+        if self.path.startswith('/slow') and len(self.stalled) < 1:
+            self.stalled.append(self.path)
+            time.sleep(3)
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, format, *args):
+        pass
+
+server = ThreadingHTTPServer(('127.0.0.1', 0), SlowHandler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+base_url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+class HedgedSpider(scrapy.Spider):
+    name = 'hedged'
+    seen = []
+
+    def start_requests(self):
+        for i in range(5):
+            yield scrapy.Request(base_url + '/fast/{}'.format(i), callback=self.parse_fast)
+        self.origin = scrapy.Request(base_url + '/slow', meta={'hedge': True,}, callback=self.parse_slow, priority=-10)
+        yield self.origin
+
+    async def start(self):
+        for r in self.start_requests():
+            yield r
+
+    def parse_fast(self, response):
+        pass
+
+    def parse_slow(self, response):
+        self.seen.append({'origin': response.request is self.origin, 'hedge_role': response.meta.get('hedge_role'),})
+
+process = CrawlerProcess({
+    'DOWNLOADER_MIDDLEWARES': {'pwbot.middlewares.LatencyAwareMiddleware': 300,},
+    'HEDGE_ENABLED': True,
+    'HEDGE_MAX_RATIO': 1.0,
+    'HEDGE_MIN_DELAY': 0.2,
+    'LATENCY_MIN_SAMPLES': 3,
+    'CONCURRENT_REQUESTS': 1,
+    'ROBOTSTXT_OBEY': False,
+    'LOG_LEVEL': 'DEBUG',
+})
+crawler = process.create_crawler(HedgedSpider)
+started = time.time()
+process.crawl(crawler)
+process.start()
+stats = crawler.stats.get_stats()
+sys.stdout.write(json.dumps({'seen': HedgedSpider.seen, 'elapsed': time.time() - started,
+            'stats': {k: v for k, v in stats.items() if k.startswith('pwbot/hedge/')},
+            'received': stats.get('response_received_count'),}))
+"""
+
+API_URL = 'https://www.walmart.ca/api/product-page/find-in-store?latitude=43.6&longitude=-79.6&lang=en&upc=0628915545213#6000197183322'
+
+
+class TestLatencyAwareMiddleware(unittest.TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        patcher = mock.patch('pwbot.middlewares.reactor', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.downloads = []
+
+    def build(self, **settings):
+        crawler = get_crawler(Spider, settings_dict=dict({
+            'LATENCY_TIMEOUT_ENABLED': True,
+            'HEDGE_ENABLED': True,
+            'HEDGE_MAX_RATIO': 1.0,
+            'LATENCY_MIN_SAMPLES': 20,
+            'DOWNLOAD_TIMEOUT': 60,
+        }, **settings))
+        # downloads wait until the test fires them
+        crawler.engine = types.SimpleNamespace(downloader=types.SimpleNamespace(fetch=self.download))
+        self.spider = Spider.from_crawler(crawler, name='test')
+        return LatencyAwareMiddleware.from_crawler(crawler)
+
+    def download(self, request, spider):
+        d = defer.Deferred()
+        self.downloads.append((request, d))
+        return d
+
+    def observe(self, mw, latency, n=20, url=API_URL):
+        for _ in range(n):
+            request = Request(url, meta={'download_latency': latency,})
+            mw.process_response(request, TextResponse(url, request=request), self.spider)
+
+    def test_timeout(self):
+        mw = self.build(HEDGE_ENABLED=False)
+        request = Request(API_URL)
+        mw.process_request(request, self.spider)
+        # not enough samples
+        self.assertEqual(request.meta['download_timeout'], 60)
+        self.observe(mw, 5.0)
+        self.assertEqual(mw.timeout('www.walmart.ca'), 15.0)
+        self.observe(mw, 1.0, n=200)
+        self.assertEqual(mw.timeout('www.walmart.ca'), 10.0)
+        # timeouts push it back up
+        for _ in range(10):
+            mw.process_exception(Request(API_URL, meta={'download_timeout': 10.0,}), defer.TimeoutError(), self.spider)
+        self.assertEqual(mw.timeout('www.walmart.ca'), 30.0)
+        self.assertEqual(mw.timeout('www.canadiantire.ca'), 60)
+
+    def test_hedge(self):
+        mw = self.build()
+        self.observe(mw, 2.0)
+        request = Request(API_URL, meta={'hedge': True,})
+        result = mw.process_request(request, self.spider)
+        self.assertIsInstance(result, defer.Deferred)
+        self.assertEqual([r.meta['hedge_role'] for r, _ in self.downloads], ['primary',])
+        self.clock.advance(2.0)
+        (primary, primary_d), (hedge, hedge_d) = self.downloads
+        self.assertEqual(hedge.meta['hedge_role'], 'hedge')
+        self.assertTrue(hedge.dont_filter)
+        response = TextResponse(API_URL, body=b'{}', request=hedge)
+        hedge_d.callback(response)
+        self.assertIs(self.successResultOf(result), response)
+        self.assertIs(response.request, request)
+        # the primary is cancelled - not a download error
+        self.assertTrue(primary.meta['hedge_cancelled'])
+        self.assertTrue(primary_d.called)
+        stats = self.spider.crawler.stats
+        self.assertEqual((stats.get_value('pwbot/hedge/sent'), stats.get_value('pwbot/hedge/won_by_hedge'), stats.get_value('pwbot/hedge/cancelled')), (1, 1, 1))
+        self.assertEqual(request.meta['hedge_role'], 'origin')
+
+    def test_no_hedge(self):
+        mw = self.build(HEDGE_MAX_RATIO=0.5)
+        # not enough samples
+        self.assertIsNone(mw.process_request(Request(API_URL, meta={'hedge': True,}), self.spider))
+        self.observe(mw, 2.0)
+        self.assertIsNone(mw.process_request(Request(API_URL), self.spider))
+        # faster than p95
+        result = mw.process_request(Request(API_URL, meta={'hedge': True,}), self.spider)
+        primary, primary_d = self.downloads[0]
+        primary_d.callback(TextResponse(API_URL, request=primary))
+        self.clock.advance(5.0)
+        self.assertEqual(len(self.downloads), 1)
+        self.assertEqual(self.successResultOf(result).url, API_URL)
+        # over budget - 1 in 2 at most
+        result = mw.process_request(Request(API_URL, meta={'hedge': True,}), self.spider)
+        self.clock.advance(5.0)
+        self.assertEqual(len(self.downloads), 3)
+        self.assertEqual(self.spider.crawler.stats.get_value('pwbot/hedge/over_budget'), None)
+        result = mw.process_request(Request(API_URL, meta={'hedge': True,}), self.spider)
+        self.clock.advance(5.0)
+        self.assertEqual(self.spider.crawler.stats.get_value('pwbot/hedge/over_budget'), 1)
+        # the primary failed - no hedge to wait for
+        self.downloads[-1][1].errback(defer.TimeoutError())
+        self.failureResultOf(result, defer.TimeoutError)
+
+    def test_crawl(self):
+        src_dirpath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        proc = subprocess.run([sys.executable, '-c', CRAWL_SCRIPT], cwd=src_dirpath, capture_output=True, timeout=60,
+                    env=dict(os.environ, PYTHONPATH=src_dirpath))
+        self.assertEqual(proc.returncode, 0, proc.stderr.decode('utf-8'))
+        result = json.loads(proc.stdout)
+        # the spider callback gets the origin request, once
+        self.assertEqual(result['seen'], [{'origin': True, 'hedge_role': 'origin',},])
+        self.assertEqual(result['stats'], {'pwbot/hedge/sent': 1, 'pwbot/hedge/won_by_hedge': 1, 'pwbot/hedge/cancelled': 1,})
+        self.assertLess(result['elapsed'], 3.0)
+        # only the origin is logged as crawled and received
+        self.assertEqual(result['received'], 6)
+        self.assertEqual(proc.stderr.decode('utf-8').count('Crawled (200) <GET http://127.0.0.1'), 6)
+
+    def successResultOf(self, d):
+        results = []
+        d.addBoth(results.append)
+        self.assertEqual(len(results), 1)
+        return results[0]
+
+    def failureResultOf(self, d, *types):
+        failure = self.successResultOf(d)
+        self.assertTrue(failure.check(*types))
+        return failure
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+""" test off-reactor parsing data round trip
+"""
+import os
+import sys
+import json
+import unittest
+import subprocess
+import concurrent.futures
+from scrapy.http import HtmlResponse, JsonRequest, Request
+from pwbot.items import ListingItem
+from pwbot.parsers import pool, parse_amazon_item, parse_walmart_ca_json_response, resp_error_handler
+from pwbot.tests import utils
+from pwbot.tests.test_amazon_item_parser import build_response
+from pwbot.tests.test_fastjson import PRELOADED_STATE
+
+# a crawl with pooled callbacks, in its own process - the twisted reactor does not restart.
+# pages come from the test lists (TestlistMiddleware), not from the network
+CRAWL_SCRIPT = """
+import json, sys, warnings
+import scrapy
+from scrapy import signals
+from scrapy.crawler import CrawlerProcess
+from pwbot.parsers.pool import ParserPool
+from pwbot.tests import utils
+from pwbot.tests.test_amazon_item_parser import build_response
+
+warnings.simplefilter('always')
+TESTLIST = utils.get_testlist('TestAmazonItemParser')[:2]
+
+class TestlistMiddleware(object):
+    def process_request(self, request, spider):
+        t = [t for t in TESTLIST if t['url'] == request.url][0]
+        return build_response(t['url'], t['html_filename'], t['domain']).replace(request=request)
+
+class PooledSpider(scrapy.Spider):
+    name = 'pooled'
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.pool = ParserPool(size=1)
+        crawler.signals.connect(spider.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(lambda spider: spider.pool.close(), signal=signals.spider_closed)
+        spider.items = []
+        return spider
+
+    def start_requests(self):
+        for t in TESTLIST:
+            yield scrapy.Request(t['url'], callback=self.pool.callback('parse_amazon_item'),
+                        cb_kwargs={'domain': t['domain'], 'job_id': 'tempjobid', 'crawl_variations': False})
+
+    async def start(self):
+        for r in self.start_requests():
+            yield r
+
+    def item_scraped(self, item, response, spider):
+        self.items.append(dict(item))
+
+process = CrawlerProcess({
+    'DOWNLOADER_MIDDLEWARES': {'__main__.TestlistMiddleware': 1,},
+    'ROBOTSTXT_OBEY': False,
+    'LOG_LEVEL': 'WARNING',
+})
+crawler = process.create_crawler(PooledSpider)
+process.crawl(crawler)
+process.start()
+sys.stdout.write(json.dumps(crawler.spider.items))
+"""
+
+
+class TestParserPool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.executor = concurrent.futures.ProcessPoolExecutor(max_workers=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.executor.shutdown(wait=True)
+
+    def run_in_worker(self, name, response, **kwargs):
+        results = self.executor.submit(pool.run_parser, name, pool.dump_response(response), kwargs).result()
+        return [pool.load_result(r) for r in results]
+
+    def test_amazon_items_match_in_process(self):
+        t = utils.get_testlist('TestAmazonItemParser')[0]
+        response = build_response(t['url'], t['html_filename'], t['domain'])
+        kwargs = {'domain': t['domain'], 'job_id': 'tempjobid', 'crawl_variations': False}
+        self.assertEqual([dict(i) for i in self.run_in_worker('parse_amazon_item', response, **kwargs)],
+                        [dict(i) for i in parse_amazon_item(response, **kwargs)])
+
+    def test_walmart_ca_api_requests(self):
+        url = 'https://www.walmart.ca/en/ip/hotel-spa-robe/6000199112683'
+        body = '<html><head><script>window.__PRELOADED_STATE__={};</script></head><body></body></html>'.format(json.dumps(PRELOADED_STATE))
+        response = HtmlResponse(url, request=Request(url, cookies={'defaultNearestStoreId': '1061'}), body=body.encode('utf-8'))
+        results = self.run_in_worker('parse_walmart_ca_item', response, domain='walmart.ca', job_id='tempjobid', crawl_variations=False, lat='43.7292', lng='-79.393')
+        self.assertIsInstance(results[0], ListingItem)
+        self.assertEqual([r.__class__ for r in results[1:]], [JsonRequest, JsonRequest])
+        self.assertEqual(json.loads(results[1].body)['pricingStoreId'], '1061')
+        self.assertIs(results[1].callback, parse_walmart_ca_json_response)
+        self.assertEqual(results[1].cb_kwargs, {'domain': 'walmart.ca', 'job_id': 'tempjobid', 'parent_sku': '6000199112683'})
+        self.assertIs(results[1].errback, resp_error_handler)
+
+    def test_follow_up_page_requests_routed(self):
+        parser_pool = pool.ParserPool(size=1)
+        request = Request('https://www.amazon.com/dp/B008I25JB2', callback=parse_amazon_item, cb_kwargs={'domain': 'amazon.com'})
+        self.assertIs(pool.load_result(pool.dump_result(request), route=parser_pool.callback).callback, parser_pool.callback('parse_amazon_item'))
+        self.assertIs(pool.load_result(pool.dump_result(request)).callback, parse_amazon_item)
+
+    def test_crawl(self):
+        src_dirpath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        proc = subprocess.run([sys.executable, '-c', CRAWL_SCRIPT], cwd=src_dirpath, capture_output=True, timeout=120,
+                    env=dict(os.environ, PYTHONPATH=src_dirpath))
+        self.assertEqual(proc.returncode, 0, proc.stderr.decode('utf-8'))
+        self.assertNotIn('Returning Deferreds', proc.stderr.decode('utf-8'))
+        expected = []
+        for t in utils.get_testlist('TestAmazonItemParser')[:2]:
+            response = build_response(t['url'], t['html_filename'], t['domain'])
+            expected += [json.loads(json.dumps(dict(i))) for i in parse_amazon_item(response, domain=t['domain'], job_id='tempjobid', crawl_variations=False)]
+        self.assertEqual(sorted(json.loads(proc.stdout), key=json.dumps), sorted(expected, key=json.dumps))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,244 @@
+""" test item pipelines
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from twisted.internet import defer
+from scrapy.utils.test import get_crawler
+from pwbot.items import ListingItem
+from pwbot.pipelines import RawDataExportPipeline
+from pwbot.spool import ItemSpool
+from pwbot import transport
+
+
+def build_listing_item(sku):
+    listing_item = ListingItem()
+    listing_item['url'] = 'https://www.amazon.ca/dp/{}/?th=1&psc=1'.format(sku)
+    listing_item['domain'] = 'amazon.ca'
+    listing_item['http_status'] = 200
+    listing_item['data'] = {'asin': sku}
+    listing_item['job_id'] = 'tempjobid'
+    return listing_item
+
+
+class TestRawDataExportPipeline(unittest.TestCase):
+    def setUp(self):
+        self.crawler = get_crawler(settings_dict={
+            'PWWEB_EXPORT_BATCH_SIZE': 2,
+            'PWWEB_EXPORT_MAX_IN_FLIGHT': 1,
+        })
+        self.pipeline = RawDataExportPipeline.from_crawler(self.crawler)
+        self.pipeline._serialize = lambda item: dict(item)
+        self.posted = []
+        self.pipeline._post_batch = self._post_batch
+
+    def _post_batch(self, batch):
+        d = defer.Deferred()
+        self.posted.append((batch, d))
+        return d
+
+    def test_flush_on_batch_size(self):
+        item = build_listing_item('B008I25JB2')
+        self.assertIs(self.pipeline.process_item(item, None), item)
+        self.assertEqual(len(self.posted), 0)
+        self.assertEqual(self.crawler.stats.get_value('pwbot/export/queue_depth'), 1)
+        d = self.pipeline.process_item(build_listing_item('B008I25JAS'), None)
+        self.assertIsInstance(d, defer.Deferred)
+        self.assertEqual(len(self.posted), 1)
+        self.assertEqual([i['data']['asin'] for i in self.posted[0][0]], ['B008I25JB2', 'B008I25JAS'])
+        self.assertEqual(self.crawler.stats.get_value('pwbot/export/queue_depth'), 0)
+
+    def test_max_in_flight(self):
+        for sku in ['B008I25JB2', 'B008I25JAS']:
+            self.pipeline.process_item(build_listing_item(sku), None)
+        self.pipeline.process_item(build_listing_item('B008I25J8U'), None)
+        held = self.pipeline.process_item(build_listing_item('B008I25JKI'), None)
+        # second batch waits until the first one is delivered
+        self.assertEqual(len(self.posted), 1)
+        self.assertFalse(held.called)
+        self.posted[0][1].errback(ConnectionRefusedError('pwweb down'))
+        self.assertTrue(held.called)
+        self.assertEqual(len(self.posted), 2)
+        self.assertEqual(self.crawler.stats.get_value('pwbot/export/items_failed'), 2)
+
+    def test_close_spider_flushes_remaining(self):
+        self.pipeline.process_item(build_listing_item('B008I25JB2'), None)
+        closed = []
+        self.pipeline.close_spider(None).addCallback(closed.append)
+        self.assertEqual(len(self.posted), 1)
+        self.assertEqual(len(closed), 0)
+        self.posted[0][1].errback(ConnectionRefusedError('pwweb down'))
+        self.assertEqual(len(closed), 1)
+
+    def test_fall_back_to_plain_json_on_415(self):
+        pipeline = RawDataExportPipeline.from_crawler(get_crawler(settings_dict={
+            'PWWEB_EXPORT_ENCODING': 'json',
+            'PWWEB_EXPORT_COMPRESSION': 'gzip',
+        }))
+        sent = []
+
+        def _post(batch, encoding, compression):
+            sent.append((encoding, compression))
+            return defer.succeed(FakeResponse(415 if compression else 201))
+
+        pipeline._post = _post
+        pipeline._post_batch([{'url': 'https://www.amazon.ca/dp/B008I25JB2/?th=1&psc=1'}])
+        pipeline._post_batch([{'url': 'https://www.amazon.ca/dp/B008I25JAS/?th=1&psc=1'}])
+        self.assertEqual(sent, [('json', 'gzip'), ('json', None), ('json', None)])
+
+
+class TestRawDataExportPipelineSpool(unittest.TestCase):
+    def setUp(self):
+        self.dirpath = tempfile.mkdtemp()
+        self.crawler = get_crawler(settings_dict={
+            'PWWEB_EXPORT_BATCH_SIZE': 2,
+            'PWWEB_EXPORT_MAX_IN_FLIGHT': 1,
+            'PWWEB_SPOOL_ENABLED': True,
+            'PWWEB_SPOOL_DIRPATH': self.dirpath,
+        })
+        self.pipeline = self._build_pipeline()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirpath)
+
+    def _build_pipeline(self):
+        pipeline = RawDataExportPipeline.from_crawler(self.crawler)
+        pipeline._serialize = lambda item: dict(item)
+        self.posted = []
+        pipeline._post_batch = self._post_batch
+        return pipeline
+
+    def _post_batch(self, batch):
+        d = defer.Deferred()
+        self.posted.append((batch, d))
+        return d
+
+    def test_no_backpressure_with_spool(self):
+        for sku in ['B008I25JB2', 'B008I25JAS', 'B008I25J8U', 'B008I25JKI']:
+            item = build_listing_item(sku)
+            self.assertIs(self.pipeline.process_item(item, None), item)
+        # second batch has no free slot. it stays on disk
+        self.assertEqual(len(self.posted), 1)
+        self.assertEqual(self.crawler.stats.get_value('pwbot/export/items_spooled'), 2)
+        closed = []
+        self.pipeline.close_spider(None).addCallback(closed.append)
+        self.posted[0][1].callback(FakeResponse(201))
+        # spooled batch is replayed on close
+        self.assertEqual(len(self.posted), 2)
+        self.assertEqual([i['data']['asin'] for i in self.posted[1][0]], ['B008I25J8U', 'B008I25JKI'])
+        self.posted[1][1].callback(FakeResponse(201))
+        self.assertEqual(len(closed), 1)
+        self.assertEqual(os.listdir(self.dirpath), [])
+
+    def test_replay_spooled_on_free_slot(self):
+        for sku in ['B008I25JB2', 'B008I25JAS', 'B008I25J8U', 'B008I25JKI', 'B008I25J9E', 'B008I25JA2', 'B008I25JC0']:
+            self.pipeline.process_item(build_listing_item(sku), None)
+        self.assertEqual(self.crawler.stats.get_value('pwbot/export/items_spooled'), 4)
+        # the spooled batches go one by one, as the slot is freed - not on close
+        self.posted[0][1].callback(FakeResponse(201))
+        self.assertEqual(len(self.posted), 2)
+        self.assertEqual([i['data']['asin'] for i in self.posted[1][0]], ['B008I25J8U', 'B008I25JKI'])
+        self.posted[1][1].callback(FakeResponse(201))
+        self.assertEqual(len(self.posted), 3)
+        # the buffered item is not replayed
+        self.assertEqual([i['data']['asin'] for i in self.posted[2][0]], ['B008I25J9E', 'B008I25JA2'])
+        self.posted[2][1].callback(FakeResponse(201))
+        self.assertEqual(len(self.posted), 3)
+        self.pipeline._flush_on_interval()
+        self.assertEqual([i['data']['asin'] for i in self.posted[3][0]], ['B008I25JC0'])
+        self.posted[3][1].callback(FakeResponse(201))
+        self.pipeline.close_spider(None)
+        self.assertEqual(len(self.posted), 4)
+        self.assertEqual(os.listdir(self.dirpath), [])
+
+    def test_replay_undelivered_on_next_run(self):
+        for sku in ['B008I25JB2', 'B008I25JAS']:
+            self.pipeline.process_item(build_listing_item(sku), None)
+        self.pipeline.close_spider(None)
+        self.posted[0][1].errback(ConnectionRefusedError('pwweb down'))
+        self.assertEqual(len(self.posted), 2)
+        self.posted[1][1].errback(ConnectionRefusedError('pwweb down'))
+
+        pipeline = self._build_pipeline()
+        pipeline.open_spider(None)
+        self.assertEqual(len(self.posted), 1)
+        self.assertEqual([i['data']['asin'] for i in self.posted[0][0]], ['B008I25JB2', 'B008I25JAS'])
+        self.posted[0][1].callback(FakeResponse(201))
+        pipeline.close_spider(None)
+        self.assertEqual(len(self.posted), 1)
+        self.assertEqual(os.listdir(self.dirpath), [])
+
+
+class TestItemSpool(unittest.TestCase):
+    def setUp(self):
+        self.dirpath = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirpath)
+
+    def test_pending_and_ack(self):
+        spool = ItemSpool(self.dirpath, segment_size=1)
+        ids = [spool.append({'url': sku}) for sku in ['B008I25JB2', 'B008I25JAS', 'B008I25J8U']]
+        # every record starts a new segment
+        self.assertEqual(len(set(segment for segment, _ in ids)), 3)
+        spool.ack(ids[:2])
+        self.assertEqual([r for _, r in spool.pending()], [{'url': 'B008I25J8U'}])
+        spool.close()
+        spool = ItemSpool(self.dirpath)
+        self.assertEqual([r for _, r in spool.pending()], [{'url': 'B008I25J8U'}])
+        spool.ack([ids[2]])
+        spool.close()
+        self.assertEqual(os.listdir(self.dirpath), [])
+
+    def test_skip_partially_written_record(self):
+        spool = ItemSpool(self.dirpath)
+        segment, _ = spool.append({'url': 'B008I25JB2'})
+        spool.close()
+        with open(os.path.join(self.dirpath, segment + ItemSpool.SEGMENT_EXT), 'ab') as f:
+            f.write(b'{"url": "B008')
+        spool = ItemSpool(self.dirpath)
+        pending = list(spool.pending())
+        self.assertEqual([r for _, r in pending], [{'url': 'B008I25JB2'}])
+        # the torn line does not keep the segment around
+        spool.ack([_id for _id, _ in pending])
+        spool.close()
+        self.assertEqual(os.listdir(self.dirpath), [])
+
+
+class FakeResponse(object):
+    def __init__(self, code):
+        self.code = code
+
+    def text(self, encoding=None):
+        return defer.succeed('')
+
+
+class TestTransport(unittest.TestCase):
+    def test_encode_payload(self):
+        data = [{'url': 'https://www.amazon.ca/dp/B008I25JB2/?th=1&psc=1', 'data': {'asin': 'B008I25JB2'}}]
+        body, headers = transport.encode_payload(data)
+        self.assertEqual(headers, {b'Content-Type': [b'application/json']})
+        body, headers = transport.encode_payload(data, 'json', 'gzip')
+        self.assertEqual(headers[b'Content-Encoding'], [b'gzip'])
+        self.assertEqual(transport.json.loads(transport.gzip.decompress(body)), data)
+
+    def test_shared_pool(self):
+        transport.close_pool()
+        pool = transport.get_pool(max_persistent_per_host=2)
+        self.assertIs(transport.get_pool(), pool)
+        self.assertTrue(pool.persistent)
+        self.assertEqual(pool.maxPersistentPerHost, 2)
+        transport.close_pool()
+        self.assertIsNot(transport.get_pool(), pool)
+
+    @unittest.skipIf(transport.msgpack is None or transport.zstandard is None, 'msgpack or zstandard not installed')
+    def test_encode_payload_msgpack_zstd(self):
+        data = [{'url': 'https://www.amazon.ca/dp/B008I25JB2/?th=1&psc=1', 'data': {'asin': 'B008I25JB2'}}]
+        body, headers = transport.encode_payload(data, 'msgpack', 'zstd')
+        self.assertEqual(headers, {b'Content-Type': [b'application/msgpack'], b'Content-Encoding': [b'zstd']})
+        self.assertEqual(transport.msgpack.unpackb(transport.zstandard.ZstdDecompressor().decompressobj().decompress(body)), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
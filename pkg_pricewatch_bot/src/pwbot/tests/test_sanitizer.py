@@ -0,0 +1,81 @@
+""" test single pass html sanitizer
+"""
+import urllib
+import unittest
+import lxml.html
+from pwbot import utils as pwbot_utils
+from pwbot.items import ListingItem
+from pwbot.parsers import parse_amazon_item
+from pwbot.parsers.sanitizer import HtmlSanitizer
+from pwbot.parsers.amazon_item_parser import AmazonItemParserContext, _FEATURES_WRAPPER
+from pwbot.tests import utils
+from pwbot.tests.test_amazon_item_parser import build_response
+
+FRAGMENT = """<div class="desc">Intro <a href="/x">Link \U0001F600</a> and <a href="/y"><img src="i.png"></a>
+<div class="disclaim">Color Name:<strong>Pink</strong></div> after disclaim
+<script>var x = 1;</script> after script <span title="café">ok</span><!-- note é --></div>"""
+
+
+class TestHtmlSanitizer(unittest.TestCase):
+    def setUp(self):
+        self.root = lxml.html.fragment_fromstring(FRAGMENT)
+
+    def test_sanitize(self):
+        html = HtmlSanitizer(drop_classes=['disclaim',]).sanitize([self.root])
+        self.assertIn('Intro <span class="link-replacement">Link \U0001F600</span> and <a href="/y"><img src="i.png"></a>', html)
+        self.assertIn('\n after disclaim\n after script <span', html)
+        self.assertNotIn('disclaim"', html)
+        self.assertNotIn('<script', html)
+        self.assertIn('café', html)
+        # the page tree is not changed
+        self.assertEqual(len(self.root.xpath('.//a')), 2)
+        self.assertEqual(len(self.root.xpath('.//script')), 1)
+
+    def test_ascii_only(self):
+        html = HtmlSanitizer(ascii_only=True).sanitize([self.root])
+        self.assertTrue(html.isascii())
+        self.assertIn('<span class="link-replacement">Link </span>', html)
+        self.assertIn('title="caf"', html)
+        self.assertIn('<!-- note  -->', html)
+
+    def test_wrapper(self):
+        items = lxml.html.fragment_fromstring('<ul><li>a <a href="#">b</a></li><li>c™</li></ul>')
+        html = HtmlSanitizer(ascii_only=True).sanitize(list(items), wrapper='<div id="w"><ul class="u"></ul></div>')
+        self.assertEqual(html, '<div id="w"><ul class="u"><li>a <span class="link-replacement">b</span></li><li>c</li></ul></div>')
+        # the root dropped
+        self.assertEqual(HtmlSanitizer(drop_classes=['desc',]).sanitize([self.root]), '')
+
+
+class TestAmazonSanitizedFields(unittest.TestCase):
+    def test_features_as_before(self):
+        """ same html as serializing and concatenating the features, then utils.trim_emojis/replace_html_anchors_to_spans
+        """
+        for t in utils.get_testlist('TestAmazonItemParser'):
+            response = build_response(t['url'], t['html_filename'], t['domain'])
+            ctx = AmazonItemParserContext(response)
+            feature_block = ctx.css('#feature-bullets') or ctx.css('#fbExpandableSectionContent')
+            expected = ''
+            for f in feature_block.css('li:not(#replacementPartsFitmentBullet)'):
+                expected = expected + pwbot_utils.trim_emojis(f.extract().strip())
+            if expected:
+                expected = pwbot_utils.replace_html_anchors_to_spans(_FEATURES_WRAPPER.replace('</ul></div>', '') + expected + '</ul></div>')
+            item = next(i for i in parse_amazon_item(response, domain=t['domain'], job_id='tempjobid', crawl_variations=False) if isinstance(i, ListingItem))
+            with self.subTest(asin=t['expected_asin']):
+                self.assertEqual(item['data'].get('features', expected), expected)
+
+    def test_description_iframe(self):
+        """ description of the iframe content of the page, if any
+        """
+        iframe = '<html><body><div id="productDescription"><p>Great <a href="/z">drill</a></p><div class="disclaim">Color: Red</div></div></body></html>'
+        script = '<script>var iframeContent = "{}";\n</script></body>'.format(urllib.parse.quote(iframe)).encode()
+        for t in utils.get_testlist('TestAmazonItemParser'):
+            response = build_response(t['url'], t['html_filename'], t['domain'])
+            response = response.replace(body=response.body.replace(b'</body>', script, 1))
+            item = next(i for i in parse_amazon_item(response, domain=t['domain'], job_id='tempjobid', crawl_variations=False) if isinstance(i, ListingItem))
+            if 'description' in item['data']:
+                break
+        self.assertEqual(item['data']['description'], '<div id="productDescription"><p>Great <span class="link-replacement">drill</span></p></div>')
+
+
+if __name__ == '__main__':
+    unittest.main()
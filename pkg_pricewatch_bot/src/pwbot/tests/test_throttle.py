@@ -0,0 +1,135 @@
+""" test adaptive per domain concurrency
+"""
+import types
+import unittest
+from unittest import mock
+from scrapy import Request
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+from pwbot import throttle
+from pwbot.extensions import AdaptiveConcurrency
+
+CAPTCHA = b'<html><body><form method="get" action="/errors/validateCaptcha"></form></body></html>'
+
+
+def build_window(latencies=(), errors=0, bans=0):
+    window = throttle.DomainWindow()
+    for latency in latencies:
+        window.add(throttle.OK, latency)
+    for _ in range(errors):
+        window.add(throttle.ERROR)
+    for _ in range(bans):
+        window.add(throttle.BAN, 1.0)
+    return window
+
+
+class TestAimdController(unittest.TestCase):
+    def setUp(self):
+        self.controller = throttle.AimdController(min_concurrency=1, max_concurrency=8, min_delay=0.0, max_delay=10.0,
+                                target_latency=5.0, max_error_rate=0.1, max_ban_rate=0.02)
+
+    def test_percentile(self):
+        values = sorted([float(i) for i in range(1, 101)])
+        self.assertEqual(throttle.percentile(values, 50), 50.0)
+        self.assertEqual(throttle.percentile(values, 95), 95.0)
+        self.assertIsNone(throttle.percentile([], 95))
+
+    def test_increase(self):
+        healthy = build_window([1.0] * 50)
+        # the delay goes first, then concurrency
+        self.assertEqual(self.controller.decide(healthy, 4, 0.5), (throttle.INCREASE, 4, 0.25, None))
+        self.assertEqual(self.controller.decide(healthy, 4, 0.0), (throttle.INCREASE, 5, 0.0, None))
+        self.assertEqual(self.controller.decide(healthy, 8, 0.0), (throttle.HOLD, 8, 0.0, None))
+
+    def test_decrease(self):
+        self.assertEqual(self.controller.decide(build_window([1.0] * 48, bans=2), 8, 0.0), (throttle.DECREASE, 4, 0.25, 'ban_rate'))
+        self.assertEqual(self.controller.decide(build_window([1.0] * 40, errors=10), 8, 1.0), (throttle.DECREASE, 4, 2.0, 'error_rate'))
+        self.assertEqual(self.controller.decide(build_window([1.0] * 90 + [9.0] * 10), 3, 8.0), (throttle.DECREASE, 1, 10.0, 'latency'))
+        self.assertEqual(self.controller.decide(build_window([9.0] * 10), 1, 10.0), (throttle.HOLD, 1, 10.0, 'latency'))
+
+    def test_ban_reason(self):
+        markers = ['/errors/validateCaptcha',]
+        self.assertEqual(throttle.ban_reason(HtmlResponse('https://www.amazon.ca/dp/B008I25JB2', status=503, body=b''), [503,], markers), 'status')
+        self.assertEqual(throttle.ban_reason(HtmlResponse('https://www.amazon.ca/dp/B008I25JB2', body=CAPTCHA), [503,], markers), 'captcha')
+        self.assertIsNone(throttle.ban_reason(HtmlResponse('https://www.amazon.ca/dp/B008I25JB2', body=b'<html></html>'), [503,], markers))
+        # larger than block pages - not searched
+        self.assertIsNone(throttle.ban_reason(HtmlResponse('https://www.amazon.ca/dp/B008I25JB2', body=CAPTCHA), [503,], markers, max_size=len(CAPTCHA) - 1))
+        self.assertEqual(throttle.domain_of('www.amazon.ca', ['amazon.com', 'amazon.ca',]), 'amazon.ca')
+        self.assertIsNone(throttle.domain_of('www.notamazon.ca', ['amazon.ca',]))
+
+
+class TestAdaptiveConcurrency(unittest.TestCase):
+    def setUp(self):
+        self.crawler = get_crawler(settings_dict={
+            'ADAPTIVE_CONCURRENCY_ENABLED': True,
+            'ADAPTIVE_CONCURRENCY_MIN_SAMPLES': 10,
+            'ADAPTIVE_CONCURRENCY_MAX': 16,
+            'ADAPTIVE_CONCURRENCY_DOMAINS': {'canadiantire.ca': {'max_concurrency': 4,},},
+            'BAN_HTTP_CODES': [503,],
+            'BAN_CAPTCHA_MARKERS': {'amazon.ca': ['/errors/validateCaptcha',],},
+        })
+        self.slots = {
+            'www.amazon.ca': types.SimpleNamespace(concurrency=8, delay=0.0),
+            'www.canadiantire.ca': types.SimpleNamespace(concurrency=8, delay=0.0),
+        }
+        self.crawler.engine = mock.Mock()
+        self.crawler.engine.downloader.slots = self.slots
+        self.ext = AdaptiveConcurrency.from_crawler(self.crawler)
+
+    def download(self, url, status=200, body=b'<html></html>', latency=1.0, error=False):
+        request = Request(url, meta={'download_slot': url.split('/')[2], 'download_latency': latency})
+        if not error:
+            response = HtmlResponse(url, status=status, body=body, request=request)
+            self.ext.response_downloaded(response, request, None)
+        self.ext.request_left_downloader(request, None)
+        if not error:
+            self.ext.response_received(response, request, None)
+
+    def test_bounds_from_start(self):
+        self.download('https://www.canadiantire.ca/en/pdp/0762121p.html')
+        self.assertEqual(self.slots['www.canadiantire.ca'].concurrency, 4)
+        self.assertEqual(self.slots['www.amazon.ca'].concurrency, 8)
+
+    def test_default_max(self):
+        crawler = get_crawler(settings_dict={'ADAPTIVE_CONCURRENCY_ENABLED': True, 'CONCURRENT_REQUESTS_PER_DOMAIN': 8,})
+        self.assertEqual(AdaptiveConcurrency.from_crawler(crawler).default_controller.max_concurrency, 8)
+
+    def test_adjust(self):
+        for i in range(10):
+            self.download('https://www.amazon.ca/dp/B00000000{}'.format(i))
+            self.download('https://www.canadiantire.ca/en/pdp/076212{}p.html'.format(i), error=i < 3)
+        self.ext.adjust()
+        self.assertEqual(self.slots['www.amazon.ca'].concurrency, 9)
+        self.assertEqual(self.slots['www.canadiantire.ca'].concurrency, 2)
+        self.assertEqual(self.slots['www.canadiantire.ca'].delay, 0.25)
+        stats = self.crawler.stats
+        self.assertEqual(stats.get_value('pwbot/throttle/www.canadiantire.ca/errors'), 3)
+        self.assertEqual(stats.get_value('pwbot/throttle/www.canadiantire.ca/decisions/decrease'), 1)
+        self.assertEqual(stats.get_value('pwbot/throttle/www.amazon.ca/decisions/increase'), 1)
+        self.assertEqual(stats.get_value('pwbot/throttle/www.amazon.ca/latency_p95'), 1.0)
+        # windows start over after a decision
+        self.ext.adjust()
+        self.assertEqual(self.slots['www.amazon.ca'].concurrency, 9)
+
+    def test_bans(self):
+        for i in range(9):
+            self.download('https://www.amazon.ca/dp/B00000000{}'.format(i))
+        self.download('https://www.amazon.ca/dp/B000000009', body=CAPTCHA)
+        self.download('https://www.amazon.ca/dp/B000000010', status=503)
+        self.ext.adjust()
+        self.assertEqual(self.crawler.stats.get_value('pwbot/throttle/www.amazon.ca/bans'), 2)
+        self.assertEqual(self.slots['www.amazon.ca'].concurrency, 4)
+        self.assertEqual(self.crawler.stats.get_value('pwbot/throttle/www.amazon.ca/ban_rate'), 2 / 11.0)
+
+    def test_ban_detected(self):
+        # retried by BanRetryMiddleware - never received
+        request = Request('https://www.amazon.ca/dp/B008I25JB2', meta={'download_slot': 'www.amazon.ca', 'download_latency': 1.0})
+        response = HtmlResponse(request.url, body=CAPTCHA, request=request)
+        self.ext.response_downloaded(response, request, None)
+        self.ext.request_left_downloader(request, None)
+        self.crawler.signals.send_catch_log(signal=throttle.ban_detected, request=request, response=response, reason='captcha', spider=None)
+        self.assertEqual(self.crawler.stats.get_value('pwbot/throttle/www.amazon.ca/bans'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+""" test byte level html pre-trimmer
+"""
+import unittest
+import lxml.html
+from pwbot import settings
+from pwbot.parsers import parse_amazon_item
+from pwbot.parsers.trimmer import HtmlTrimmer, ascii_compatible
+from pwbot.parsers.amazon_item_parser import AmazonItemParserContext, _AMAZON_TRIMMER
+from pwbot.tests import utils
+from pwbot.tests.test_amazon_item_parser import build_response
+
+PAGE = b"""<html><head><meta name="title" content="Drill"><title>Drill</title></head><body>
+<div id="nav"><div>menu</div></div>
+<!-- <div id="price">commented out</div> -->
+<div id="centerCol" class="col"><h1 id="title"><span>Drill</span></h1>
+    <div data-a='{"x": "<b>"}'><div id="price"><span>$10.00</span></div></div>
+    <img id="badge" src="b.png">
+</div>
+<script>var t = '<div id="price">in a script</div>';</script>
+<script type="text/javascript">var data = {"parent_asin":"B000000001"};</script>
+<div id="reviews"><span id="price">$9.00</span></div>
+<div id="footer">footer</div>
+</body></html>"""
+
+TRIMMER = HtmlTrimmer(['centerCol', 'price', 'badge', 'title',], script_markers=['"parent_asin"',], required=['centerCol',])
+
+
+class TestHtmlTrimmer(unittest.TestCase):
+    def test_trim(self):
+        trimmed = TRIMMER.trim(PAGE)
+        root = lxml.html.fromstring(trimmed)
+        # nested regions not cut twice, duplicate ids kept in page order
+        self.assertEqual([e.text_content() for e in root.xpath('//*[@id="price"]')], ['$10.00', '$9.00'])
+        self.assertEqual(len(root.xpath('//*[@id="centerCol"]')), 1)
+        self.assertEqual(root.xpath('//*[@id="centerCol"]//h1/span/text()'), ['Drill'])
+        self.assertEqual(len(root.xpath('//img[@id="badge"]')), 1)
+        self.assertEqual(root.xpath('//meta[@name="title"]/@content'), ['Drill'])
+        # only the marked script, no commented out or scripted markup
+        self.assertEqual([s.text for s in root.iter('script')], ['var data = {"parent_asin":"B000000001"};'])
+        self.assertNotIn(b'nav', trimmed)
+        self.assertNotIn(b'footer', trimmed)
+        self.assertNotIn(b'commented out', trimmed)
+
+    def test_fallback(self):
+        # required id missing
+        self.assertIsNone(TRIMMER.trim(PAGE.replace(b'id="centerCol"', b'id="leftCol"')))
+        # no balanced end tag
+        self.assertIsNone(TRIMMER.trim(PAGE.replace(b'<div id="footer">footer</div>\n</body>', b'</body>').replace(b'</div>\n<script>', b'\n<script>')))
+        # element which may end without an end tag
+        self.assertIsNone(TRIMMER.trim(PAGE.replace(b'<span id="price">', b'<p id="price">')))
+        # uppercase script - scripts can't be told apart
+        self.assertIsNone(TRIMMER.trim(PAGE.replace(b'<script type=', b'<SCRIPT type=')))
+        # an id not in a start tag
+        self.assertIsNone(TRIMMER.trim(PAGE.replace(b'<div id="nav">', b'<div id="nav"> id="price"')))
+        # ids not on the page are fine
+        self.assertIsNotNone(HtmlTrimmer(['centerCol', 'missing',], required=['centerCol',]).trim(PAGE))
+
+    def test_ascii_compatible(self):
+        self.assertTrue(ascii_compatible('utf-8'))
+        self.assertTrue(ascii_compatible('cp1252'))
+        self.assertFalse(ascii_compatible('utf-16'))
+        self.assertFalse(ascii_compatible('no-such-encoding'))
+
+
+class TestTrimmedAmazonItemParser(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(setattr, settings, 'PARSER_TRIM_AMAZON_HTML', settings.PARSER_TRIM_AMAZON_HTML)
+
+    def parse(self, response, domain, trim, fields=None):
+        settings.PARSER_TRIM_AMAZON_HTML = trim
+        return [dict(i) if isinstance(i, dict) or not hasattr(i, 'cb_kwargs') else (i.url, i.cb_kwargs)
+                    for i in parse_amazon_item(response.replace(), domain=domain, job_id='tempjobid', crawl_variations=True, fields=fields)]
+
+    def test_same_items_as_whole_page(self):
+        for t in utils.get_testlist('TestAmazonItemParser'):
+            response = build_response(t['url'], t['html_filename'], t['domain'])
+            ctx = AmazonItemParserContext(response, trimmer=_AMAZON_TRIMMER)
+            ctx.root
+            self.assertTrue(ctx.trimmed)
+            for fields in [None, 'price',]:
+                with self.subTest(asin=t['expected_asin'], fields=fields):
+                    self.assertEqual(self.parse(response, t['domain'], True, fields), self.parse(response, t['domain'], False, fields))
+
+    def test_untrimmable_page_parsed_whole(self):
+        t = utils.get_testlist('TestAmazonItemParser')[0]
+        response = build_response(t['url'], t['html_filename'], t['domain'])
+        response = response.replace(body=response.body.replace(b'id="centerCol"', b'id="centerColumn"'))
+        ctx = AmazonItemParserContext(response, trimmer=_AMAZON_TRIMMER)
+        self.assertIs(ctx.root, response.selector.root)
+        self.assertFalse(ctx.trimmed)
+        self.assertEqual(self.parse(response, t['domain'], True), self.parse(response, t['domain'], False))
+
+
+if __name__ == '__main__':
+    unittest.main()
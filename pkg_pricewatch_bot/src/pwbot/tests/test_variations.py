@@ -0,0 +1,84 @@
+""" test job wide variation family registry
+"""
+import unittest
+from scrapy import Request
+from scrapy.utils.test import get_crawler
+from pwbot import settings
+from pwbot.items import ListingItem
+from pwbot.middlewares import VariationFamilyMiddleware
+from pwbot.parsers import parse_amazon_item
+from pwbot.variations import VariationFamilyRegistry, SCHEDULED, DONE
+from pwbot.tests import utils
+from pwbot.tests.test_amazon_item_parser import build_response
+
+PARENT_ASIN = 'B009CVKNT6'
+SIBLINGS = ['B008I25JB2', 'B008I25J8K',]
+
+
+def start_request(asin, crawl_variations=True):
+    return Request(settings.AMAZON_ITEM_LINK_FORMAT.format('amazon.ca', asin, settings.AMAZON_ITEM_VARIATION_LINK_POSTFIX),
+                cb_kwargs={'domain': 'amazon.ca', 'job_id': 'tempjobid', 'crawl_variations': crawl_variations,})
+
+
+class TestVariationFamilyRegistry(unittest.TestCase):
+    def test_registry(self):
+        registry = VariationFamilyRegistry()
+        registry.seed('amazon.ca', {PARENT_ASIN: SIBLINGS})
+        self.assertEqual(registry.parent_of('amazon.ca', 'B008I25J8K'), PARENT_ASIN)
+        self.assertIsNone(registry.parent_of('amazon.com', 'B008I25J8K'))
+        self.assertTrue(registry.expand('amazon.ca', PARENT_ASIN, 'B008I25JB2'))
+        # the page retried, then a sibling
+        self.assertTrue(registry.expand('amazon.ca', PARENT_ASIN, 'B008I25JB2'))
+        self.assertFalse(registry.expand('amazon.ca', PARENT_ASIN, 'B008I25J8K'))
+        self.assertTrue(registry.schedule('amazon.ca', 'B008I25J7G', PARENT_ASIN))
+        self.assertFalse(registry.schedule('amazon.ca', 'B008I25J7G'))
+        self.assertEqual(registry.state('amazon.ca', 'B008I25J7G'), SCHEDULED)
+        registry.done('amazon.ca', 'B008I25J7G')
+        self.assertEqual(registry.state('amazon.ca', 'B008I25J7G'), DONE)
+        self.assertEqual(registry.family('amazon.ca', PARENT_ASIN), set(SIBLINGS + ['B008I25J7G',]))
+
+
+class TestVariationFamilyMiddleware(unittest.TestCase):
+    def setUp(self):
+        self.crawler = get_crawler(settings_dict={
+            'VARIATION_FAMILY_REGISTRY_ENABLED': True,
+            'VARIATION_FAMILY_SEED_ENABLED': False,
+        })
+        self.mw = VariationFamilyMiddleware.from_crawler(self.crawler)
+        self.responses = {t['expected_asin']: build_response(t['url'], t['html_filename'], t['domain']) for t in utils.get_testlist('TestAmazonItemParser')}
+
+    def parse(self, asin):
+        response = self.responses[asin]
+        return list(self.mw.process_spider_output(response, parse_amazon_item(response, domain='amazon.ca', job_id='tempjobid', crawl_variations=True), None))
+
+    def test_family_expanded_once(self):
+        list(self.mw.process_start_requests([start_request(asin) for asin in SIBLINGS], None))
+        first = [r for r in self.parse(SIBLINGS[0]) if isinstance(r, Request)]
+        # the other start sku is not requested again
+        self.assertNotIn(SIBLINGS[1], [r.meta['variation_asin'] for r in first])
+        self.assertEqual(len(first), 5)
+        second = self.parse(SIBLINGS[1])
+        self.assertEqual([type(r) for r in second], [ListingItem,])
+        self.assertEqual(self.crawler.stats.get_value('pwbot/variations/requests_scheduled'), 5)
+        self.assertEqual(self.crawler.stats.get_value('pwbot/variations/requests_skipped'), 7)
+        self.assertEqual(self.mw.registry.state('amazon.ca', SIBLINGS[1]), DONE)
+        # retry of the expanding page - everything scheduled already
+        self.assertEqual([type(r) for r in self.parse(SIBLINGS[0])], [ListingItem,])
+
+    def test_claimed_by_the_page_expanding(self):
+        self.mw.registry.seed('amazon.ca', {PARENT_ASIN: SIBLINGS})
+        requests = list(self.mw.process_start_requests([start_request(asin) for asin in SIBLINGS + ['B07T2MD442',]], None))
+        # not claimed on schedule
+        self.assertEqual([r.cb_kwargs['crawl_variations'] for r in requests], [True, True, True])
+        self.assertFalse(self.mw.registry.is_expanded('amazon.ca', PARENT_ASIN))
+        # the page of the first sku failed - the second one expands the family
+        self.assertEqual(len([r for r in self.parse(SIBLINGS[1]) if isinstance(r, Request)]), 5)
+        self.assertFalse(self.mw.registry.expand('amazon.ca', PARENT_ASIN, SIBLINGS[0]))
+        # start requests after that don't crawl variations
+        requests = list(self.mw.process_start_requests([start_request('B008I25J7G'),], None))
+        self.assertEqual([r.cb_kwargs['crawl_variations'] for r in requests], [False,])
+        self.assertEqual(self.crawler.stats.get_value('pwbot/variations/expansions_skipped'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+""" pwbot.throttle
+
+    per domain download health and the AIMD decisions of
+    pwbot.extensions.AdaptiveConcurrency.
+
+    DomainWindow keeps the latest responses of a domain: download latencies
+    and outcomes (ok, error, ban). AimdController turns a window into the
+    next concurrency/delay of the domain's downloader slots:
+
+        ban or error rate above its threshold, or p95 latency above the
+        target latency    -> multiplicative decrease: concurrency * factor,
+                             delay doubled (at least delay_step)
+        healthy           -> additive increase: the delay down by delay_step
+                             first, then concurrency + 1
+
+    both within the domain's bounds, so a store runs at the fastest rate it
+    tolerates without bans.
+"""
+
+import math
+import collections
+
+OK = 'ok'
+ERROR = 'error'
+BAN = 'ban'
+
+INCREASE = 'increase'
+DECREASE = 'decrease'
+HOLD = 'hold'
+
+
+def percentile(values, p):
+    """ values: sorted. nearest rank
+    """
+    if len(values) < 1:
+        return None
+    return values[max(0, int(math.ceil(p / 100.0 * len(values))) - 1)]
+
+
+def ban_reason(response, http_codes, markers, max_size=0):
+    """ http_codes: statuses of throttled/blocked responses (i.e. 429, 503)
+        markers: strings of captcha/block pages (i.e. '/errors/validateCaptcha')
+        max_size: block pages are small - bodies above it are not searched. 0: no limit
+        returns 'status', 'captcha', or None
+
+        markers are searched in the raw body - no decoding
+    """
+    if response.status in http_codes:
+        return 'status'
+    body = response.body
+    if len(markers) > 0 and (max_size <= 0 or len(body) <= max_size):
+        for marker in markers:
+            if marker.encode('utf-8') in body:
+                return 'captcha'
+    return None
+
+
+# signal: a page was classified banned by pwbot.middlewares.BanRetryMiddleware
+# and retried or quarantined, before it reached the spider.
+# args: request, response, reason, spider
+ban_detected = object()
+
+
+def domain_of(host, domains):
+    """ the domain of domains the host is, or is a subdomain of
+    """
+    for domain in domains:
+        if host == domain or host.endswith('.' + domain):
+            return domain
+    return None
+
+
+class DomainWindow(object):
+    def __init__(self, size=200):
+        self.latencies = collections.deque(maxlen=size)
+        self.outcomes = collections.deque(maxlen=size)
+
+    def add(self, outcome, latency=None):
+        self.outcomes.append(outcome)
+        if latency is not None:
+            self.latencies.append(latency)
+
+    def __len__(self):
+        return len(self.outcomes)
+
+    def rate(self, outcome):
+        if len(self.outcomes) < 1:
+            return 0.0
+        return sum(1 for o in self.outcomes if o == outcome) / float(len(self.outcomes))
+
+    def latency_percentiles(self, ps=(50, 95,)):
+        values = sorted(self.latencies)
+        return {p: percentile(values, p) for p in ps}
+
+    def clear(self):
+        self.latencies.clear()
+        self.outcomes.clear()
+
+
+class AimdController(object):
+    def __init__(self, min_concurrency=1, max_concurrency=16, min_delay=0.0, max_delay=30.0,
+            target_latency=10.0, max_error_rate=0.1, max_ban_rate=0.02, decrease_factor=0.5, delay_step=0.25):
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.target_latency = target_latency
+        self.max_error_rate = max_error_rate
+        self.max_ban_rate = max_ban_rate
+        self.decrease_factor = decrease_factor
+        self.delay_step = delay_step
+
+    def clamp(self, concurrency, delay):
+        return (min(self.max_concurrency, max(self.min_concurrency, concurrency)),
+                min(self.max_delay, max(self.min_delay, delay)))
+
+    def decide(self, window, concurrency, delay):
+        """ returns (decision, concurrency, delay, reason)
+        """
+        if window.rate(BAN) > self.max_ban_rate:
+            reason = 'ban_rate'
+        elif window.rate(ERROR) > self.max_error_rate:
+            reason = 'error_rate'
+        elif (window.latency_percentiles((95,))[95] or 0) > self.target_latency:
+            reason = 'latency'
+        else:
+            reason = None
+        if reason is not None:
+            new_concurrency, new_delay = self.clamp(int(concurrency * self.decrease_factor), max(delay * 2, self.delay_step))
+            decision = DECREASE
+        else:
+            if delay > self.min_delay:
+                new_concurrency, new_delay = self.clamp(concurrency, delay - self.delay_step)
+            else:
+                new_concurrency, new_delay = self.clamp(concurrency + 1, delay)
+            decision = INCREASE
+        if (new_concurrency, new_delay) == (concurrency, delay):
+            decision = HOLD
+        return (decision, new_concurrency, new_delay, reason)
@@ -0,0 +1,90 @@
+""" pwbot.transport
+
+    encode and compress payloads sent to pwweb, and keep a shared
+    persistent connection pool for treq calls to pwweb.
+
+    encodings: 'json' (default), 'msgpack' (requires msgpack package)
+    compressions: None, 'gzip', 'zstd' (requires zstandard package)
+
+    the encoding is sent as Content-Type, the compression as Content-Encoding.
+    pwweb answers 415 Unsupported Media Type on anything it cannot decode.
+"""
+
+import gzip
+import json
+from twisted.web.client import HTTPConnectionPool
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+_pool = None
+
+CONTENT_TYPES = {
+    'json': b'application/json',
+    'msgpack': b'application/msgpack',
+}
+
+def is_available_encoding(encoding):
+    if encoding == 'json':
+        return True
+    elif encoding == 'msgpack':
+        return msgpack is not None
+    return False
+
+def is_available_compression(compression):
+    if compression in [None, 'gzip',]:
+        return True
+    elif compression == 'zstd':
+        return zstandard is not None
+    return False
+
+def encode(data, encoding='json'):
+    if encoding == 'msgpack':
+        return msgpack.packb(data, use_bin_type=True)
+    return json.dumps(data).encode('ascii')
+
+def compress(body, compression=None, level=None):
+    if compression == 'gzip':
+        return gzip.compress(body, compresslevel=level if level is not None else 6)
+    elif compression == 'zstd':
+        return zstandard.ZstdCompressor(level=level if level is not None else 3).compress(body)
+    return body
+
+def encode_payload(data, encoding='json', compression=None, level=None):
+    """ returns (body, headers) ready for treq.post
+    """
+    headers = {b'Content-Type': [CONTENT_TYPES[encoding]]}
+    body = compress(encode(data, encoding), compression, level)
+    if compression:
+        headers[b'Content-Encoding'] = [compression.encode('ascii')]
+    return (body, headers)
+
+def get_pool(max_persistent_per_host=8, cached_connection_timeout=240):
+    """ shared HTTPConnectionPool - pass as treq.post(..., pool=get_pool()).
+        arguments only take effect on the first call
+    """
+    global _pool
+    if _pool is None:
+        from twisted.internet import reactor
+        _pool = HTTPConnectionPool(reactor, persistent=True)
+        _pool.maxPersistentPerHost = max_persistent_per_host
+        _pool.cachedConnectionTimeout = cached_connection_timeout
+    return _pool
+
+def close_pool():
+    """ returns a deferred fired once all cached connections are closed
+    """
+    global _pool
+    pool, _pool = _pool, None
+    if pool is None:
+        from twisted.internet import defer
+        return defer.succeed(None)
+    return pool.closeCachedConnections()
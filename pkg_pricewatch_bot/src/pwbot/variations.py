@@ -0,0 +1,79 @@
+""" pwbot.variations
+
+    job wide registry of amazon variation families - keyed by (domain, parent asin).
+
+    with crawl_variations every amazon page lists the whole family of its
+    parent. without the registry, each requested asin of the same family
+    fans out to the whole family again. the registry keeps:
+        - families: child asins known per parent - seeded from pwweb
+          (items with a parent_sku) at the start of the job
+        - the asin a family was expanded by - only that page's variation
+          requests are scheduled. other pages of the family don't expand it
+        - asins scheduled or done in this job - never requested twice
+
+    used in the main process by pwbot.middlewares.VariationFamilyMiddleware,
+    so it works the same with the parser pool (pwbot.parsers.pool).
+"""
+
+SCHEDULED = 'scheduled'
+DONE = 'done'
+
+
+class VariationFamilyRegistry(object):
+    def __init__(self):
+        self._families = {}
+        self._parents = {}
+        self._expanded_by = {}
+        self._asins = {}
+
+    def seed(self, domain, families):
+        """ families: {parent asin: [child asins]} - i.e. of pwweb
+        """
+        for parent_asin, asins in families.items():
+            for asin in asins:
+                self._add(domain, parent_asin, asin)
+
+    def _add(self, domain, parent_asin, asin):
+        self._families.setdefault((domain, parent_asin), set()).add(asin)
+        self._parents[(domain, asin)] = parent_asin
+
+    def parent_of(self, domain, asin):
+        return self._parents.get((domain, asin))
+
+    def family(self, domain, parent_asin):
+        return self._families.get((domain, parent_asin), set())
+
+    def expand(self, domain, parent_asin, asin):
+        """ returns True if the page of the asin may expand the family: nobody
+            did yet, or the asin did (i.e. its page was retried)
+        """
+        expanded_by = self._expanded_by.setdefault((domain, parent_asin), asin)
+        return expanded_by == asin
+
+    def is_expanded(self, domain, parent_asin):
+        return (domain, parent_asin) in self._expanded_by
+
+    def schedule(self, domain, asin, parent_asin=None):
+        """ returns False if the asin is scheduled or done already
+        """
+        if (domain, asin) in self._asins:
+            return False
+        self._asins[(domain, asin)] = SCHEDULED
+        if parent_asin:
+            self._add(domain, parent_asin, asin)
+        return True
+
+    def done(self, domain, asin, parent_asin=None):
+        self._asins[(domain, asin)] = DONE
+        if parent_asin:
+            self._add(domain, parent_asin, asin)
+
+    def state(self, domain, asin):
+        """ SCHEDULED, DONE, or None
+        """
+        return self._asins.get((domain, asin))
+
+    def __len__(self):
+        """ number of families known
+        """
+        return len(self._families)
@@ -8,12 +8,16 @@ import logging
 import configparser
 import requests
 import graypy
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime
 from setuptools import setup, find_packages
 from setuptools.dist import Distribution
 from scrapyd_api import ScrapydAPI
 from scrapyd_api.exceptions import ScrapydResponseError
 from pwbot_schedular import settings
+from pwbot import transport
+from pwbot.spool import ItemSpool
 
 
 ## config, custom logger end
@@ -66,7 +70,11 @@ def build_bot(project=settings.BOT_PROJECT, version=settings.BOT_VERISON, path=s
 
 
 class Runner:
-    def _schedule_jobs(self, project, version, spider, **kwargs):
+    def _schedule_jobs(self, project, version, spider, cache=None, **kwargs):
+        if cache is not None:
+            if cache not in settings.HTTPCACHE_MODES:
+                raise Exception("Unknown cache mode - {}".format(cache))
+            kwargs['_settings'] = settings.HTTPCACHE_MODES[cache]
         if self.schdlr.schedule(project=project,
             spider=spider,
             _version=version,
@@ -89,7 +97,7 @@ class Runner:
     def _get_available_parent_asins(self, domain):
         """ todo: filter parent asins with 'domain'
         """
-        resp = requests.get(
+        resp = self.schdlr.session.get(
             'http://{}:{}/api/resource/amazon_parent_listing/?format=json'.format(
                 config['PriceWatchWeb']['host'], config['PriceWatchWeb']['port']))
         if resp.status_code != 200:
@@ -102,7 +110,7 @@ class Runner:
     def __init__(self):
         self.schdlr = Schedular()
 
-    def discover(self, add_version, project=None, version=None, spider=None, **kwargs):
+    def discover(self, add_version, project=None, version=None, spider=None, cache=None, **kwargs):
         if add_version:
             self._addversion_if_non()
         if project is None:
@@ -111,9 +119,9 @@ class Runner:
             version = settings.BOT_VERISON
         if spider is None:
             spider = settings.DEFAULT_SPIDER
-        self._schedule_jobs(project, version, spider, **kwargs)
+        self._schedule_jobs(project, version, spider, cache=cache, **kwargs)
 
-    def track(self, add_version, project=None, version=None, spider=None, **kwargs):
+    def track(self, add_version, project=None, version=None, spider=None, cache=None, **kwargs):
         if add_version:
             self._addversion_if_non()
         if project is None:
@@ -124,11 +132,41 @@ class Runner:
             spider = settings.DEFAULT_SPIDER
         if 'domain' in kwargs and 'asins' not in kwargs:
             kwargs['asins'] = self._get_available_parent_asins(domain=kwargs['domain'])
-        self._schedule_jobs(project, version, spider **kwargs)
+        self._schedule_jobs(project, version, spider, cache=cache, **kwargs)
 
     def jobs(self):
         self.schdlr.listjobs(project=settings.BOT_PROJECT)
 
+    def replay(self):
+        """ send items left in the local spool to pwweb. segments still
+            being written by running jobs are skipped
+        """
+        spool = ItemSpool(settings.APP_SPOOL_DIRPATH)
+        num_of_items = 0
+        try:
+            batch = []
+            for entry in spool.pending():
+                batch.append(entry)
+                if len(batch) >= settings.REPLAY_BATCH_SIZE:
+                    num_of_items += self._replay_batch(spool, batch)
+                    batch = []
+            if len(batch) > 0:
+                num_of_items += self._replay_batch(spool, batch)
+        finally:
+            spool.close()
+        logger.info("{} spooled items replayed".format(num_of_items))
+
+    def _replay_batch(self, spool, batch):
+        body, headers = transport.encode_payload([record for _, record in batch], 'json', 'gzip')
+        resp = self.schdlr.session.post('http://{}:{}/api/resource/raw_data/bulk/'.format(
+                    config['PriceWatchWeb']['host'], config['PriceWatchWeb']['port']),
+                data=body,
+                headers={k.decode('ascii'): v[0].decode('ascii') for k, v in headers.items()})
+        if resp.status_code >= 400:
+            raise Exception("{}: Failed replaying {} spooled items - {}".format(resp.status_code, len(batch), resp.text))
+        spool.ack([_id for _id, _ in batch])
+        return len(batch)
+
 
 
 def class_fullname(o):
@@ -140,10 +178,29 @@ def class_fullname(o):
     else:
         return module + '.' + o.__class__.__name__
 
+def build_session(pool_maxsize=settings.PWWEB_HTTP_POOL_MAXSIZE,
+        retries=settings.PWWEB_HTTP_RETRIES,
+        backoff_factor=settings.PWWEB_HTTP_BACKOFF_FACTOR):
+    """ requests session keeping connections to pwweb alive between calls.
+        idempotent requests (GET/PUT) are retried on 502/503/504, any request
+        on connection errors
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1,
+        pool_maxsize=pool_maxsize,
+        max_retries=Retry(total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=[502, 503, 504,],
+            raise_on_status=False))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
 class Schedular:
 
     def __init__(self):
         self._scrapyd = None
+        self.session = build_session()
         try:
             self._scrapyd = ScrapydAPI('http://{}:{}'.format(config['Scrapyd']['host'], config['Scrapyd']['port']))
         except KeyError as e:
@@ -170,7 +227,7 @@ class Schedular:
         else:
             logger.info("version '{}' for project '{}' added/updated - {} spider(s)".format(project, version, num_of_spiders))
             # call API to create a version
-            response = requests.post('http://{}:{}/api/schedule/version/'.format(
+            response = self.session.post('http://{}:{}/api/schedule/version/'.format(
                     config['PriceWatchWeb']['host'], config['PriceWatchWeb']['port']),
                 json={'project': project,
                     'version': version,
@@ -191,7 +248,7 @@ class Schedular:
         kwargs['jobid'] = _jobid # a scrapyd parameter
         kwargs['job_id'] = _jobid # passing to a spider
         try:
-            _s = None # scrapy settings in dict. eg {'DOWNLOAD_DELAY': 2}
+            _s = kwargs.pop('_settings', None) # scrapy settings in dict. eg {'DOWNLOAD_DELAY': 2}
             jobid = self._scrapyd.schedule(project, spider, settings=_s, **kwargs)
         except ScrapydResponseError as e:
             logger.error("{}: Response error - {}".format(class_fullname(e), str(e)))
@@ -203,7 +260,7 @@ class Schedular:
             else:
                 logger.info("new scheduled job '{}' for project '{}', spider '{}' has been set".format(jobid, project, spider))
                 # call API to create a job
-                response = requests.post('http://{}:{}/api/schedule/job/'.format(
+                response = self.session.post('http://{}:{}/api/schedule/job/'.format(
                         config['PriceWatchWeb']['host'], config['PriceWatchWeb']['port']),
                     json={'job_id': jobid,
                         'project': project,
@@ -241,7 +298,7 @@ class Schedular:
         if all(_j in jobs for _j in ['running', 'finished']):
             for x in jobs['running']:
                 # call API to update a running job
-                response = requests.put('http://{}:{}/api/schedule/job/{}/'.format(
+                response = self.session.put('http://{}:{}/api/schedule/job/{}/'.format(
                         config['PriceWatchWeb']['host'], config['PriceWatchWeb']['port'], x['id']),
                     json={'job_id': x['id'],
                         'project': project,
@@ -253,7 +310,7 @@ class Schedular:
                     logger.error("{} HTTP Error: Failed to update a running job - {} - {}".format(response.status_code, response.reason, response.text))
             for x in jobs['finished']:
                 # call API to update a finished job
-                response = requests.put('http://{}:{}/api/schedule/job/{}/'.format(
+                response = self.session.put('http://{}:{}/api/schedule/job/{}/'.format(
                         config['PriceWatchWeb']['host'], config['PriceWatchWeb']['port'], x['id']),
                     json={'job_id': x['id'],
                         'project': project,
@@ -281,7 +338,7 @@ class Schedular:
         else:
             logger.info("successfully deleted project '{}' version '{}'".format(project, version))
             # update deleted version
-            response = requests.put('http://{}:{}/api/schedule/version/'.format(
+            response = self.session.put('http://{}:{}/api/schedule/version/'.format(
                     config['PriceWatchWeb']['host'], config['PriceWatchWeb']['port']),
                 json={'project': project,
                     'version': version,
@@ -309,7 +366,7 @@ class Schedular:
         else:
             logger.info("successfully deleted project '{}'".format(project))
             # update deleted project
-            response = requests.put('http://{}:{}/api/schedule/version/'.format(
+            response = self.session.put('http://{}:{}/api/schedule/version/'.format(
                     config['PriceWatchWeb']['host'], config['PriceWatchWeb']['port']),
                 json={'project': project,
                     'status': settings.SCHEDULES_VERSION_STATUS_DELETED,
@@ -322,3 +379,4 @@ class Schedular:
 
     def close(self):
         self._scrapyd.client.close()
+        self.session.close()
@@ -4,6 +4,7 @@ BOT_VERISON = '0.0.1'
 APP_DATA_DIRPATH = '/usr/local/etc/pricewatch/'
 APP_DIST_DIRPATH = APP_DATA_DIRPATH + 'dist/'
 APP_CONFIG_FILEPATH = APP_DATA_DIRPATH + 'pricewatch.ini'
+APP_SPOOL_DIRPATH = APP_DATA_DIRPATH + 'spool/'
 
 # django model statuses
 SCHEDULES_JOB_STATUS_CANCELED = 0
@@ -52,11 +53,17 @@ track                   track existing products/listings
                                 -a urls=... comma separated urls
                                 -a asins=... comma separated asins
 jobs                    monitor/update existing jobs
+replay                  send scraped items left in the local spool
+                        (pwweb was down or slow) to pwweb
 
 Options
 =======
 --help, -h              show this help message and exit
 --deploy, -d            deploy new egg to scrapyd server
+--cache=MODE, -c MODE   http cache of the job (discover/track)
+                            record: crawl, and keep responses in the cache
+                            replay: cache only - no proxy, no network. pages
+                                    not in the cache are skipped
 --project=PROJECT, -p=PROJECT
                         project name
 --version=VERSION, -v=VERSION
@@ -66,3 +73,24 @@ Options
 -a NAME=VALUE list      set spider argument (may be repeated)"""
 
 DEFAULT_SPIDER = 'StoreItemPageSpider'
+
+REPLAY_BATCH_SIZE = 100
+
+# scrapy settings of --cache modes (pwbot.httpcache.SqliteCacheStorage)
+HTTPCACHE_MODES = {
+    'record': {
+        'HTTPCACHE_ENABLED': True,
+    },
+    'replay': {
+        'HTTPCACHE_ENABLED': True,
+        'HTTPCACHE_IGNORE_MISSING': True,
+        'HTTPCACHE_EXPIRATION_SECS': 0,
+        'HTTPCACHE_DOMAIN_EXPIRATION_SECS': '{}',
+        'CRAWLERA_ENABLED': False,
+    },
+}
+
+# pwweb http connection pool (pwbot_schedular.build_session)
+PWWEB_HTTP_POOL_MAXSIZE = 10 # max connections kept open per host
+PWWEB_HTTP_RETRIES = 3
+PWWEB_HTTP_BACKOFF_FACTOR = 0.5 # sleep 0.5s, 1s, 2s between retries
@@ -13,6 +13,8 @@ features
         - urls
         - asins
 - monitor jobs
+- replay scraped items left in the local spool
+- run a job through the http cache - record, or replay (cache only)
 """
 
 import sys
@@ -24,11 +26,11 @@ from pwbot_schedular import settings
 def main(func, argv):
     """ main function
     """
-    if func not in ['discover', 'track', 'jobs',]:
+    if func not in ['discover', 'track', 'jobs', 'replay',]:
         print(settings.HELP_MESSAGE)
         sys.exit(2)
     try:
-        opts, _ = getopt.getopt(argv, "hda:", ["help", "deploy"])
+        opts, _ = getopt.getopt(argv, "hda:c:", ["help", "deploy", "cache="])
     except getopt.GetoptError as e:
         print(e)
         print("")
@@ -38,6 +40,7 @@ def main(func, argv):
     project = None
     version = None
     spider = None
+    cache = None
     kwargs = {}
     for opt, arg in opts:
         if opt in ('-h', '--help'):
@@ -51,17 +54,25 @@ def main(func, argv):
             version = arg
         elif opt in ('-s', '--spider'):
             spider = arg
+        elif opt in ('-c', '--cache'):
+            if arg not in settings.HTTPCACHE_MODES:
+                print("unknown cache mode - {}".format(arg))
+                print("")
+                print(settings.HELP_MESSAGE)
+                sys.exit(2)
+            cache = arg
         elif opt == '-a':
             name, value = arg.split('=', 1)
             kwargs[name] = value
     runner = Runner()
-    if func == 'jobs':
+    if func in ['jobs', 'replay',]:
         getattr(runner, func)()
     else:
         getattr(runner, func)(add_version=add_version,
                               project=project,
                               version=version,
                               spider=spider,
+                              cache=cache,
                               **kwargs)
 
 
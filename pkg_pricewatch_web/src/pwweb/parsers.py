@@ -0,0 +1,83 @@
+import io
+import gzip
+import json
+import zlib
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.exceptions import ParseError, UnsupportedMediaType
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def decompress_stream(stream, media_type=None, parser_context=None):
+    """
+    Decompress a request body sent with a Content-Encoding header
+    (gzip or zstd). Returns the stream untouched if not compressed.
+    """
+    request = (parser_context or {}).get('request')
+    content_encoding = request.META.get('HTTP_CONTENT_ENCODING', '').strip().lower() if request is not None else ''
+    if content_encoding in ['', 'identity',]:
+        return stream
+    if content_encoding == 'gzip':
+        try:
+            return io.BytesIO(gzip.decompress(stream.read()))
+        except (OSError, EOFError, zlib.error) as e:
+            raise ParseError('gzip decompress error - {}'.format(str(e)))
+    if content_encoding == 'zstd' and zstandard is not None:
+        try:
+            return io.BytesIO(zstandard.ZstdDecompressor().decompressobj().decompress(stream.read()))
+        except zstandard.ZstdError as e:
+            raise ParseError('zstd decompress error - {}'.format(str(e)))
+    raise UnsupportedMediaType(media_type, detail='Unsupported content encoding "{}" in request.'.format(content_encoding))
+
+
+class CompressedJSONParser(JSONParser):
+    """
+    JSONParser accepting gzip/zstd compressed request bodies.
+    """
+    def parse(self, stream, media_type=None, parser_context=None):
+        return super().parse(decompress_stream(stream, media_type, parser_context), media_type, parser_context)
+
+
+class NDJSONParser(BaseParser):
+    """
+    Parses newline delimited JSON (one JSON object per line) into a list.
+    Blank lines are skipped.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', 'utf-8')
+        ret = []
+        for lineno, line in enumerate(decompress_stream(stream, media_type, parser_context), start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                ret.append(json.loads(line.decode(encoding)))
+            except ValueError as e:
+                raise ParseError('NDJSON parse error on line {} - {}'.format(lineno, str(e)))
+        return ret
+
+
+class MessagePackParser(BaseParser):
+    """
+    Parses MessagePack-serialized data. Answers 415 if msgpack is not installed.
+    """
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if msgpack is None:
+            raise UnsupportedMediaType(media_type)
+        try:
+            return msgpack.unpackb(decompress_stream(stream, media_type, parser_context).read(), raw=False)
+        except (ValueError, msgpack.ExtraData) as e:
+            raise ParseError('MessagePack parse error - {}'.format(str(e)))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from pwweb import settings
+from pwweb.resources import partitions
+
+
+class Command(BaseCommand):
+    help = ('Create monthly partitions of resrc_raw_data ahead of time, and detach/drop the ones past the retention. '
+            'resrc_raw_data_legacy (the table before partitioning, migration 0024) holds every row older than the month '
+            'it was partitioned in, and is detached/dropped as a whole - once, when that month is past the retention. '
+            'use --dry-run to see when, and --detach to archive it first.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=settings.RESOURCES_RAW_DATA_PARTITIONS_AHEAD,
+            help='months of partitions to create ahead of the current month')
+        parser.add_argument('--retention', type=int, default=settings.RESOURCES_RAW_DATA_RETENTION_MONTHS,
+            help='months of raw data to keep. 0: keep forever')
+        parser.add_argument('--detach', action='store_true',
+            help='detach expired partitions only. keep them as plain tables (i.e. to archive before dropping)')
+        parser.add_argument('--dry-run', action='store_true',
+            help='print what would be done')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        table = partitions.RAW_DATA_TABLE
+        for name in partitions.create_partitions(table, now, options['ahead'], dry_run=options['dry_run']):
+            self.stdout.write('created {}'.format(name))
+        if options['retention'] <= 0:
+            return
+        for partition in partitions.expired_partitions(table, now, options['retention']):
+            if not options['dry_run']:
+                partitions.remove_partition(table, partition.name, detach_only=options['detach'])
+            self.stdout.write('{} {}'.format('detached' if options['detach'] else 'dropped', partition.name))
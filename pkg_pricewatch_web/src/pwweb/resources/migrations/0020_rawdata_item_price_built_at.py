@@ -0,0 +1,18 @@
+# Generated by Django 3.1.2 on 2026-10-18 08:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resources', '0019_auto_20200619_2206'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rawdata',
+            name='item_price_built_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
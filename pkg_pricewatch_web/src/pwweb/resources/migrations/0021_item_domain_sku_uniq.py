@@ -0,0 +1,22 @@
+# Generated by Django 3.1.2 on 2026-10-18 08:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resources', '0020_rawdata_item_price_built_at'),
+    ]
+
+    operations = [
+        # items were looked up with get() before creating, but concurrent builds could still create duplicates. keep the oldest one
+        migrations.RunSQL(
+            sql='DELETE FROM "resrc_items" a USING "resrc_items" b WHERE a."domain" = b."domain" AND a."sku" = b."sku" AND a."id" > b."id";',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='item',
+            constraint=models.UniqueConstraint(fields=('domain', 'sku'), name='resrc_items_domain_sku_uniq'),
+        ),
+    ]
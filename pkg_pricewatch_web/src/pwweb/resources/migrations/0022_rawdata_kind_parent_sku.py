@@ -0,0 +1,49 @@
+# Generated by Django 3.1.2 on 2026-10-18 08:24
+
+from django.db import migrations, models
+
+
+# same as pwweb.utils.extract_raw_data_keys() for the rows ingested so far
+# kind: 1 item page, 2 price api, 3 store api (settings.RESOURCES_RAW_DATA_KIND_*)
+BACKFILL_KIND_PARENT_SKU_SQL = [
+    """UPDATE "resrc_raw_data" SET "kind" = 1, "parent_sku" = LEFT("data"->>'parent_asin', 32) WHERE "domain" IN ('amazon.com', 'amazon.ca');""",
+    """UPDATE "resrc_raw_data" SET "kind" = 1, "parent_sku" = LEFT("data"->'item'->'product'->'buyBox'->>'primaryUsItemId', 32) WHERE "domain" = 'walmart.com';""",
+    r"""UPDATE "resrc_raw_data" SET "kind" = 1, "parent_sku" = LEFT((regexp_match("url", '^(https?://www.walmart.ca)?/(en|fr)/([^/]+/[^/]+|ip)/([A-Z0-9]{8,15})(/.*$)?'))[4], 32) WHERE "domain" = 'walmart.ca' AND "url" ~ '^(https?://www.walmart.ca)?/(en|fr)/([^/]+/[^/]+|ip)/([A-Z0-9]{8,15})(/.*$)?';""",
+    """UPDATE "resrc_raw_data" SET "kind" = 2, "parent_sku" = LEFT(NULLIF(split_part("url", '#', 2), ''), 32) WHERE "domain" = 'walmart.ca' AND "kind" IS NULL AND ("url" LIKE 'https://www.walmart.ca/api/product-page/price-offer%' OR "url" LIKE 'https://www.walmart.ca/api/product-page/v2/price-offer%');""",
+    """UPDATE "resrc_raw_data" SET "kind" = 3, "parent_sku" = LEFT(NULLIF(split_part("url", '#', 2), ''), 32) WHERE "domain" = 'walmart.ca' AND "kind" IS NULL AND "url" LIKE 'https://www.walmart.ca/api/product-page/find-in-store%';""",
+    r"""UPDATE "resrc_raw_data" SET "kind" = 1, "parent_sku" = LEFT(UPPER(COALESCE("data"->'SkuSelectors'->>'pCode', (regexp_match("url", '^(https?://www.canadiantire.ca)?/(en|fr)/([^/]+/[^/]+|pdp)/([\w-]*)([0-9]{7,12})p*.html[.*$]?'))[5] || 'P')), 32) WHERE "domain" = 'canadiantire.ca' AND "url" ~ '^(https?://www.canadiantire.ca)?/(en|fr)/([^/]+/[^/]+|pdp)/([\w-]*)([0-9]{7,12})p*.html[.*$]?';""",
+    """UPDATE "resrc_raw_data" SET "kind" = 2, "parent_sku" = LEFT(UPPER(NULLIF(split_part("url", '#', 2), '')), 32) WHERE "domain" = 'canadiantire.ca' AND "kind" IS NULL AND "url" LIKE 'https://www.canadiantire.ca/ESB/PriceAvailability%';""",
+    """UPDATE "resrc_raw_data" SET "kind" = 3, "parent_sku" = LEFT(UPPER(NULLIF(split_part("url", '#', 2), '')), 32) WHERE "domain" = 'canadiantire.ca' AND "kind" IS NULL AND "url" LIKE 'https://api-triangle.canadiantire.ca/dss/services/v4/stores%';""",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resources', '0021_item_domain_sku_uniq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rawdata',
+            name='kind',
+            field=models.SmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='rawdata',
+            name='parent_sku',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.RunSQL(
+            sql=BACKFILL_KIND_PARENT_SKU_SQL,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='rawdata',
+            index=models.Index(fields=['job_id', 'domain', 'kind'], name='resrc_raw_data_job_kind_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rawdata',
+            index=models.Index(fields=['job_id', 'domain', 'parent_sku'], name='resrc_raw_data_job_group_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.1.2 on 2026-10-18 09:00
+
+from django.db import migrations
+
+
+# groundwork of 0024_partition_raw_data, done without blocking writes to resrc_raw_data (not atomic - one statement at a time):
+#   the unique index 0024 turns into the (id, created_at) primary key of the legacy partition, built CONCURRENTLY
+#   a check of the legacy partition range, added NOT VALID and validated apart (share update exclusive lock only),
+#   so attaching the legacy partition does not scan the table again.
+# the bound is the first day of next month. 0024 attaches the table up to the first day of the month after
+# it runs, which is the same bound or a later one - the check still implies it.
+RAW_DATA_ID_CREATED_AT_UNIQ_SQL = [
+    """CREATE UNIQUE INDEX CONCURRENTLY "resrc_raw_data_legacy_id_created_at_uniq" ON "resrc_raw_data" ("id", "created_at");""",
+    """DO $$
+    BEGIN
+        EXECUTE format('ALTER TABLE "resrc_raw_data" ADD CONSTRAINT "resrc_raw_data_legacy_created_at_check" CHECK ("created_at" < %L) NOT VALID',
+            (date_trunc('month', now() AT TIME ZONE 'UTC') + interval '1 month') AT TIME ZONE 'UTC');
+    END $$;""",
+    """ALTER TABLE "resrc_raw_data" VALIDATE CONSTRAINT "resrc_raw_data_legacy_created_at_check";""",
+]
+
+REVERSE_RAW_DATA_ID_CREATED_AT_UNIQ_SQL = [
+    """ALTER TABLE "resrc_raw_data" DROP CONSTRAINT IF EXISTS "resrc_raw_data_legacy_created_at_check";""",
+    """DROP INDEX CONCURRENTLY IF EXISTS "resrc_raw_data_legacy_id_created_at_uniq";""",
+]
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('resources', '0022_rawdata_kind_parent_sku'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=RAW_DATA_ID_CREATED_AT_UNIQ_SQL,
+            reverse_sql=REVERSE_RAW_DATA_ID_CREATED_AT_UNIQ_SQL,
+        ),
+    ]
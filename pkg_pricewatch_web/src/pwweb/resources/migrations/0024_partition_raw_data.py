@@ -0,0 +1,78 @@
+# Generated by Django 3.1.2 on 2026-10-18 09:02
+
+from django.db import migrations
+
+
+# resrc_raw_data becomes a table range partitioned by created_at (monthly partitions, see pwweb.resources.partitions).
+# the existing table is kept as is and attached as the first partition, so no row is copied:
+#   resrc_raw_data_legacy   (MINVALUE) - first day of next month
+#   resrc_raw_data_default  rows not covered by any monthly partition yet (manage.py raw_data_partitions moves them out)
+# primary key becomes (id, created_at) - postgres requires the partition key in it. ids still come from one sequence.
+# the new primary key index and the range check of the legacy table are built beforehand by 0023_raw_data_id_created_at_uniq,
+# so nothing here scans the table: the check implies the partition range, and is dropped once attached.
+PARTITION_RAW_DATA_SQL = [
+    """ALTER TABLE "resrc_raw_data" RENAME TO "resrc_raw_data_legacy";""",
+    """ALTER INDEX "resrc_raw_data_pkey" RENAME TO "resrc_raw_data_legacy_pkey";""",
+    """ALTER TABLE "resrc_raw_data_legacy" DROP CONSTRAINT "resrc_raw_data_legacy_pkey", ADD CONSTRAINT "resrc_raw_data_legacy_pkey" PRIMARY KEY USING INDEX "resrc_raw_data_legacy_id_created_at_uniq";""",
+    """CREATE TABLE "resrc_raw_data" (
+        "id" integer NOT NULL,
+        "url" text NOT NULL,
+        "domain" varchar(32) NOT NULL,
+        "http_status" smallint NULL,
+        "data" jsonb NULL,
+        "meta_data" jsonb NULL,
+        "job_id" varchar(64) NULL,
+        "kind" smallint NULL,
+        "parent_sku" varchar(32) NULL,
+        "created_at" timestamp with time zone NOT NULL,
+        "item_price_built_at" timestamp with time zone NULL,
+        CONSTRAINT "resrc_raw_data_pkey" PRIMARY KEY ("id", "created_at")
+    ) PARTITION BY RANGE ("created_at");""",
+    # move the id sequence (serial or identity) over to the partitioned table
+    """DO $$
+    DECLARE
+        next_id integer;
+        seq text := pg_get_serial_sequence('resrc_raw_data_legacy', 'id');
+    BEGIN
+        SELECT COALESCE(MAX("id"), 0) + 1 INTO next_id FROM "resrc_raw_data_legacy";
+        ALTER TABLE "resrc_raw_data_legacy" ALTER COLUMN "id" DROP IDENTITY IF EXISTS;
+        ALTER TABLE "resrc_raw_data_legacy" ALTER COLUMN "id" DROP DEFAULT;
+        IF seq IS NOT NULL THEN
+            EXECUTE format('DROP SEQUENCE IF EXISTS %s', seq);
+        END IF;
+        CREATE SEQUENCE "resrc_raw_data_id_seq" AS integer OWNED BY "resrc_raw_data"."id";
+        PERFORM setval('resrc_raw_data_id_seq', next_id, false);
+        ALTER TABLE "resrc_raw_data" ALTER COLUMN "id" SET DEFAULT nextval('resrc_raw_data_id_seq');
+    END $$;""",
+    # same indexes (same names) on the partitioned table. attaching the legacy table reuses its indexes
+    r"""DO $$
+    DECLARE
+        idx record;
+    BEGIN
+        FOR idx IN SELECT "indexname", "indexdef" FROM pg_indexes WHERE "tablename" = 'resrc_raw_data_legacy' AND "indexname" <> 'resrc_raw_data_legacy_pkey' LOOP
+            EXECUTE format('ALTER INDEX %I RENAME TO %I', idx.indexname, left(idx.indexname, 56) || '_legacy');
+            EXECUTE regexp_replace(idx.indexdef, ' ON (\S+\.)?resrc_raw_data_legacy ', ' ON "resrc_raw_data" ');
+        END LOOP;
+    END $$;""",
+    """DO $$
+    BEGIN
+        EXECUTE format('ALTER TABLE "resrc_raw_data" ATTACH PARTITION "resrc_raw_data_legacy" FOR VALUES FROM (MINVALUE) TO (%L)',
+            (date_trunc('month', now() AT TIME ZONE 'UTC') + interval '1 month') AT TIME ZONE 'UTC');
+    END $$;""",
+    """ALTER TABLE "resrc_raw_data_legacy" DROP CONSTRAINT "resrc_raw_data_legacy_created_at_check";""",
+    """CREATE TABLE "resrc_raw_data_default" PARTITION OF "resrc_raw_data" DEFAULT;""",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resources', '0023_raw_data_id_created_at_uniq'),
+    ]
+
+    operations = [
+        # no reverse - a partitioned table can not be turned back into a plain one without copying every row
+        migrations.RunSQL(
+            sql=PARTITION_RAW_DATA_SQL,
+        ),
+    ]
@@ -1,8 +1,44 @@
 import logging
-from pwweb import utils
+from django.db import transaction, IntegrityError, DataError
+from django.db.models import Q
+from django.utils import timezone
+from pwweb import settings, utils
 from pwweb.resources.models import RawData, Item, ItemPrice
 
 
+def _fetch_items(keys):
+    """ keys: set of (domain, sku). one query per domain """
+    skus = {}
+    for domain, sku in keys:
+        skus.setdefault(domain, []).append(sku)
+    q = Q()
+    for domain, _skus in skus.items():
+        q |= Q(domain=domain, sku__in=_skus)
+    return {(i.domain, i.sku): i for i in Item.objects.filter(q)} if len(skus) > 0 else {}
+
+
+def save_item_prices(items, item_prices):
+    """ write built items and item prices with a fixed number of queries:
+        existing items are fetched at once and kept as they are, missing ones
+        are bulk inserted (ON CONFLICT DO NOTHING on (domain, sku)), and all
+        item prices are bulk inserted.
+        returns items as saved in db, in the same order
+    """
+    keys = set((i.domain, i.sku) for i in items)
+    _existing = _fetch_items(keys)
+    _new = {}
+    for i in items:
+        if (i.domain, i.sku) not in _existing:
+            _new.setdefault((i.domain, i.sku), i)
+    if len(_new) > 0:
+        Item.objects.bulk_create(_new.values(), batch_size=settings.RESOURCES_ITEM_PRICE_BULK_CREATE_BATCH_SIZE, ignore_conflicts=True)
+        # ids are not returned on ignore_conflicts
+        _existing = _fetch_items(keys)
+    if len(item_prices) > 0:
+        ItemPrice.objects.bulk_create(item_prices, batch_size=settings.RESOURCES_ITEM_PRICE_BULK_CREATE_BATCH_SIZE)
+    return [_existing.get((i.domain, i.sku), i) for i in items]
+
+
 class BuildWalmartCaItemPrice:
     """ walmart.ca specific version of BuildItemPrice
     """
@@ -15,11 +51,10 @@ class BuildWalmartCaItemPrice:
     _price_data = None
     _stores_raw_data = None
 
-    _items = []
-    _item_prices = []
+    def __init__(self, raw_data=None, price_raw_data=None, stores_raw_data=None, commit=True):
+        """ commit: False to leave saving to the caller - save_item_prices(get_items(), get_item_prices())
 
-    def __init__(self, raw_data=None, price_raw_data=None, stores_raw_data=None):
-        """ price_raw_data:
+            price_raw_data:
                 RawData.objects.get(domain=self._domain,
                                     url=settings.WALMART_CA_API_ITEM_PRICE_LINK_FORMAT.format(_parent_sku),
                                     job_id=self._job_id,)
@@ -55,11 +90,15 @@ class BuildWalmartCaItemPrice:
         self._meta_data = raw_data.meta_data
         self._price_data = price_raw_data.data
         self._stores_raw_data = stores_raw_data
+        self._items = []
+        self._item_prices = []
 
         if self._domain in ['walmart.ca',]:
             self._build_walmart_ca_item_price()
         else:
             raise Exception('[{}] domain supposed to be walmart.ca. wrong domain passed instead: {}'.format(self._job_id, self._domain))
+        if commit:
+            self._items = save_item_prices(self._items, self._item_prices)
 
     def get_items(self):
         """ get list of walmart.ca model.Item object
@@ -130,22 +169,18 @@ class BuildWalmartCaItemPrice:
             raise Exception('[{}] SKU cannot be extracted from url - {}'.format(self._job_id, self._url))
         for sku, _product_info in self._data['entities']['skus'].items():
             _upc = _product_info['upc'][0] if len(_product_info.get('upc', [])) > 0 else None
-            _item = None
-            try:
-                _item = Item.objects.get(domain=self._domain, sku=sku)
-            except Item.DoesNotExist:
-                # create new item
-                _item = Item.objects.create(domain=self._domain,
-                            sku=sku,
-                            parent_sku=_parent_sku,
-                            upc=_upc,
-                            title=_product_info.get('name'),
-                            brand_name=_product_info.get('brand', {}).get('name'),
-                            picture_url=_product_info['images'][0].get('large', {}).get('url') if len(_product_info.get('images', [])) > 0 else None,
-                            meta_title=self._meta_data.get('og:title', self._meta_data.get('title')),
-                            meta_description=self._meta_data.get('og:description', self._meta_data.get('description')),
-                            meta_image=self._meta_data.get('og:image'),
-                        )
+            # saved by save_item_prices() only if not exists yet
+            _item = Item(domain=self._domain,
+                        sku=sku,
+                        parent_sku=_parent_sku,
+                        upc=_upc,
+                        title=_product_info.get('name'),
+                        brand_name=_product_info.get('brand', {}).get('name'),
+                        picture_url=_product_info['images'][0].get('large', {}).get('url') if len(_product_info.get('images', [])) > 0 else None,
+                        meta_title=self._meta_data.get('og:title', self._meta_data.get('title')),
+                        meta_description=self._meta_data.get('og:description', self._meta_data.get('description')),
+                        meta_image=self._meta_data.get('og:image'),
+                    )
             self._items.append(_item)
 
             # generate store_availabilities json
@@ -166,7 +201,7 @@ class BuildWalmartCaItemPrice:
             _offer_id = self._price_data['skus'][sku][0] if len(self._price_data.get('skus', {}).get(sku, [])) > 0 else None
             if _offer_id:
                 _price = self._price_data.get('offers', {}).get(_offer_id, {}).get('currentPrice')
-                _item_price = ItemPrice.objects.create(domain=self._domain,
+                _item_price = ItemPrice(domain=self._domain,
                                 job_id=self._job_id,
                                 sku=sku,
                                 price=_price,
@@ -190,11 +225,10 @@ class BuildCanadiantireCaItemPrice:
     _store_data = None
     _price_data = None
 
-    _items = []
-    _item_prices = []
+    def __init__(self, raw_data=None, store_raw_data=None, price_raw_data=None, commit=True):
+        """ commit: False to leave saving to the caller - save_item_prices(get_items(), get_item_prices())
 
-    def __init__(self, raw_data=None, store_raw_data=None, price_raw_data=None):
-        """ store_raw_data:
+            store_raw_data:
                 RawData.objects.get(domain=self._domain,
                                     url__startwith=settings.CANADIANTIRE_CA_API_STORES_LINK,
                                     job_id=self._job_id,)
@@ -219,11 +253,15 @@ class BuildCanadiantireCaItemPrice:
         self._meta_data = raw_data.meta_data
         self._store_data = self._build_store_data(store_raw_data.data)
         self._price_data = self._build_price_data(price_raw_data.data)
+        self._items = []
+        self._item_prices = []
 
         if self._domain in ['canadiantire.ca',]:
             self._build_canadiantire_ca_item_price()
         else:
             raise Exception('[{}] domain supposed to be canadiantire.ca. wrong domain passed instead: {}'.format(self._job_id, self._domain))
+        if commit:
+            self._items = save_item_prices(self._items, self._item_prices)
 
     def get_items(self):
         """ get list of canadiantire.ca model.Item object
@@ -338,22 +376,18 @@ class BuildCanadiantireCaItemPrice:
         if _sk is None:
             raise Exception('[{}] SKU cannot be extracted from url - {}'.format(self._job_id, self._url))
         for sku in self._data.get('SkuSelectors', {}).get('skuListProperties', {}.keys()):
-            _item = None
-            try:
-                _item = Item.objects.get(domain=self._domain, sku=sku)
-            except Item.DoesNotExist:
-                # create new item
-                _item = Item.objects.create(domain=self._domain,
-                            sku=sku,
-                            parent_sku=self._data.get('SkuSelectors', {}).get('pCode'),
-                            upc=None,
-                            title=self._data.get('ProductStickyToc', {}).get('productName'),
-                            brand_name=self._data.get('BrandLogoLink', {}).get('brandName'),
-                            picture_url=self._data.get('ProductStickyToc', {}).get('imageUrl'),
-                            meta_title=self._meta_data.get('og:title', self._meta_data.get('title')),
-                            meta_description=self._meta_data.get('og:description', self._meta_data.get('description')),
-                            meta_image=self._meta_data.get('og:image'),
-                        )
+            # saved by save_item_prices() only if not exists yet
+            _item = Item(domain=self._domain,
+                        sku=sku,
+                        parent_sku=self._data.get('SkuSelectors', {}).get('pCode'),
+                        upc=None,
+                        title=self._data.get('ProductStickyToc', {}).get('productName'),
+                        brand_name=self._data.get('BrandLogoLink', {}).get('brandName'),
+                        picture_url=self._data.get('ProductStickyToc', {}).get('imageUrl'),
+                        meta_title=self._meta_data.get('og:title', self._meta_data.get('title')),
+                        meta_description=self._meta_data.get('og:description', self._meta_data.get('description')),
+                        meta_image=self._meta_data.get('og:image'),
+                    )
             self._items.append(_item)
 
             # generate store_availabilities json
@@ -381,7 +415,7 @@ class BuildCanadiantireCaItemPrice:
                         'store_availability': ItemPrice.ITEM_PRICE_AVAILABILITY_IN_STOCK if _p.get('Quantity') > 0 else ItemPrice.ITEM_PRICE_AVAILABILITY_OUT_OF_STOCK,
                         'store_urgent_quantity': _p.get('Quantity', 0) if _p.get('Quantity', 0) > 0 else None,
                     })
-            _item_price = ItemPrice.objects.create(domain=self._domain,
+            _item_price = ItemPrice(domain=self._domain,
                             job_id=self._job_id,
                             sku=sku,
                             price=price if price else original_price,
@@ -406,7 +440,9 @@ class BuildItemPrice:
     _item = None
     _item_price = None
 
-    def __init__(self, raw_data=None):
+    def __init__(self, raw_data=None, commit=True):
+        """ commit: False to leave saving to the caller - save_item_prices(get_items(), get_item_prices())
+        """
         self.logger = logging.getLogger('pwweb.resources.models.BuildItemPrice')
 
         if not isinstance(raw_data, RawData):
@@ -421,6 +457,20 @@ class BuildItemPrice:
             self._build_amazon_item_price()
         elif self._domain in ['walmart.com',]:
             self._build_walmart_com_item_price()
+        self._validate()
+        if commit and self._item is not None:
+            self._item = save_item_prices(self.get_items(), self.get_item_prices())[0]
+
+    def _validate(self):
+        """ not null columns - checked before save, so one row does not fail a bulk insert
+        """
+        _missing = []
+        if self._item is not None and self._item.title is None:
+            _missing.append('title')
+        if self._item_price is not None:
+            _missing += [f for f in ['price', 'original_price',] if getattr(self._item_price, f) is None]
+        if len(_missing) > 0:
+            raise Exception('[{}] {}: missing {} - {}'.format(self._job_id, self._domain, ', '.join(_missing), self._url))
 
     def get_item(self):
         """ get model.Item object
@@ -432,6 +482,16 @@ class BuildItemPrice:
         """
         return self._item_price
 
+    def get_items(self):
+        """ same as get_item(), as a list
+        """
+        return [self._item,] if self._item is not None else []
+
+    def get_item_prices(self):
+        """ same as get_item_price(), as a list
+        """
+        return [self._item_price,] if self._item_price is not None else []
+
     def _build_amazon_item_price(self):
         """ 1. validate url
             2. check item already exist in resrc_items table
@@ -440,26 +500,25 @@ class BuildItemPrice:
                 - price
                 - original price
                 - quantity
+            price tracking raw data (pwbot fields=price) has no meta_data, and data has no picture_urls/brand_name
         """
         sku = utils.extract_sku_from_url(url=self._url, domain=self._domain)
         if sku is None:
             raise Exception('[{}] SKU cannot be extracted from url - {}'.format(self._job_id, self._url))
-        try:
-            self._item = Item.objects.get(domain=self._domain, sku=sku)
-        except Item.DoesNotExist:
-            # create new item
-            self._item = Item.objects.create(domain=self._domain,
-                        sku=sku,
-                        parent_sku=self._data['parent_asin'],
-                        upc=None,
-                        title=self._data['title'],
-                        brand_name=self._data.get('brand_name', None),
-                        picture_url=self._data.get('picture_urls', [])[0] if len(self._data.get('picture_urls', [])) > 0 else None,
-                        meta_title=self._meta_data.get('og:title', self._meta_data.get('title')),
-                        meta_description=self._meta_data.get('og:description', self._meta_data.get('description')),
-                        meta_image=self._meta_data.get('og:image'),
-                    )
-        self._item_price = ItemPrice.objects.create(domain=self._domain,
+        meta_data = self._meta_data or {}
+        # saved by save_item_prices() only if not exists yet
+        self._item = Item(domain=self._domain,
+                    sku=sku,
+                    parent_sku=self._data['parent_asin'],
+                    upc=None,
+                    title=self._data['title'],
+                    brand_name=self._data.get('brand_name', None),
+                    picture_url=self._data.get('picture_urls', [])[0] if len(self._data.get('picture_urls', [])) > 0 else None,
+                    meta_title=meta_data.get('og:title', meta_data.get('title')),
+                    meta_description=meta_data.get('og:description', meta_data.get('description')),
+                    meta_image=meta_data.get('og:image'),
+                )
+        self._item_price = ItemPrice(domain=self._domain,
                         job_id=self._job_id,
                         sku=sku,
                         price=self._data['price'],
@@ -508,21 +567,18 @@ class BuildItemPrice:
             raise Exception('[{}] SKU cannot be extracted from url - {}'.format(self._job_id, self._url))
         # todo: need to have better exception handling if this key missing in data (i.e. email me...)
         _product_info = self._data['item']['product']['buyBox']['products'][0]
-        try:
-            self._item = Item.objects.get(domain=self._domain, sku=sku)
-        except Item.DoesNotExist:
-            # create new item
-            self._item = Item.objects.create(domain=self._domain,
-                        sku=sku,
-                        parent_sku=self._data['item']['product']['buyBox']['primaryUsItemId'],
-                        upc=_product_info['upc'],
-                        title=_product_info['productName'],
-                        brand_name=_product_info['brandName'],
-                        picture_url=_product_info['images'][0]['url'] if len(_product_info['images']) > 0 and 'url' in _product_info['images'][0] else None,
-                        meta_title=self._meta_data.get('og:title', self._meta_data.get('title')),
-                        meta_description=self._meta_data.get('og:description', self._meta_data.get('description')),
-                        meta_image=self._meta_data.get('og:image'),
-                    )
+        # saved by save_item_prices() only if not exists yet
+        self._item = Item(domain=self._domain,
+                    sku=sku,
+                    parent_sku=self._data['item']['product']['buyBox']['primaryUsItemId'],
+                    upc=_product_info['upc'],
+                    title=_product_info['productName'],
+                    brand_name=_product_info['brandName'],
+                    picture_url=_product_info['images'][0]['url'] if len(_product_info['images']) > 0 and 'url' in _product_info['images'][0] else None,
+                    meta_title=self._meta_data.get('og:title', self._meta_data.get('title')),
+                    meta_description=self._meta_data.get('og:description', self._meta_data.get('description')),
+                    meta_image=self._meta_data.get('og:image'),
+                )
         # generate store_availabilities json
         store_availabilities = []
         if 'pickupOptions' in _product_info and len(_product_info['pickupOptions']) > 0:
@@ -539,7 +595,7 @@ class BuildItemPrice:
                     'store_urgent_quantity': s.get('urgentQuantity', 0) if s.get('urgentQuantity', 0) > 0 else None,
                 })
         _price = _product_info.get('priceMap', {}).get('price')
-        self._item_price = ItemPrice.objects.create(domain=self._domain,
+        self._item_price = ItemPrice(domain=self._domain,
                         job_id=self._job_id,
                         sku=sku,
                         price=_price,
@@ -549,3 +605,180 @@ class BuildItemPrice:
                         store_availabilities=store_availabilities if len(store_availabilities) > 0 else None,
                     )
 
+
+
+def claim_raw_data(raw_data):
+    """ mark raw_data as built. returns False if item prices of raw_data are
+        built already (or being built by another worker).
+        call inside transaction.atomic() - the claim is rolled back if the build fails
+    """
+    return RawData.objects.filter(pk=raw_data.pk,
+                                item_price_built_at__isnull=True).update(item_price_built_at=timezone.now()) > 0
+
+
+def build_item_prices(raw_data_ids):
+    """ amazon.com, amazon.ca, walmart.com - one raw data per item price.
+        raw data are built RESOURCES_ITEM_PRICE_BULK_CREATE_BATCH_SIZE at a time,
+        each batch with a fixed number of queries. raw data built already, or
+        being built by another worker, are skipped.
+        returns list of error messages
+    """
+    error_messages = []
+    raw_data_ids = list(raw_data_ids)
+    for i in range(0, len(raw_data_ids), settings.RESOURCES_ITEM_PRICE_BULK_CREATE_BATCH_SIZE):
+        with transaction.atomic():
+            _built = []
+            _items = []
+            _item_prices = []
+            for _raw in RawData.objects.select_for_update(skip_locked=True).filter(
+                        pk__in=raw_data_ids[i:i + settings.RESOURCES_ITEM_PRICE_BULK_CREATE_BATCH_SIZE],
+                        item_price_built_at__isnull=True):
+                try:
+                    _bip = BuildItemPrice(_raw, commit=False)
+                except Exception as e:
+                    error_messages.append('[{}] {}'.format(_raw.url, str(e)))
+                    continue
+                _items += _bip.get_items()
+                _item_prices += _bip.get_item_prices()
+                _built.append((_raw, _bip))
+            try:
+                with transaction.atomic():
+                    save_item_prices(_items, _item_prices)
+                _saved = [_raw.pk for _raw, _ in _built]
+            except (IntegrityError, DataError):
+                # a bad row fails the whole bulk insert - save row by row, each in its own savepoint
+                _saved = []
+                for _raw, _bip in _built:
+                    try:
+                        with transaction.atomic():
+                            save_item_prices(_bip.get_items(), _bip.get_item_prices())
+                    except (IntegrityError, DataError) as e:
+                        error_messages.append('[{}] {}'.format(_raw.url, str(e)))
+                        continue
+                    _saved.append(_raw.pk)
+            RawData.objects.filter(pk__in=_saved).update(item_price_built_at=timezone.now())
+    return error_messages
+
+
+def group_raw_data(raw_data_list):
+    """ hash join raw data of walmart.ca/canadiantire.ca by product group.
+        returns {parent_sku: [RawData, ...]}
+    """
+    groups = {}
+    for _raw in raw_data_list:
+        if _raw.parent_sku is not None:
+            groups.setdefault(_raw.parent_sku, []).append(_raw)
+    return groups
+
+
+def _product_group(base_raw_data, group_raw_data=None):
+    """ every raw data of the product group base_raw_data is the item page of - one indexed query
+    """
+    if group_raw_data is not None:
+        return group_raw_data
+    return list(RawData.objects.filter(job_id=base_raw_data.job_id,
+                                    domain=base_raw_data.domain,
+                                    parent_sku=base_raw_data.parent_sku))
+
+
+def build_walmart_ca_item_price(base_raw_data, complete_only=False, group_raw_data=None):
+    """ walmart.ca - build from the item page (base_raw_data), its price-offer
+        and its find-in-store raw data (one per upc).
+        group_raw_data: raw data of the product group, if fetched already (see group_raw_data())
+        with complete_only, nothing is built until every request of the group is in.
+        returns False if not built
+    """
+    _price_raw = None
+    _stores_raw = {}
+    _failed_upcs = set()
+    for _raw in _product_group(base_raw_data, group_raw_data):
+        if _raw.kind == settings.RESOURCES_RAW_DATA_KIND_PRICE_API and (_raw.http_status is None or _raw.http_status < 400):
+            _price_raw = _raw
+        elif _raw.kind == settings.RESOURCES_RAW_DATA_KIND_STORE_API:
+            _upc = utils.extract_upc_from_walmart_ca_url(_raw.url)
+            if _raw.http_status is None or _raw.http_status < 400:
+                _stores_raw[_upc] = _raw
+            else:
+                # failed requests complete the group as well, but carry no store data
+                _failed_upcs.add(_upc)
+    if complete_only:
+        _upcs = set(p['upc'][0] for p in (base_raw_data.data or {}).get('entities', {}).get('skus', {}).values() if len(p.get('upc', [])) > 0)
+        if _price_raw is None or not _upcs.issubset(_failed_upcs.union(_stores_raw.keys())):
+            return False
+    if _price_raw is None:
+        raise Exception('[{}] walmart.ca: no price data scraped - [parent sku:{}]'.format(base_raw_data.job_id, base_raw_data.parent_sku))
+    with transaction.atomic():
+        if not claim_raw_data(base_raw_data):
+            return False
+        BuildWalmartCaItemPrice(raw_data=base_raw_data, price_raw_data=_price_raw, stores_raw_data=_stores_raw)
+    return True
+
+
+def build_canadiantire_ca_item_price(base_raw_data, complete_only=False, group_raw_data=None):
+    """ canadiantire.ca - build from the item page (base_raw_data), its stores
+        and its price availability raw data.
+        group_raw_data: raw data of the product group, if fetched already (see group_raw_data())
+        with complete_only, nothing is built until every request of the group is in.
+        returns False if not built
+    """
+    _store_raw = None
+    _price_raw = None
+    for _raw in _product_group(base_raw_data, group_raw_data):
+        if _raw.http_status is not None and _raw.http_status >= 400:
+            continue
+        if _raw.kind == settings.RESOURCES_RAW_DATA_KIND_STORE_API:
+            _store_raw = _raw
+        elif _raw.kind == settings.RESOURCES_RAW_DATA_KIND_PRICE_API:
+            _price_raw = _raw
+    if _store_raw is None or _price_raw is None:
+        if complete_only:
+            return False
+        raise Exception('[{}] canadiantire.ca: no {} data scraped - [parent sku:{}]'.format(base_raw_data.job_id, 'store' if _store_raw is None else 'price', base_raw_data.parent_sku))
+    with transaction.atomic():
+        if not claim_raw_data(base_raw_data):
+            return False
+        BuildCanadiantireCaItemPrice(raw_data=base_raw_data, store_raw_data=_store_raw, price_raw_data=_price_raw)
+    return True
+
+
+def find_base_raw_data(raw_data):
+    """ walmart.ca, canadiantire.ca - returns the item page raw data of the
+        group raw_data belongs to (raw_data itself if it is the item page),
+        or None if the item page is not in yet
+    """
+    if raw_data.kind == settings.RESOURCES_RAW_DATA_KIND_ITEM_PAGE:
+        return raw_data
+    if raw_data.parent_sku is None:
+        return None
+    return RawData.objects.filter(job_id=raw_data.job_id,
+                                domain=raw_data.domain,
+                                parent_sku=raw_data.parent_sku,
+                                kind=settings.RESOURCES_RAW_DATA_KIND_ITEM_PAGE).first()
+
+
+def build_item_prices_of_raw_data(raw_data_ids):
+    """ build item prices from just ingested raw data, as far as possible.
+        walmart.ca and canadiantire.ca groups are built once complete.
+        whatever cannot be built yet is left to ItemPricesBuild (job finalize).
+        returns list of error messages
+    """
+    _raw_ids = []
+    _base_raws = {}
+    for _raw in RawData.objects.filter(pk__in=raw_data_ids, item_price_built_at__isnull=True).defer('data', 'meta_data'):
+        if _raw.domain in ['amazon.com', 'amazon.ca', 'walmart.com',]:
+            if _raw.http_status is None or _raw.http_status < 400:
+                _raw_ids.append(_raw.pk)
+        elif _raw.domain in ['walmart.ca', 'canadiantire.ca',]:
+            _base_raw = find_base_raw_data(_raw)
+            if _base_raw is not None and _base_raw.item_price_built_at is None and (_base_raw.http_status is None or _base_raw.http_status < 400):
+                _base_raws[_base_raw.pk] = _base_raw
+    error_messages = build_item_prices(_raw_ids)
+    for _base_raw in _base_raws.values():
+        try:
+            if _base_raw.domain == 'walmart.ca':
+                build_walmart_ca_item_price(_base_raw, complete_only=True)
+            else:
+                build_canadiantire_ca_item_price(_base_raw, complete_only=True)
+        except Exception as e:
+            error_messages.append('[{}] {}'.format(_base_raw.url, str(e)))
+    return error_messages
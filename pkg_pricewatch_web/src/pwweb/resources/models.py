@@ -1,7 +1,7 @@
 from django.db import models
 from django.template.defaultfilters import truncatechars
 from django.utils.safestring import mark_safe
-from pwweb import settings
+from pwweb import settings, utils
 
 class RawData(models.Model):
     url = models.TextField(db_index=True)
@@ -10,8 +10,13 @@ class RawData(models.Model):
     data = models.JSONField(blank=True, null=True)
     meta_data = models.JSONField(blank=True, null=True)
     job_id = models.CharField(max_length=64, db_index=True, blank=True, null=True)
+    # product group keys, set on ingest (see extract_keys())
+    kind = models.SmallIntegerField(blank=True, null=True)
+    parent_sku = models.CharField(max_length=32, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     created_at.short_description = 'collected time'
+    # set once item prices of this raw data (or of the group it is the base page of) are built
+    item_price_built_at = models.DateTimeField(blank=True, null=True)
 
     @property
     def item_title(self):
@@ -38,21 +43,6 @@ class RawData(models.Model):
         else:
             return None
 
-    @property
-    def parent_sku(self):
-        if self.data:
-            if self.domain in ['amazon.com', 'amazon.ca',]:
-                if 'parent_asin' in self.data:
-                    return self.data['parent_asin']
-            elif self.domain in ['walmart.com',]:
-                if 'item' in self.data and 'product' in self.data['item'] and 'buyBox' in self.data['item']['product'] and 'primaryUsItemId' in self.data['item']['product']['buyBox']:
-                    return self.data['item']['product']['buyBox']['primaryUsItemId']
-            elif self.domain in ['walmart.ca',]:
-                if 'product' in self.data and 'item' in self.data['product'] and 'id' in self.data['product']['item']:
-                    return self.data['product']['item']['id']
-        else:
-            return None
-
     @property
     def price(self):
         if self.data:
@@ -101,6 +91,16 @@ class RawData(models.Model):
         else:
             return None
 
+    def extract_keys(self):
+        """ set kind and parent_sku from url and data. bulk_create() skips save() - call before
+        """
+        self.kind, self.parent_sku = utils.extract_raw_data_keys(self.url, self.domain, self.data)
+
+    def save(self, *args, **kwargs):
+        if self.kind is None:
+            self.extract_keys()
+        super().save(*args, **kwargs)
+
     def url_short(self):
         return mark_safe('<a href="{}" target="_blank">{}</a>'.format(self.url, truncatechars(self.url, 50)))
     url_short.short_description = 'url'
@@ -111,6 +111,10 @@ class RawData(models.Model):
 
     class Meta:
         db_table = 'resrc_raw_data'
+        indexes = [
+            models.Index(fields=['job_id', 'domain', 'kind'], name='resrc_raw_data_job_kind_idx'),
+            models.Index(fields=['job_id', 'domain', 'parent_sku'], name='resrc_raw_data_job_group_idx'),
+        ]
 
 
 def item_url_short(domain, sku):
@@ -146,6 +150,9 @@ class Item(models.Model):
 
     class Meta:
         db_table = 'resrc_items'
+        constraints = [
+            models.UniqueConstraint(fields=['domain', 'sku'], name='resrc_items_domain_sku_uniq'),
+        ]
 
 
 class ItemPrice(models.Model):
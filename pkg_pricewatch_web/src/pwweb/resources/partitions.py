@@ -0,0 +1,122 @@
+""" pwweb.resources.partitions
+
+    monthly range partitions (by created_at) of resrc_raw_data - see migration 0024.
+
+    partitions are named <table>_pYYYYMM and cover [first day of month, first day of next month) in UTC.
+    rows inserted past the last partition land in the default partition (<table>_default) and are moved
+    into their monthly partition once it is created.
+
+    run 'python manage.py raw_data_partitions' daily (cron) to create partitions ahead of time and
+    to drop the ones past the retention.
+"""
+
+import re
+import datetime
+import logging
+from collections import namedtuple
+from django.db import connection, transaction
+
+RAW_DATA_TABLE = 'resrc_raw_data'
+
+Partition = namedtuple('Partition', ['name', 'lower', 'upper', 'is_default']) # lower/upper: None for MINVALUE/MAXVALUE
+
+logger = logging.getLogger('pwweb.resources.partitions')
+
+
+def month_start(dt, months=0):
+    """ first day of the month of dt (UTC), moved by 'months' months
+    """
+    dt = dt.astimezone(datetime.timezone.utc)
+    m = dt.year * 12 + dt.month - 1 + months
+    return datetime.datetime(m // 12, m % 12 + 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def partition_name(table, start):
+    return '{}_p{:%Y%m}'.format(table, start)
+
+
+def list_partitions(table):
+    """ partitions of table, ordered by lower bound
+    """
+    partitions = []
+    with connection.cursor() as cursor:
+        cursor.execute("""SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = %s""", [table])
+        for name, bound in cursor.fetchall():
+            if bound == 'DEFAULT':
+                partitions.append(Partition(name, None, None, True))
+                continue
+            m = re.match(r"^FOR VALUES FROM \((.+)\) TO \((.+)\)$", bound)
+            if not m:
+                continue
+            partitions.append(Partition(name, _bound_value(cursor, m.group(1)), _bound_value(cursor, m.group(2)), False))
+    return sorted(partitions, key=lambda p: (p.is_default, p.lower or datetime.datetime.min.replace(tzinfo=datetime.timezone.utc)))
+
+
+def _bound_value(cursor, literal):
+    if literal in ['MINVALUE', 'MAXVALUE',]:
+        return None
+    # let postgres read its own literal, i.e. '2026-11-01 00:00:00+00'
+    cursor.execute('SELECT {}::timestamptz'.format(literal))
+    return cursor.fetchone()[0]
+
+
+def _overlaps(partition, start, end):
+    if partition.is_default:
+        return False
+    return (partition.lower is None or partition.lower < end) and (partition.upper is None or start < partition.upper)
+
+
+def create_partitions(table, now, ahead, dry_run=False):
+    """ create monthly partitions from the month of 'now' to 'ahead' months later.
+        months already covered (i.e. by the legacy partition) are skipped.
+        returns names of the created partitions
+    """
+    created = []
+    partitions = list_partitions(table)
+    for months in range(ahead + 1):
+        start, end = month_start(now, months), month_start(now, months + 1)
+        if any(_overlaps(p, start, end) for p in partitions):
+            continue
+        name = partition_name(table, start)
+        if not dry_run:
+            create_partition(table, name, start, end, default=next((p.name for p in partitions if p.is_default), None))
+        created.append(name)
+    return created
+
+
+def create_partition(table, name, start, end, default=None):
+    """ create a partition for [start, end). rows of the range already in the default partition are moved into it
+    """
+    qn = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        in_default = False
+        if default is not None:
+            cursor.execute('SELECT 1 FROM {} WHERE "created_at" >= %s AND "created_at" < %s LIMIT 1'.format(qn(default)), [start, end])
+            in_default = cursor.fetchone() is not None
+        if not in_default:
+            cursor.execute('CREATE TABLE {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)'.format(qn(name), qn(table)), [start, end])
+            return
+        # a range can not be attached while the default partition holds rows of it
+        cursor.execute('CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'.format(qn(name), qn(table)))
+        cursor.execute('WITH moved AS (DELETE FROM {} WHERE "created_at" >= %s AND "created_at" < %s RETURNING *) INSERT INTO {} SELECT * FROM moved'.format(qn(default), qn(name)), [start, end])
+        logger.info('{} rows moved from {} to {}'.format(cursor.rowcount, default, name))
+        cursor.execute('ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s)'.format(qn(table), qn(name)), [start, end])
+
+
+def expired_partitions(table, now, retention_months):
+    """ partitions holding rows older than 'retention_months' months only
+    """
+    cutoff = month_start(now, -retention_months)
+    return [p for p in list_partitions(table) if not p.is_default and p.upper is not None and p.upper <= cutoff]
+
+
+def remove_partition(table, name, detach_only=False):
+    """ detach a partition, and drop it unless detach_only (kept as a plain table, i.e. for archiving)
+    """
+    qn = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('ALTER TABLE {} DETACH PARTITION {}'.format(qn(table), qn(name)))
+        if not detach_only:
+            cursor.execute('DROP TABLE {}'.format(qn(name)))
@@ -5,3 +5,26 @@ class RawDataSerializer(serializers.ModelSerializer):
     class Meta:
         model = RawData
         fields = '__all__'
+
+
+def validate_raw_data(record):
+    """ cheap validation of a single raw data record on bulk ingest,
+        instead of running RawDataSerializer for every record.
+        returns a dict of field errors - empty if the record is valid
+    """
+    if not isinstance(record, dict):
+        return {'non_field_errors': ['Expected a JSON object.']}
+    errors = {}
+    for field in ['url', 'domain',]:
+        if not isinstance(record.get(field), str) or record.get(field) == '':
+            errors[field] = ['This field is required.']
+    for field in ['domain', 'job_id',]:
+        _max_length = RawData._meta.get_field(field).max_length
+        if isinstance(record.get(field), str) and len(record.get(field)) > _max_length:
+            errors[field] = ['Ensure this field has no more than {} characters.'.format(_max_length)]
+    if record.get('job_id') is not None and not isinstance(record.get('job_id'), str):
+        errors['job_id'] = ['Not a valid string.']
+    _http_status = record.get('http_status')
+    if _http_status is not None and (not isinstance(_http_status, int) or isinstance(_http_status, bool) or not 0 <= _http_status < 32768):
+        errors['http_status'] = ['A valid integer is required.']
+    return errors
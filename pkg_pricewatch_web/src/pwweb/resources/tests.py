@@ -1,8 +1,14 @@
+import copy
 import json
+import gzip
+import unittest
+from django.db import connection
 from django.test import TestCase
 from pwweb import settings, utils
 from pwweb.resources.models import RawData, Item, ItemPrice
-from pwweb.resources.modelBuilders import BuildItemPrice, BuildWalmartCaItemPrice, BuildCanadiantireCaItemPrice
+from pwweb.resources.modelBuilders import BuildItemPrice, BuildWalmartCaItemPrice, BuildCanadiantireCaItemPrice, build_item_prices_of_raw_data, build_item_prices
+from pwweb.resources import partitions
+from pwweb.parsers import msgpack, zstandard
 
 
 class StartsEndsWithTestCase(TestCase):
@@ -80,6 +86,23 @@ class BuildItemPriceTestCase(TestCase):
         self.assertEqual(item_price.store_availabilities, None)
         self.assertEqual(item_price.job_id, '82d5c21b-46ff-4bcb-9a42-608e46c1e661')
 
+    def test_build_amazon_ca_item_price_price_only(self):
+        # pwbot fields=price raw data - no meta_data, price fields only
+        raw_data = RawData(url='https://www.amazon.ca/dp/B00M0D2HQ0', domain='amazon.ca', http_status=200,
+                    job_id='82d5c21b-46ff-4bcb-9a42-608e46c1e661',
+                    data={'asin': 'B00M0D2HQ0', 'parent_asin': 'B00M0D2HQ0', 'variation_asins': [], 'status': 1,
+                        'title': 'The Third Wheel (Diary of a Wimpy Kid #7)', 'price': 17.81, 'original_price': 19.99, 'quantity': 5},
+                    meta_data=None)
+        bip = BuildItemPrice(raw_data=raw_data, commit=False)
+        item = bip.get_item()
+        item_price = bip.get_item_price()
+        self.assertEqual(item.title, 'The Third Wheel (Diary of a Wimpy Kid #7)')
+        self.assertEqual(item.picture_url, None)
+        self.assertEqual(item.meta_title, None)
+        self.assertEqual(item_price.price, 17.81)
+        self.assertEqual(item_price.original_price, 19.99)
+        self.assertEqual(item_price.online_urgent_quantity, 5)
+
 
     def test_build_walmart_com_item_price(self):
         bip = BuildItemPrice(raw_data=self.WALMART_COM_RAW_DATA_1)
@@ -195,6 +218,21 @@ class BuildWalmartCaItemPriceTestCase(TestCase):
         self.assertEqual(item_prices[4].store_availabilities[2]['store_urgent_quantity'], None)
         self.assertEqual(item_prices[4].job_id, 'fb54168c-2c86-4c93-9b36-7f2185038f1f')
 
+    def test_build_walmart_ca_item_price_queries(self):
+        # fetch items, insert missing items, fetch them again, insert item prices
+        with self.assertNumQueries(4):
+            BuildWalmartCaItemPrice(raw_data=self._build_raw_data(),
+                                    price_raw_data=self._build_price_raw_data(),
+                                    stores_raw_data=self._build_stores_raw_data())
+        # items exist already
+        with self.assertNumQueries(2):
+            bip = BuildWalmartCaItemPrice(raw_data=self._build_raw_data(),
+                                    price_raw_data=self._build_price_raw_data(),
+                                    stores_raw_data=self._build_stores_raw_data())
+        self.assertEqual(Item.objects.filter(domain='walmart.ca').count(), 10)
+        self.assertEqual(ItemPrice.objects.filter(domain='walmart.ca').count(), 20)
+        self.assertTrue(all(i.pk is not None for i in bip.get_items()))
+
 
     def _build_raw_data(self):
         return RawData(
@@ -385,3 +423,236 @@ class BuildCanadiantireCaItemPriceTestCase(TestCase):
             # use json converter with JavaScript escaped option: https://www.freeformatter.com/json-formatter.html
             data=json.loads("""[{\"SKU\":\"1871455\",\"Price\":119.99,\"Store\":\"0019\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"8\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, M\"},{\"SKU\":\"1871456\",\"Price\":119.99,\"Store\":\"0019\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"6\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, L\"},{\"SKU\":\"1871457\",\"Price\":119.99,\"Store\":\"0019\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"4\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, XL\"},{\"SKU\":\"1871458\",\"Price\":119.99,\"Promo\":{\"Price\":49.93,\"Origin\":\"2\"},\"Store\":\"0019\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"Y\"},\"Location\":{\"Aisle\":\"Aisle 68\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":2,\"CheckDigit\":\"2\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, XXL\"},{\"SKU\":\"1871668\",\"Price\":119.99,\"Store\":\"0019\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"2\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, S\"},{\"SKU\":\"1871455\",\"Price\":119.99,\"Store\":\"0030\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"8\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, M\"},{\"SKU\":\"1871456\",\"Price\":119.99,\"Store\":\"0030\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"6\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, L\"},{\"SKU\":\"1871457\",\"Price\":119.99,\"Store\":\"0030\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"4\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, XL\"},{\"SKU\":\"1871458\",\"Price\":119.99,\"Store\":\"0030\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"2\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, XXL\"},{\"SKU\":\"1871668\",\"Price\":119.99,\"Store\":\"0030\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"2\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, S\"},{\"SKU\":\"1871455\",\"Price\":119.99,\"Store\":\"0126\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Location\":{\"Aisle\":\"Aisle 25S00\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"8\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, M\"},{\"SKU\":\"1871456\",\"Price\":119.99,\"Store\":\"0126\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"6\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, L\"},{\"SKU\":\"1871457\",\"Price\":119.99,\"Store\":\"0126\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"4\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, XL\"},{\"SKU\":\"1871458\",\"Price\":119.99,\"Store\":\"0126\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"2\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, XXL\"},{\"SKU\":\"1871668\",\"Price\":119.99,\"Store\":\"0126\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"2\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, S\"},{\"SKU\":\"1871455\",\"Price\":119.99,\"Store\":\"0150\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"8\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, M\"},{\"SKU\":\"1871456\",\"Price\":119.99,\"Promo\":{\"Price\":49.93,\"Origin\":\"2\"},\"Store\":\"0150\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"Y\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":1,\"CheckDigit\":\"6\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, L\"},{\"SKU\":\"1871457\",\"Price\":119.99,\"Store\":\"0150\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"4\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, XL\"},{\"SKU\":\"1871458\",\"Price\":119.99,\"Store\":\"0150\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"2\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, XXL\"},{\"SKU\":\"1871668\",\"Price\":119.99,\"Store\":\"0150\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"2\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, S\"},{\"SKU\":\"1871455\",\"Price\":119.99,\"Promo\":{\"Price\":49.93,\"Origin\":\"2\"},\"Store\":\"0182\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"Y\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":1,\"CheckDigit\":\"8\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, M\"},{\"SKU\":\"1871456\",\"Price\":119.99,\"Store\":\"0182\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"6\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, L\"},{\"SKU\":\"1871457\",\"Price\":119.99,\"Promo\":{\"Price\":49.93,\"Origin\":\"2\"},\"Store\":\"0182\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"Y\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":1,\"CheckDigit\":\"4\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, XL\"},{\"SKU\":\"1871458\",\"Price\":119.99,\"Promo\":{\"Price\":49.93,\"Origin\":\"2\"},\"Store\":\"0182\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"Y\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":1,\"CheckDigit\":\"2\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, XXL\"},{\"SKU\":\"1871668\",\"Price\":119.99,\"Store\":\"0182\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"2\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, S\"},{\"SKU\":\"1871455\",\"Price\":119.99,\"Promo\":{\"Price\":49.93,\"Origin\":\"2\"},\"Store\":\"0192\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"Y\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":1,\"CheckDigit\":\"8\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, M\"},{\"SKU\":\"1871456\",\"Price\":119.99,\"Store\":\"0192\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"6\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, L\"},{\"SKU\":\"1871457\",\"Price\":119.99,\"Store\":\"0192\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"4\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, XL\"},{\"SKU\":\"1871458\",\"Price\":119.99,\"Store\":\"0192\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"2\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, XXL\"},{\"SKU\":\"1871668\",\"Price\":119.99,\"Store\":\"0192\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"2\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, S\"},{\"SKU\":\"1871455\",\"Price\":119.99,\"Store\":\"0214\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Location\":{\"Aisle\":\"Aisle 54\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"8\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, M\"},{\"SKU\":\"1871456\",\"Price\":119.99,\"Store\":\"0214\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"6\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, L\"},{\"SKU\":\"1871457\",\"Price\":119.99,\"Store\":\"0214\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Location\":{\"Aisle\":\"Aisle 54\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"4\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, XL\"},{\"SKU\":\"1871458\",\"Price\":119.99,\"Store\":\"0214\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"2\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, XXL\"},{\"SKU\":\"1871668\",\"Price\":119.99,\"Store\":\"0214\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"2\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, S\"},{\"SKU\":\"1871455\",\"Price\":119.99,\"Store\":\"0273\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"8\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, M\"},{\"SKU\":\"1871456\",\"Price\":119.99,\"Store\":\"0273\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"6\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, L\"},{\"SKU\":\"1871457\",\"Price\":119.99,\"Store\":\"0273\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"4\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, XL\"},{\"SKU\":\"1871458\",\"Price\":119.99,\"Store\":\"0273\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"2\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, XXL\"},{\"SKU\":\"1871668\",\"Price\":119.99,\"Store\":\"0273\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"2\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, S\"},{\"SKU\":\"1871455\",\"Price\":119.99,\"Store\":\"0459\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"N\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"8\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, M\"},{\"SKU\":\"1871456\",\"Price\":119.99,\"Store\":\"0459\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"N\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"6\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, L\"},{\"SKU\":\"1871457\",\"Price\":119.99,\"Store\":\"0459\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"N\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":2,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"4\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, XL\"},{\"SKU\":\"1871458\",\"Price\":119.99,\"Store\":\"0459\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"N\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":2,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"2\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, XXL\"},{\"SKU\":\"1871668\",\"Price\":119.99,\"Store\":\"0459\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"N\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"2\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, S\"},{\"SKU\":\"1871455\",\"Price\":119.99,\"Store\":\"0485\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"8\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, M\"},{\"SKU\":\"1871456\",\"Price\":119.99,\"Store\":\"0485\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"6\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, L\"},{\"SKU\":\"1871457\",\"Price\":119.99,\"Store\":\"0485\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"4\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, XL\"},{\"SKU\":\"1871458\",\"Price\":119.99,\"Store\":\"0485\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"2\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, XXL\"},{\"SKU\":\"1871668\",\"Price\":119.99,\"Store\":\"0485\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"2\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, S\"},{\"SKU\":\"1871455\",\"Price\":119.99,\"Store\":\"0600\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"8\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, M\"},{\"SKU\":\"1871456\",\"Price\":119.99,\"Store\":\"0600\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"6\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, L\"},{\"SKU\":\"1871457\",\"Price\":119.99,\"Store\":\"0600\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"4\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, XL\"},{\"SKU\":\"1871458\",\"Price\":119.99,\"Store\":\"0600\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"2\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, XXL\"},{\"SKU\":\"1871668\",\"Price\":119.99,\"Store\":\"0600\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"2\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, S\"},{\"SKU\":\"1871455\",\"Price\":119.99,\"Store\":\"0654\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"8\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, M\"},{\"SKU\":\"1871456\",\"Price\":119.99,\"Store\":\"0654\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"6\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, L\"},{\"SKU\":\"1871457\",\"Price\":119.99,\"Store\":\"0654\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"4\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, XL\"},{\"SKU\":\"1871458\",\"Price\":119.99,\"Store\":\"0654\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"2\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, XXL\"},{\"SKU\":\"1871668\",\"Price\":119.99,\"Store\":\"0654\",\"Banner\":\"CTR\",\"Product\":\"1871455P\",\"IsOnline\":{\"Active\":\"Y\",\"Sellable\":\"Y\",\"Exclusive\":\"N\",\"Orderable\":\"N\",\"StoreClearance\":\"N\"},\"Messages\":{\"Warranty\":\"This product carries a 1 year exchange warranty redeemable at any Canadian Tire store.\"},\"Quantity\":0,\"Corporate\":{\"Quantity\":0},\"CheckDigit\":\"2\",\"PartNumber\":\"WM4502S17\",\"Description\":\"WDS JKT MEN GY, S\"}]"""),
         )
+
+
+class RawDataKeysTestCase(TestCase):
+
+    def test_extract_raw_data_keys(self):
+        self.assertEqual(utils.extract_raw_data_keys('https://www.walmart.ca/en/ip/6000199112683', 'walmart.ca'),
+                        (settings.RESOURCES_RAW_DATA_KIND_ITEM_PAGE, '6000199112683'))
+        self.assertEqual(utils.extract_raw_data_keys('https://www.walmart.ca/api/product-page/v2/price-offer#6000199112683', 'walmart.ca'),
+                        (settings.RESOURCES_RAW_DATA_KIND_PRICE_API, '6000199112683'))
+        self.assertEqual(utils.extract_raw_data_keys('https://www.walmart.ca/api/product-page/find-in-store?latitude=43.7292&longitude=-79.393&lang=en&upc=5818510180#6000199112683', 'walmart.ca'),
+                        (settings.RESOURCES_RAW_DATA_KIND_STORE_API, '6000199112683'))
+        self.assertEqual(utils.extract_raw_data_keys('https://www.canadiantire.ca/en/pdp/1871455.html', 'canadiantire.ca', {'SkuSelectors': {'pCode': '1871455P'}}),
+                        (settings.RESOURCES_RAW_DATA_KIND_ITEM_PAGE, '1871455P'))
+        self.assertEqual(utils.extract_raw_data_keys('https://api-triangle.canadiantire.ca/dss/services/v4/stores?lang=en&radius=1000&maxCount=12&storeType=store&lat=43.7292&lng=-79.393#1871455p', 'canadiantire.ca'),
+                        (settings.RESOURCES_RAW_DATA_KIND_STORE_API, '1871455P'))
+
+    def test_build_canadiantire_ca_item_price_on_job_finalize(self):
+        for _raw in [BuildCanadiantireCaItemPriceTestCase._build_raw_data(self),
+                    BuildCanadiantireCaItemPriceTestCase._build_store_raw_data(self),
+                    BuildCanadiantireCaItemPriceTestCase._build_price_raw_data(self),]:
+            _raw.save()
+        response = self.client.post('/api/resource/build_item_prices/',
+                                    data=json.dumps({'job_id': _raw.job_id}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(ItemPrice.objects.filter(domain='canadiantire.ca', job_id=_raw.job_id).count(), 5)
+
+
+class IncrementalItemPriceBuildTestCase(TestCase):
+
+    def test_build_amazon_ca_item_price_on_ingest(self):
+        _raw = RawData.objects.create(url='https://www.amazon.ca/dp/B008I25JB2/?th=1&psc=1',
+                                    domain='amazon.ca',
+                                    http_status=200,
+                                    data={'asin': 'B008I25JB2', 'parent_asin': 'B008I25JB2', 'title': 'Hotel Spa Collection Herringbone Textured Plush Robe', 'price': 26.51, 'quantity': 1000,},
+                                    meta_data={},
+                                    job_id='tempjobid')
+        self.assertEqual(build_item_prices_of_raw_data([_raw.pk]), [])
+        self.assertEqual(ItemPrice.objects.filter(job_id='tempjobid').count(), 1)
+        # built only once - neither again on ingest nor on job finalize
+        build_item_prices_of_raw_data([_raw.pk])
+        response = self.client.post('/api/resource/build_item_prices/',
+                                    data=json.dumps({'job_id': 'tempjobid'}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(ItemPrice.objects.filter(job_id='tempjobid').count(), 1)
+
+    def test_build_walmart_ca_item_price_once_group_complete(self):
+        _base_raw = BuildWalmartCaItemPriceTestCase._build_raw_data(self)
+        _base_raw.save()
+        _price_raw = BuildWalmartCaItemPriceTestCase._build_price_raw_data(self)
+        _price_raw.save()
+        _stores_raw = list(BuildWalmartCaItemPriceTestCase._build_stores_raw_data(self).values())
+        for _s_raw in _stores_raw[:-1]:
+            _s_raw.save()
+        self.assertEqual(build_item_prices_of_raw_data([_base_raw.pk, _price_raw.pk,] + [_s_raw.pk for _s_raw in _stores_raw[:-1]]), [])
+        self.assertEqual(ItemPrice.objects.filter(domain='walmart.ca').count(), 0)
+        # last find-in-store request completes the group
+        _stores_raw[-1].save()
+        self.assertEqual(build_item_prices_of_raw_data([_stores_raw[-1].pk]), [])
+        self.assertEqual(ItemPrice.objects.filter(domain='walmart.ca').count(), 10)
+        _base_raw.refresh_from_db()
+        self.assertIsNotNone(_base_raw.item_price_built_at)
+
+
+class BatchItemPriceBuildTestCase(TestCase):
+
+    def _build_amazon_ca_raw_data(self, asin, price):
+        return RawData.objects.create(url='https://www.amazon.ca/dp/{}/?th=1&psc=1'.format(asin),
+                                    domain='amazon.ca',
+                                    http_status=200,
+                                    data={'asin': asin, 'parent_asin': asin, 'title': 'Hotel Spa Collection Herringbone Textured Plush Robe', 'price': price, 'quantity': 1000,},
+                                    meta_data={},
+                                    job_id='tempjobid')
+
+    def test_build_item_prices_no_price(self):
+        _good_raw = self._build_amazon_ca_raw_data('B008I25JB2', 26.51)
+        _data = copy.deepcopy(BuildItemPriceTestCase.WALMART_COM_RAW_DATA_1.data)
+        _data['item']['product']['buyBox']['products'][0]['priceMap']['price'] = None
+        _bad_raw = RawData.objects.create(url=BuildItemPriceTestCase.WALMART_COM_RAW_DATA_1.url,
+                                    domain='walmart.com',
+                                    http_status=200,
+                                    data=_data,
+                                    meta_data=BuildItemPriceTestCase.WALMART_COM_RAW_DATA_1.meta_data,
+                                    job_id='tempjobid')
+        error_messages = build_item_prices([_good_raw.pk, _bad_raw.pk,])
+        self.assertEqual(len(error_messages), 1)
+        self.assertTrue(error_messages[0].startswith('[{}]'.format(_bad_raw.url)))
+        self.assertIn('missing price', error_messages[0])
+        self.assertEqual(list(ItemPrice.objects.filter(job_id='tempjobid').values_list('sku', flat=True)), ['B008I25JB2',])
+        _bad_raw.refresh_from_db()
+        self.assertIsNone(_bad_raw.item_price_built_at)
+
+    def test_build_item_prices_row_by_row(self):
+        # out of the price column's range - fails in db only
+        _bad_raw = self._build_amazon_ca_raw_data('B000000001', 10 ** 14)
+        _good_raw = self._build_amazon_ca_raw_data('B008I25JB2', 26.51)
+        error_messages = build_item_prices([_bad_raw.pk, _good_raw.pk,])
+        self.assertEqual(len(error_messages), 1)
+        self.assertTrue(error_messages[0].startswith('[{}]'.format(_bad_raw.url)))
+        self.assertIn('numeric field overflow', error_messages[0])
+        self.assertEqual(list(ItemPrice.objects.filter(job_id='tempjobid').values_list('sku', flat=True)), ['B008I25JB2',])
+        _good_raw.refresh_from_db()
+        self.assertIsNotNone(_good_raw.item_price_built_at)
+
+
+class RawDataPartitionTestCase(TestCase):
+
+    def test_create_and_drop_partitions(self):
+        _raw = RawData.objects.create(url='https://www.amazon.ca/dp/B008I25JB2/?th=1&psc=1',
+                                    domain='amazon.ca',
+                                    http_status=200,
+                                    data={'asin': 'B008I25JB2', 'parent_asin': 'B008I25JB2',},
+                                    job_id='tempjobid')
+        # past the last partition - kept in the default partition
+        _later = partitions.month_start(_raw.created_at, 2)
+        RawData.objects.filter(pk=_raw.pk).update(created_at=_later)
+        self.assertEqual(partitions.create_partitions(partitions.RAW_DATA_TABLE, _later, 1),
+                        ['resrc_raw_data_p{:%Y%m}'.format(_later), 'resrc_raw_data_p{:%Y%m}'.format(partitions.month_start(_later, 1))])
+        # nothing to create twice
+        self.assertEqual(partitions.create_partitions(partitions.RAW_DATA_TABLE, _later, 1), [])
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM "resrc_raw_data_p{:%Y%m}"'.format(_later))
+            self.assertEqual(cursor.fetchone()[0], 1)
+        self.assertEqual(RawData.objects.filter(job_id='tempjobid').count(), 1)
+
+        expired = partitions.expired_partitions(partitions.RAW_DATA_TABLE, partitions.month_start(_later, 7), 6)
+        self.assertEqual([p.name for p in expired], ['resrc_raw_data_legacy', 'resrc_raw_data_p{:%Y%m}'.format(_later)])
+        for p in expired:
+            partitions.remove_partition(partitions.RAW_DATA_TABLE, p.name)
+        self.assertEqual(RawData.objects.filter(job_id='tempjobid').count(), 0)
+        self.assertEqual([p.name for p in partitions.list_partitions(partitions.RAW_DATA_TABLE)],
+                        ['resrc_raw_data_p{:%Y%m}'.format(partitions.month_start(_later, 1)), 'resrc_raw_data_default'])
+
+
+class RawDataListCreateTestCase(TestCase):
+
+    def test_create_single_raw_data(self):
+        response = self.client.post('/api/resource/raw_data/',
+                                    data=json.dumps(self._build_raw_data_dict('B008I25JB2')),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(RawData.objects.filter(job_id='tempjobid').count(), 1)
+
+    def test_create_batch_raw_data(self):
+        response = self.client.post('/api/resource/raw_data/',
+                                    data=json.dumps([self._build_raw_data_dict(asin) for asin in ['B008I25JB2', 'B008I25JAS', 'B008I25J8U',]]),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()), 3)
+        self.assertEqual(RawData.objects.filter(job_id='tempjobid').count(), 3)
+
+    def test_bulk_create_json_array(self):
+        response = self.client.post('/api/resource/raw_data/bulk/',
+                                    data=json.dumps([self._build_raw_data_dict(asin) for asin in ['B008I25JB2', 'B008I25JAS', 'B008I25J8U',]]),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'created': 3, 'errors': []})
+        self.assertEqual(RawData.objects.filter(job_id='tempjobid').count(), 3)
+
+    def test_bulk_create_ndjson(self):
+        response = self.client.post('/api/resource/raw_data/bulk/',
+                                    data='\n'.join([json.dumps(self._build_raw_data_dict(asin)) for asin in ['B008I25JB2', 'B008I25JAS',]]) + '\n',
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(RawData.objects.filter(job_id='tempjobid', data__asin='B008I25JAS').count(), 1)
+
+    def test_bulk_create_per_record_errors(self):
+        _invalid_domain = self._build_raw_data_dict('B008I25JAS')
+        _invalid_domain['domain'] = None
+        _invalid_http_status = self._build_raw_data_dict('B008I25J8U')
+        _invalid_http_status['http_status'] = 'OK'
+        response = self.client.post('/api/resource/raw_data/bulk/',
+                                    data=json.dumps([self._build_raw_data_dict('B008I25JB2'), _invalid_domain, _invalid_http_status]),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual([e['index'] for e in response.json()['errors']], [1, 2])
+        self.assertIn('domain', response.json()['errors'][0]['errors'])
+        self.assertIn('http_status', response.json()['errors'][1]['errors'])
+        self.assertEqual(RawData.objects.filter(job_id='tempjobid').count(), 1)
+
+    def test_bulk_create_gzip_json(self):
+        response = self.client.post('/api/resource/raw_data/bulk/',
+                                    data=gzip.compress(json.dumps([self._build_raw_data_dict(asin) for asin in ['B008I25JB2', 'B008I25JAS',]]).encode('ascii')),
+                                    content_type='application/json',
+                                    HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(RawData.objects.filter(job_id='tempjobid').count(), 2)
+
+    @unittest.skipIf(msgpack is None or zstandard is None, 'msgpack or zstandard not installed')
+    def test_bulk_create_zstd_msgpack(self):
+        response = self.client.post('/api/resource/raw_data/bulk/',
+                                    data=zstandard.ZstdCompressor().compress(msgpack.packb([self._build_raw_data_dict(asin) for asin in ['B008I25JB2', 'B008I25JAS',]])),
+                                    content_type='application/msgpack',
+                                    HTTP_CONTENT_ENCODING='zstd')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(RawData.objects.filter(job_id='tempjobid', data__asin='B008I25JB2').count(), 1)
+
+    def test_bulk_create_unsupported_encoding(self):
+        response = self.client.post('/api/resource/raw_data/bulk/',
+                                    data=json.dumps([self._build_raw_data_dict('B008I25JB2')]),
+                                    content_type='application/json',
+                                    HTTP_CONTENT_ENCODING='br')
+        self.assertEqual(response.status_code, 415)
+
+    def _build_raw_data_dict(self, asin):
+        return {
+            'url': 'https://www.amazon.ca/dp/{}/?th=1&psc=1'.format(asin),
+            'domain': 'amazon.ca',
+            'http_status': 200,
+            'data': {'asin': asin, 'parent_asin': 'B008I25JB2', 'price': 26.51, 'quantity': 1000,},
+            'meta_data': {'title': 'Hotel Spa Collection Herringbone Textured Plush Robe'},
+            'job_id': 'tempjobid',
+        }
+
+
+class VariationFamiliesTestCase(TestCase):
+
+    def test_variation_families(self):
+        for sku, parent_sku in [('B008I25JB2', 'B008I25J7Q'), ('B008I25JAS', 'B008I25J7Q'), ('B008I25J8U', 'B008I25J7Q'), ('B07T2MD442', None), ('B008I25JB2', 'B00OTHERPA')]:
+            Item.objects.create(domain='amazon.ca' if parent_sku != 'B00OTHERPA' else 'amazon.com', sku=sku, parent_sku=parent_sku, title=sku)
+        response = self.client.post('/api/resource/variation_families/',
+                                    data=json.dumps({'domain': 'amazon.ca', 'skus': ['B008I25JB2', 'B07T2MD442', 'B000000000']}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({k: sorted(v) for k, v in response.json()['families'].items()}, {'B008I25J7Q': ['B008I25J8U', 'B008I25JAS', 'B008I25JB2']})
+
+    def test_variation_families_bad_request(self):
+        response = self.client.post('/api/resource/variation_families/',
+                                    data=json.dumps({'domain': 'amazon.ca', 'skus': 'B008I25JB2'}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
@@ -4,5 +4,7 @@ from pwweb.resources import views
 
 urlpatterns = [
     path('raw_data/', views.RawDataListCreate.as_view()),
-    path('build_item_prices/', views.ItemPricesBuild.as_view())
+    path('raw_data/bulk/', views.RawDataBulkCreate.as_view()),
+    path('build_item_prices/', views.ItemPricesBuild.as_view()),
+    path('variation_families/', views.VariationFamilies.as_view()),
 ]
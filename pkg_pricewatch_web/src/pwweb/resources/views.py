@@ -1,13 +1,16 @@
 from django.http import Http404
+from django.db import transaction
 from rest_framework import viewsets, generics, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.mixins import CreateModelMixin, UpdateModelMixin
 from pwweb import settings, utils
 from pwweb.mixins import MultipleFieldLookupMixin
+from pwweb.parsers import CompressedJSONParser, NDJSONParser, MessagePackParser
 from pwweb.resources.serializers import *
 from pwweb.resources.models import RawData, Item, ItemPrice
-from pwweb.resources.modelBuilders import BuildItemPrice, BuildWalmartCaItemPrice, BuildCanadiantireCaItemPrice
+from pwweb.resources.modelBuilders import build_item_prices, build_walmart_ca_item_price, build_canadiantire_ca_item_price, group_raw_data
+from pwweb.resources.workers import item_price_build_worker
 
 
 class RawDataListCreate(generics.ListCreateAPIView):
@@ -15,13 +18,70 @@ class RawDataListCreate(generics.ListCreateAPIView):
     serializer_class = RawDataSerializer
     # permission_classes = [IsAdminUser]
 
+    def get_serializer(self, *args, **kwargs):
+        """ accept a list of raw data as well (batches sent by pwbot.pipelines.RawDataExportPipeline)
+        """
+        if isinstance(kwargs.get('data'), list):
+            kwargs['many'] = True
+        return super().get_serializer(*args, **kwargs)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        _instances = serializer.instance if isinstance(serializer.instance, list) else [serializer.instance]
+        _ids = [r.pk for r in _instances]
+        transaction.on_commit(lambda: item_price_build_worker.submit(_ids))
+
     # def post(self, request, *args, **kwargs):
     #     """ handle create on post method
     #     """
     #     return self.update(request, *args, **kwargs)
 
 
+class RawDataBulkCreate(APIView):
+    """ bulk ingest raw data. accepts either a JSON array (application/json),
+        a NDJSON stream (application/x-ndjson) or a MessagePack array
+        (application/msgpack) of raw data records, optionally compressed
+        (Content-Encoding: gzip | zstd).
+        valid records are written with a single bulk insert, invalid ones
+        are reported back by their index.
+    """
+    parser_classes = [CompressedJSONParser, NDJSONParser, MessagePackParser]
+    # permission_classes = [IsAdminUser]
+
+    def post(self, request, format=None):
+        records = request.data
+        if not isinstance(records, list):
+            return Response({'error_message': 'a list of raw data records expected'}, status=status.HTTP_400_BAD_REQUEST)
+        raw_data = []
+        errors = []
+        for index, record in enumerate(records):
+            _errors = validate_raw_data(record)
+            if _errors:
+                errors.append({'index': index, 'errors': _errors})
+                continue
+            raw_data.append(RawData(url=record['url'],
+                                domain=record['domain'],
+                                http_status=record.get('http_status'),
+                                data=record.get('data'),
+                                meta_data=record.get('meta_data'),
+                                job_id=record.get('job_id')))
+            raw_data[-1].extract_keys()
+        if len(raw_data) > 0:
+            with transaction.atomic():
+                RawData.objects.bulk_create(raw_data, batch_size=settings.RESOURCES_RAW_DATA_BULK_CREATE_BATCH_SIZE)
+                _ids = [r.pk for r in raw_data]
+                transaction.on_commit(lambda: item_price_build_worker.submit(_ids))
+        response_code = status.HTTP_201_CREATED
+        if len(errors) > 0:
+            response_code = status.HTTP_207_MULTI_STATUS if len(raw_data) > 0 else status.HTTP_400_BAD_REQUEST
+        return Response({'created': len(raw_data), 'errors': errors}, status=response_code)
+
+
 class ItemPricesBuild(APIView):
+    """ finalize item prices of a job. most of them are built while the job
+        is ingested (pwweb.resources.workers) - build what is left: raw data
+        failed to build, and walmart.ca/canadiantire.ca groups never completed
+    """
     # permission_classes = [IsAdminUser]
 
     def post(self, request, format=None):
@@ -42,64 +102,53 @@ class ItemPricesBuild(APIView):
         return Response(response_data, status=response_code)
 
     def _build_item_price(self, job_id):
-        success = True
-        error_messages = []
-        for _raw in RawData.objects.filter(job_id=job_id, domain__in=['amazon.com', 'amazon.ca', 'walmart.com',], http_status__lt=400):
-            try:
-                BuildItemPrice(_raw)
-            except Exception as e:
-                success = False
-                error_messages.append('[{}] {}'.format(_raw.url, str(e)))
-        return (success, error_messages)
+        error_messages = build_item_prices(RawData.objects.filter(job_id=job_id, domain__in=['amazon.com', 'amazon.ca', 'walmart.com',], http_status__lt=400, item_price_built_at__isnull=True).values_list('pk', flat=True))
+        return (len(error_messages) < 1, error_messages)
 
     def _build_walmart_ca_item_price(self, job_id):
-        success = True
-        error_messages = []
-        _q = RawData.objects.filter(job_id=job_id, domain='walmart.ca', http_status__lt=400)
-        # get base raw
-        for _base_raw in _q.filter(url__regex=settings.WALMART_CA_ITEM_LINK_PATTERN):
-            _parent_sku = utils.extract_sku_from_url(url=_base_raw.url, domain='walmart.ca')
-            # get price_raw
-            for link_format in settings.WALMART_CA_API_ITEM_PRICE_LINK_FORMATS:
-                try:
-                    _price_raw = _q.get(url=link_format.format(_parent_sku))
-                except RawData.DoesNotExist:
-                    continue
-                else:
-                    break
-            # get stores_raw
-            _stores_raw = {}
-            for _s_raw in _q.filter(url__startswith=settings.WALMART_CA_API_ITEM_FIND_IN_STORE_LINK,
-                                        url__endswith='#{}'.format(_parent_sku)):
-                _upc = utils.extract_upc_from_walmart_ca_url(_s_raw.url)
-                _stores_raw[_upc] = _s_raw
-            try:
-                BuildWalmartCaItemPrice(raw_data=_base_raw, price_raw_data=_price_raw, stores_raw_data=_stores_raw)
-            except Exception as e:
-                success = False
-                error_messages.append('[{}] {}'.format(_base_raw.url, str(e)))
-        return (success, error_messages)
+        return self._build_product_groups(job_id, 'walmart.ca', build_walmart_ca_item_price)
 
     def _build_canadiantire_ca_item_price(self, job_id):
+        return self._build_product_groups(job_id, 'canadiantire.ca', build_canadiantire_ca_item_price)
+
+    def _build_product_groups(self, job_id, domain, build):
+        """ one query for the whole job, joined by parent sku in memory
+        """
         success = True
         error_messages = []
-        _q = RawData.objects.filter(job_id=job_id, domain='canadiantire.ca', http_status__lt=400)
-        # get base raw
-        for _base_raw in _q.filter(url__regex=settings.CANADIANTIRE_CA_ITEM_LINK_PATTERN):
-            _sku = utils.extract_sku_from_url(url=_base_raw.url, domain='canadiantire.ca')
-            _parent_sku = _base_raw.data.get('SkuSelectors', {}).get('pCode', '{}P'.format(_sku))
-            # get store_raw
-            _store_raw = _q.get(url__startswith=settings.CANADIANTIRE_CA_API_STORES_LINK, url__iendswith='#{}'.format(_parent_sku))
-            # get price_raw
-            _price_raw = _q.get(url__startswith=settings.CANADIANTIRE_CA_API_ITEM_PRICE_LINK, url__iendswith='#{}'.format(_parent_sku))
-            try:
-                BuildCanadiantireCaItemPrice(raw_data=_base_raw, store_raw_data=_store_raw, price_raw_data=_price_raw)
-            except Exception as e:
-                success = False
-                error_messages.append('[{}] {}'.format(_base_raw.url, str(e)))
+        for _parent_sku, _group in group_raw_data(RawData.objects.filter(job_id=job_id, domain=domain)).items():
+            for _base_raw in _group:
+                if _base_raw.kind != settings.RESOURCES_RAW_DATA_KIND_ITEM_PAGE or _base_raw.item_price_built_at is not None:
+                    continue
+                if _base_raw.http_status is not None and _base_raw.http_status >= 400:
+                    continue
+                try:
+                    build(_base_raw, group_raw_data=_group)
+                except Exception as e:
+                    success = False
+                    error_messages.append('[{}] {}'.format(_base_raw.url, str(e)))
         return (success, error_messages)
 
 
+class VariationFamilies(APIView):
+    """ known variation families of skus - seed of pwbot.variations.VariationFamilyRegistry.
+        {'domain': 'amazon.ca', 'skus': [...]} -> {'families': {parent_sku: [skus]}}
+        of every family one of the skus is in
+    """
+    # permission_classes = [IsAdminUser]
+
+    def post(self, request, format=None):
+        domain = request.data.get('domain')
+        skus = request.data.get('skus')
+        if not domain or not isinstance(skus, list):
+            return Response({'error_message': 'domain and a list of skus expected'}, status=status.HTTP_400_BAD_REQUEST)
+        families = {}
+        _parent_skus = Item.objects.filter(domain=domain, sku__in=skus, parent_sku__isnull=False).values('parent_sku')
+        for _parent_sku, _sku in Item.objects.filter(domain=domain, parent_sku__in=_parent_skus).values_list('parent_sku', 'sku'):
+            families.setdefault(_parent_sku, []).append(_sku)
+        return Response({'families': families}, status=status.HTTP_200_OK)
+
+
 # class AmazonParentListingList(CreateModelMixin, UpdateModelMixin, generics.ListAPIView):
 #     queryset = AmazonParentListing.objects.all()
 #     serializer_class = AmazonParentListingSerializer
@@ -0,0 +1,49 @@
+""" pwweb.resources.workers
+
+    build item prices in the background while a job is still being ingested,
+    so ItemPricesBuild (build_item_prices/) only has to finalize the job.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connection
+from pwweb import settings
+from pwweb.resources.modelBuilders import build_item_prices_of_raw_data
+
+
+class ItemPriceBuildWorker:
+    """ builds item prices of ingested raw data on a thread pool of
+        RESOURCES_ITEM_PRICE_BUILD_WORKERS threads (0: build in the calling thread).
+        submit() from transaction.on_commit() so the workers see the rows.
+    """
+
+    def __init__(self, max_workers=1):
+        self.logger = logging.getLogger('pwweb.resources.workers.ItemPriceBuildWorker')
+        self._max_workers = max_workers
+        self._executor = None
+
+    def submit(self, raw_data_ids):
+        if len(raw_data_ids) < 1:
+            return
+        if self._max_workers < 1:
+            self._build(raw_data_ids)
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='item_price_build')
+        self._executor.submit(self._run, list(raw_data_ids))
+
+    def _run(self, raw_data_ids):
+        try:
+            self._build(raw_data_ids)
+        except Exception as e:
+            self.logger.exception('failed to build item prices - {}'.format(str(e)))
+        finally:
+            # worker threads own their db connection
+            connection.close()
+
+    def _build(self, raw_data_ids):
+        for error_message in build_item_prices_of_raw_data(raw_data_ids):
+            # not fatal - ItemPricesBuild retries on job finalize
+            self.logger.warning(error_message)
+
+
+item_price_build_worker = ItemPriceBuildWorker(max_workers=settings.RESOURCES_ITEM_PRICE_BUILD_WORKERS)
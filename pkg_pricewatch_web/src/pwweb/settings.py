@@ -44,6 +44,25 @@ RESOURCES_LISTING_ITEM_STATUS_STR_SET = {
     RESOURCES_LISTING_ITEM_STATUS_PARSING_FAILED_UNKNOWN_ERROR: 'Parsing failed',
 }
 
+# RawData.kind - which request of a product group a raw data is
+RESOURCES_RAW_DATA_KIND_ITEM_PAGE = 1
+RESOURCES_RAW_DATA_KIND_PRICE_API = 2
+RESOURCES_RAW_DATA_KIND_STORE_API = 3
+
+# max rows per INSERT statement on bulk raw data ingest
+RESOURCES_RAW_DATA_BULK_CREATE_BATCH_SIZE = 500
+
+# threads building item prices while raw data is ingested (pwweb.resources.workers)
+# 0: build in the request thread
+RESOURCES_ITEM_PRICE_BUILD_WORKERS = 2
+
+# max rows per INSERT statement on building item prices (pwweb.resources.modelBuilders.save_item_prices)
+RESOURCES_ITEM_PRICE_BULK_CREATE_BATCH_SIZE = 500
+
+# monthly partitions of resrc_raw_data (manage.py raw_data_partitions)
+RESOURCES_RAW_DATA_PARTITIONS_AHEAD = 3 # months of partitions created ahead of time
+RESOURCES_RAW_DATA_RETENTION_MONTHS = 6 # partitions older than this are dropped. 0: keep forever
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -50,4 +50,42 @@ def extract_sku_from_url(url, domain):
 
 def extract_upc_from_walmart_ca_url(url):
     upc_list = urllib.parse.parse_qs(urllib.parse.urlparse(url).query).get('upc', [])
-    return upc_list[0] if len(upc_list) > 0 else None
\ No newline at end of file
+    return upc_list[0] if len(upc_list) > 0 else None
+
+def extract_raw_data_keys(url, domain, data=None):
+    """ returns (kind, parent_sku) of a raw data - the keys product groups are assembled by.
+        kind: settings.RESOURCES_RAW_DATA_KIND_*, or None if unknown
+        parent_sku: sku shared by every request of a product group, or None
+    """
+    kind = None
+    parent_sku = None
+    data = data if isinstance(data, dict) else {}
+    if domain in ['amazon.com', 'amazon.ca',]:
+        kind = settings.RESOURCES_RAW_DATA_KIND_ITEM_PAGE
+        parent_sku = data.get('parent_asin')
+    elif domain in ['walmart.com',]:
+        kind = settings.RESOURCES_RAW_DATA_KIND_ITEM_PAGE
+        parent_sku = data.get('item', {}).get('product', {}).get('buyBox', {}).get('primaryUsItemId')
+    elif domain in ['walmart.ca',]:
+        if is_valid_walmart_ca_item_url(url):
+            kind = settings.RESOURCES_RAW_DATA_KIND_ITEM_PAGE
+            parent_sku = extract_sku_from_url(url=url, domain=domain)
+        elif any(url.startswith(link_format.split('#')[0]) for link_format in settings.WALMART_CA_API_ITEM_PRICE_LINK_FORMATS):
+            kind = settings.RESOURCES_RAW_DATA_KIND_PRICE_API
+        elif url.startswith(settings.WALMART_CA_API_ITEM_FIND_IN_STORE_LINK):
+            kind = settings.RESOURCES_RAW_DATA_KIND_STORE_API
+        if kind in [settings.RESOURCES_RAW_DATA_KIND_PRICE_API, settings.RESOURCES_RAW_DATA_KIND_STORE_API,] and '#' in url:
+            parent_sku = url.rsplit('#', 1)[1]
+    elif domain in ['canadiantire.ca',]:
+        if is_valid_canadiantire_ca_item_url(url):
+            kind = settings.RESOURCES_RAW_DATA_KIND_ITEM_PAGE
+            parent_sku = data.get('SkuSelectors', {}).get('pCode', '{}P'.format(extract_sku_from_url(url=url, domain=domain)))
+        elif url.startswith(settings.CANADIANTIRE_CA_API_ITEM_PRICE_LINK):
+            kind = settings.RESOURCES_RAW_DATA_KIND_PRICE_API
+        elif url.startswith(settings.CANADIANTIRE_CA_API_STORES_LINK):
+            kind = settings.RESOURCES_RAW_DATA_KIND_STORE_API
+        if kind in [settings.RESOURCES_RAW_DATA_KIND_PRICE_API, settings.RESOURCES_RAW_DATA_KIND_STORE_API,] and '#' in url:
+            parent_sku = url.rsplit('#', 1)[1]
+        # matched case insensitive so far (url__iendswith)
+        parent_sku = parent_sku.upper() if parent_sku else parent_sku
+    return (kind, str(parent_sku)[:32] if parent_sku else None)